@@ -0,0 +1,32 @@
+"""
+Runs the real FastAPI app with OfflineProvider instead of Gemini.
+Started as a subprocess by load.py so its CPU/memory can be measured on their own:
+
+    python -m backend.benchmarks.bench_server --port 8765
+"""
+import argparse
+
+import uvicorn
+
+from backend.main import create_app
+from backend.providers import OfflineProvider
+from backend.ws_deflate import uvicorn_ws_options
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--gen-latency", type=float, default=0.0, help="fake time to first question (s)")
+    parser.add_argument("--gen-per-question", type=float, default=0.0, help="fake gap between questions (s)")
+    args = parser.parse_args()
+
+    provider = OfflineProvider(latency=args.gen_latency, per_question=args.gen_per_question)
+    # In-memory bank: every run starts cold and leaves nothing behind
+    app = create_app(question_provider=provider, bank_db_path=":memory:")
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", **uvicorn_ws_options())
+
+
+if __name__ == "__main__":
+    main()
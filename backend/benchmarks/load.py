@@ -0,0 +1,318 @@
+"""
+Load / latency benchmark for the QuizPortal backend.
+
+Starts bench_server (the real app + OfflineProvider) in a subprocess, then drives
+simulated WebSocket players through full games at each scale point:
+join -> START_GAME -> SUBMIT_ANSWER (all players) -> NEXT_QUESTION -> ...
+
+    python -m backend.benchmarks.load --rooms 1 10 50 --players 4 20 --rounds 3 --out bench.json
+
+Broadcast latency is measured from the moment the triggering action is sent
+(last SUBMIT_ANSWER -> ROUND_REVEAL, NEXT_QUESTION -> NEW_QUESTION) to the moment
+each player receives the resulting message. Results are written as JSON so runs
+can be diffed between releases. --spectators adds read-only viewers to every room,
+to check that they don't move the players' latency. --codec msgpack makes every
+client negotiate the binary protocol, for comparing bytes and server CPU per round.
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import platform
+import subprocess
+import urllib.request
+from typing import Dict, List, Optional
+
+import websockets
+
+from backend.codec import JSON, MSGPACK, MSGPACK_SUBPROTOCOL
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# --- Server process stats (Linux /proc; zeros elsewhere) ---
+def process_cpu_seconds(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        ticks = os.sysconf("SC_CLK_TCK")
+        return (int(fields[11]) + int(fields[12])) / ticks  # utime + stime
+    except (OSError, IndexError, ValueError):
+        return 0.0
+
+
+def process_memory_mb(pid: int) -> Dict[str, float]:
+    stats = {"rss_mb": 0.0, "peak_rss_mb": 0.0}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    stats["rss_mb"] = int(line.split()[1]) / 1024
+                elif line.startswith("VmHWM:"):
+                    stats["peak_rss_mb"] = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return stats
+
+
+class BenchServer:
+    def __init__(self, gen_latency: float, gen_per_question: float, tick_ms: Optional[float]):
+        self.port = free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}"
+        env = dict(os.environ)
+        # Benchmarks create lots of rooms; don't let the room cap or the reaper interfere
+        env.setdefault("MAX_ROOMS", "1000000")
+        env.setdefault("MAX_SPECTATORS", "1000000")
+        if tick_ms is not None:
+            env["PLAYER_UPDATE_TICK_MS"] = str(tick_ms)
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "backend.benchmarks.bench_server", "--port", str(self.port),
+             "--gen-latency", str(gen_latency), "--gen-per-question", str(gen_per_question)],
+            env=env,
+        )
+
+    def wait_ready(self, timeout: float = 30.0):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                urllib.request.urlopen(self.base_url + "/", timeout=1).read()
+                return
+            except OSError:
+                if self.proc.poll() is not None:
+                    raise RuntimeError("bench server exited during startup")
+                time.sleep(0.1)
+        raise RuntimeError("bench server did not start")
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+class Player:
+    def __init__(self, name: str, codec=JSON):
+        self.name = name
+        self.codec = codec
+        self.ws = None
+        self.messages = 0
+        self.bytes = 0
+        self.inbox: Dict[str, asyncio.Queue] = {}
+
+    def queue(self, msg_type: str) -> asyncio.Queue:
+        if msg_type not in self.inbox:
+            self.inbox[msg_type] = asyncio.Queue()
+        return self.inbox[msg_type]
+
+    async def reader(self):
+        try:
+            async for raw in self.ws:
+                received_at = time.perf_counter()
+                self.messages += 1
+                self.bytes += len(raw)
+                data = self.codec.decode(raw)
+                self.queue(data.get("type", "")).put_nowait((received_at, data))
+        except websockets.ConnectionClosed:
+            pass
+
+    async def send(self, action: str, payload: Optional[dict] = None) -> float:
+        sent_at = time.perf_counter()
+        await self.ws.send(json.dumps({"action": action, "payload": payload or {}}))
+        return sent_at
+
+    async def expect(self, msg_type: str, timeout: float) -> tuple:
+        return await asyncio.wait_for(self.queue(msg_type).get(), timeout)
+
+
+async def spectate(url: str, stats: Dict[str, int]):
+    try:
+        async with websockets.connect(url, max_queue=None) as ws:
+            async for raw in ws:
+                stats["frames"] += 1
+                stats["bytes"] += len(raw)
+    except (websockets.ConnectionClosed, OSError):
+        pass
+
+
+async def create_room(base_url: str) -> str:
+    def post():
+        req = urllib.request.Request(base_url + "/create-room", method="POST")
+        return json.loads(urllib.request.urlopen(req, timeout=30).read())["room_code"]
+    return await asyncio.to_thread(post)
+
+
+async def run_room(base_url: str, room_index: int, players: int, rounds: int, jitter: float,
+                   topic_mode: str, latencies: List[float], timeout: float,
+                   spectators: int = 0, spectator_stats: Optional[Dict[str, int]] = None, codec=JSON):
+    ws_base = base_url.replace("http", "ws", 1)
+    code = await create_room(base_url)
+    viewers = [asyncio.create_task(spectate(f"{ws_base}/spectate/{code}", spectator_stats))
+               for _ in range(spectators)]
+    clients = [Player(f"p{room_index}_{i}", codec) for i in range(players)]
+    subprotocols = [MSGPACK_SUBPROTOCOL] if codec is MSGPACK else None
+    readers = []
+    for client in clients:
+        client.ws = await websockets.connect(f"{ws_base}/ws/{code}/{client.name}", max_queue=None,
+                                             subprotocols=subprotocols)
+        readers.append(asyncio.create_task(client.reader()))
+    host = clients[0]
+
+    topic = f"bench topic {room_index}" if topic_mode == "unique" else "bench topic"
+    await host.send("START_GAME", {"topic": topic, "mode": "topic"})
+    for c in clients:
+        await c.expect("NEW_QUESTION", timeout)
+
+    for round_no in range(rounds):
+        async def answer(c: Player) -> float:
+            if jitter:
+                await asyncio.sleep(random.uniform(0, jitter))
+            return await c.send("SUBMIT_ANSWER", {"index": random.randrange(4)})
+
+        sent = await asyncio.gather(*[answer(c) for c in clients])
+        last_answer_at = max(sent)
+        for c in clients:
+            received_at, _ = await c.expect("ROUND_REVEAL", timeout)
+            latencies.append(received_at - last_answer_at)
+
+        next_at = await host.send("NEXT_QUESTION")
+        if round_no < rounds - 1:
+            for c in clients:
+                received_at, _ = await c.expect("NEW_QUESTION", timeout)
+                latencies.append(received_at - next_at)
+
+    for c in clients:
+        await c.ws.close()
+    for r in readers:
+        await r
+    for v in viewers:
+        v.cancel()
+    await asyncio.gather(*viewers, return_exceptions=True)
+    return sum(c.messages for c in clients), sum(c.bytes for c in clients)
+
+
+async def run_scale_point(server: BenchServer, rooms: int, players: int, rounds: int,
+                          jitter: float, topic_mode: str, timeout: float, spectators: int = 0,
+                          codec=JSON) -> dict:
+    latencies: List[float] = []
+    spectator_stats = {"frames": 0, "bytes": 0}
+    cpu_before = process_cpu_seconds(server.proc.pid)
+    started = time.perf_counter()
+    results = await asyncio.gather(*[
+        run_room(server.base_url, i, players, rounds, jitter, topic_mode, latencies, timeout,
+                 spectators, spectator_stats, codec)
+        for i in range(rooms)
+    ])
+    duration = time.perf_counter() - started
+    messages = sum(m for m, _ in results)
+    total_bytes = sum(b for _, b in results)
+    return {
+        "rooms": rooms,
+        "players_per_room": players,
+        "clients": rooms * players,
+        "spectators_per_room": spectators,
+        "spectator_frames": spectator_stats["frames"],
+        "spectator_bytes": spectator_stats["bytes"],
+        "rounds": rounds,
+        "duration_s": round(duration, 4),
+        "messages": messages,
+        "bytes": total_bytes,
+        "bytes_per_client_round": round(total_bytes / (rooms * players * rounds), 1),
+        "messages_per_sec": round(messages / duration, 1) if duration else 0.0,
+        "broadcast_latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(max(latencies, default=0.0) * 1000, 3),
+            "samples": len(latencies),
+        },
+        "server_cpu_s": round(process_cpu_seconds(server.proc.pid) - cpu_before, 3),
+        **{f"server_{k}": round(v, 1) for k, v in process_memory_mb(server.proc.pid).items()},
+    }
+
+
+async def run_benchmark(args) -> dict:
+    codec = MSGPACK if args.codec == "msgpack" else JSON
+    server = BenchServer(args.gen_latency, args.gen_per_question, args.tick_ms)
+    try:
+        await asyncio.to_thread(server.wait_ready)
+        points = []
+        for rooms in args.rooms:
+            for players in args.players:
+                point = await run_scale_point(server, rooms, players, args.rounds, args.jitter,
+                                              args.topic_mode, args.timeout, args.spectators, codec)
+                lat = point["broadcast_latency_ms"]
+                print(f"rooms={rooms:<5} players={players:<5} msgs/s={point['messages_per_sec']:<10} "
+                      f"p50={lat['p50']}ms p99={lat['p99']}ms cpu={point['server_cpu_s']}s "
+                      f"bytes/client/round={point['bytes_per_client_round']} "
+                      f"rss={point['server_rss_mb']}MB")
+                points.append(point)
+    finally:
+        server.stop()
+
+    return {
+        "benchmark": "quizportal-load",
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "rounds": args.rounds,
+            "jitter_s": args.jitter,
+            "topic_mode": args.topic_mode,
+            "gen_latency_s": args.gen_latency,
+            "gen_per_question_s": args.gen_per_question,
+            "tick_ms": args.tick_ms,
+            "spectators_per_room": args.spectators,
+            "codec": args.codec,
+        },
+        "results": points,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rooms", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--players", type=int, nargs="+", default=[4, 20])
+    parser.add_argument("--rounds", type=int, default=3, help="rounds per game (max 10)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="max random delay before each answer (s)")
+    parser.add_argument("--topic-mode", choices=["unique", "shared"], default="unique",
+                        help="unique = every room misses the question bank, shared = all but the first hit")
+    parser.add_argument("--gen-latency", type=float, default=0.0)
+    parser.add_argument("--gen-per-question", type=float, default=0.0)
+    parser.add_argument("--tick-ms", type=float, default=None, help="override PLAYER_UPDATE_TICK_MS")
+    parser.add_argument("--spectators", type=int, default=0, help="read-only viewers per room")
+    parser.add_argument("--codec", choices=["json", "msgpack"], default="json",
+                        help="wire protocol the simulated clients negotiate")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-message timeout (s)")
+    parser.add_argument("--out", default=None, help="write JSON results here")
+    args = parser.parse_args()
+    args.rounds = max(1, min(args.rounds, 10))
+    if args.codec == "msgpack" and MSGPACK is None:
+        parser.error("--codec msgpack needs the msgpack package")
+
+    report = asyncio.run(run_benchmark(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.out}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Cold-start benchmark: how fast a fresh worker can take its first player.
+
+Measures, each over a few fresh processes:
+* import: `import backend.main` in a clean interpreter, and whether the Gemini SDK
+  got pulled in (it shouldn't: it's loaded lazily / warmed in the background)
+* first socket: from spawning `uvicorn --factory backend.main:create_app` to the
+  first HTTP answer and to the first WebSocket accepted (PLAYER_UPDATE received)
+
+    python -m backend.benchmarks.startup --runs 5 --out startup.json
+
+With --import-budget / --socket-budget it exits non-zero when the median goes
+over, so a release that makes workers slow to start fails in CI.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import urllib.request
+from typing import Dict, List, Optional
+
+import websockets
+
+from backend.benchmarks.load import free_port
+
+IMPORT_PROBE = (
+    "import time, sys, json\n"
+    "started = time.perf_counter()\n"
+    "import backend.main\n"
+    "print(json.dumps({'seconds': time.perf_counter() - started,\n"
+    "                  'genai_loaded': 'google.generativeai' in sys.modules}))\n"
+)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    return {"median": statistics.median(samples), "min": min(samples), "max": max(samples)}
+
+
+def measure_import(env: dict) -> dict:
+    out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], env=env, capture_output=True,
+                         text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+async def wait_for_first_socket(base_url: str, proc: subprocess.Popen, started: float,
+                                timeout: float) -> Dict[str, float]:
+    deadline = started + timeout
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        if time.perf_counter() > deadline:
+            raise RuntimeError("server did not start")
+        try:
+            request = urllib.request.Request(base_url + "/create-room", method="POST")
+            room_code = json.loads(urllib.request.urlopen(request, timeout=1).read())["room_code"]
+            break
+        except OSError:
+            await asyncio.sleep(0.01)
+    http_ready = time.perf_counter() - started
+
+    ws_url = base_url.replace("http", "ws", 1) + f"/ws/{room_code}/probe"
+    async with websockets.connect(ws_url) as ws:
+        await asyncio.wait_for(ws.recv(), timeout)
+    return {"http_ready": http_ready, "first_socket": time.perf_counter() - started}
+
+
+def measure_first_socket(env: dict, timeout: float) -> Dict[str, float]:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:create_app", "--factory",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        return asyncio.run(wait_for_first_socket(f"http://127.0.0.1:{port}", proc, started, timeout))
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def run_benchmark(runs: int, timeout: float) -> dict:
+    with tempfile.TemporaryDirectory(prefix="quizportal-startup-") as tmp:
+        # Fresh bank file per run, and no journal: measure a clean worker, leave nothing behind
+        env = dict(os.environ, QUESTION_BANK_PATH=os.path.join(tmp, "bank.sqlite3"), JOURNAL_DIR="")
+        imports = [measure_import(env) for _ in range(runs)]
+        sockets = [measure_first_socket(env, timeout) for _ in range(runs)]
+    return {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "runs": runs},
+        "import_seconds": summarize([r["seconds"] for r in imports]),
+        "genai_loaded_at_import": any(r["genai_loaded"] for r in imports),
+        "http_ready_seconds": summarize([r["http_ready"] for r in sockets]),
+        "first_socket_seconds": summarize([r["first_socket"] for r in sockets]),
+    }
+
+
+def over_budget(report: dict, import_budget: Optional[float], socket_budget: Optional[float]) -> List[str]:
+    problems = []
+    if import_budget is not None and report["import_seconds"]["median"] > import_budget:
+        problems.append(f"import took {report['import_seconds']['median']:.3f}s (budget {import_budget}s)")
+    if socket_budget is not None and report["first_socket_seconds"]["median"] > socket_budget:
+        problems.append(f"first socket took {report['first_socket_seconds']['median']:.3f}s "
+                        f"(budget {socket_budget}s)")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement")
+    parser.add_argument("--timeout", type=float, default=30.0, help="max seconds for one server to start")
+    parser.add_argument("--import-budget", type=float, default=None, help="max median import time (s)")
+    parser.add_argument("--socket-budget", type=float, default=None, help="max median time to first socket (s)")
+    parser.add_argument("--out", default=None, help="write JSON results here")
+    args = parser.parse_args()
+
+    report = run_benchmark(max(1, args.runs), args.timeout)
+    problems = over_budget(report, args.import_budget, args.socket_budget)
+    report["over_budget"] = problems
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.out}")
+    else:
+        print(text)
+    if problems:
+        sys.exit("Over the cold-start budget: " + "; ".join(problems))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,368 @@
+"""
+Multi-worker mode: rooms are sharded across worker processes by room code.
+
+Every worker serves HTTP/WebSocket on the same port (SO_REUSEPORT lets the kernel
+spread connections). A socket that lands on a worker that doesn't own its room is
+tunnelled over the bus to the owner, which runs the normal session against a
+RemoteWebSocket. Start a cluster with:
+
+    python -m backend.cluster --workers 4 --port 8000
+"""
+import os
+import sys
+import json
+import base64
+import socket
+import asyncio
+import argparse
+import itertools
+import subprocess
+import tempfile
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .cluster_bus import Bus, UnixSocketBus
+from .codec import negotiate_socket
+from .connection_manager import SEND_QUEUE_SIZE
+from .room_store import shard_of
+
+# --- Worker Settings (set by the launcher) ---
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", "1"))
+CLUSTER_BUS_DIR = os.getenv("CLUSTER_BUS_DIR", "")
+# How long an edge worker waits for the owner to answer a tunnelled socket
+TUNNEL_OPEN_TIMEOUT = float(os.getenv("CLUSTER_TUNNEL_OPEN_TIMEOUT", "5"))
+CALL_TIMEOUT = float(os.getenv("CLUSTER_CALL_TIMEOUT", "5"))
+
+Session = Callable[[Any, str, str], Awaitable[None]]
+
+
+class RemoteDisconnect(Exception):
+    """The edge worker's client went away (our WebSocketDisconnect)"""
+
+
+class RemoteWebSocket:
+    """
+    Owner-side stand-in for a socket accepted by another worker.
+    Has the bits of Starlette's WebSocket that the session and ConnectionManager use.
+    """
+
+    def __init__(self, node: "ClusterNode", conn: str, edge: int, subprotocol: Optional[str] = None):
+        self.node = node
+        self.conn = conn
+        self.edge = edge
+        # The edge already negotiated with the client; the owner picks the same codec from this
+        self.scope = {"type": "websocket", "subprotocols": [subprotocol] if subprotocol else []}
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.closed = False
+
+    async def accept(self, subprotocol: Optional[str] = None):
+        pass  # the edge worker already accepted it
+
+    async def send_text(self, text: str):
+        if self.closed:
+            raise RemoteDisconnect(self.conn)
+        self.node.bus.send(self.edge, {"op": "out", "conn": self.conn, "frame": text})
+
+    async def send_bytes(self, data: bytes):
+        if self.closed:
+            raise RemoteDisconnect(self.conn)
+        # The bus speaks JSON lines, so binary frames travel as base64
+        self.node.bus.send(self.edge, {"op": "out", "conn": self.conn, "bin": base64.b64encode(data).decode()})
+
+    async def send_json(self, data: dict):
+        await self.send_text(json.dumps(data))
+
+    async def receive_text(self) -> str:
+        text = await self.inbox.get()
+        if text is None:
+            raise RemoteDisconnect(self.conn)
+        return text
+
+    async def receive_json(self) -> Any:
+        return json.loads(await self.receive_text())
+
+    async def close(self, code: int = 1000):
+        if not self.closed:
+            self.node.bus.send(self.edge, {"op": "close", "conn": self.conn, "code": code})
+        self.hang_up()
+
+    def hang_up(self):
+        if not self.closed:
+            self.closed = True
+            self.inbox.put_nowait(None)
+
+
+class _EdgeTunnel:
+    """Edge-side end of a tunnel: owner -> client frames go through a bounded queue"""
+
+    def __init__(self, websocket, owner: int, max_queue: int):
+        self.websocket = websocket
+        self.owner = owner
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.heard = asyncio.Event()
+        self.finished = False  # the owner already knows this tunnel is gone
+
+    def deliver(self, item) -> bool:
+        self.heard.set()
+        try:
+            self.outbox.put_nowait(item)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    async def writer(self):
+        while True:
+            kind, value = await self.outbox.get()
+            if kind == "frame":
+                await self.websocket.send_text(value)
+            elif kind == "bytes":
+                await self.websocket.send_bytes(value)
+            else:
+                self.finished = True
+                await self.websocket.close(code=value)
+                return
+
+
+class ClusterNode:
+    """This worker's view of the cluster: who owns which room, tunnels and small RPCs"""
+
+    def __init__(self, index: int = 0, count: int = 1, bus: Optional[Bus] = None,
+                 tunnel_queue: int = SEND_QUEUE_SIZE):
+        self.index = index
+        self.count = count
+        self.bus = bus
+        self.tunnel_queue = tunnel_queue
+        self.session: Optional[Session] = None
+        self._ids = itertools.count()
+        self._edges: Dict[str, _EdgeTunnel] = {}
+        self._remotes: Dict[str, RemoteWebSocket] = {}
+        self._handlers: Dict[str, Callable[..., Any]] = {}
+        self._listeners: Dict[str, Callable[[dict], None]] = {}
+        self._calls: Dict[str, asyncio.Future] = {}
+        self._tasks = set()
+
+    @classmethod
+    def from_env(cls) -> "ClusterNode":
+        bus = None
+        if WORKER_COUNT > 1:
+            bus = UnixSocketBus(CLUSTER_BUS_DIR or tempfile.gettempdir(), WORKER_INDEX, WORKER_COUNT)
+        return cls(WORKER_INDEX, WORKER_COUNT, bus)
+
+    @property
+    def enabled(self) -> bool:
+        return self.bus is not None and self.count > 1
+
+    def owner_of(self, room_code: str) -> int:
+        owner = shard_of(room_code, self.count)
+        return self.index if owner is None else owner
+
+    def is_local(self, room_code: str) -> bool:
+        return not self.enabled or self.owner_of(room_code) == self.index
+
+    async def start(self, session: Session):
+        self.session = session
+        if self.enabled:
+            await self.bus.start(self._on_message)
+            print(f"DEBUG: Worker {self.index}/{self.count} joined the cluster bus")
+
+    async def stop(self):
+        for remote in list(self._remotes.values()):
+            remote.hang_up()
+        if self.bus is not None:
+            await self.bus.close()
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # --- RPC (small request/response calls, e.g. /check-room on another worker) ---
+    def register(self, name: str, handler: Callable[..., Any]):
+        self._handlers[name] = handler
+
+    async def call(self, worker: int, name: str, **kwargs) -> Any:
+        if worker == self.index or not self.enabled:
+            return self._handlers[name](**kwargs)
+        call_id = f"{self.index}:{next(self._ids)}"
+        future = asyncio.get_running_loop().create_future()
+        self._calls[call_id] = future
+        self.bus.send(worker, {"op": "call", "id": call_id, "name": name, "args": kwargs, "from": self.index})
+        try:
+            return await asyncio.wait_for(future, CALL_TIMEOUT)
+        finally:
+            self._calls.pop(call_id, None)
+
+    # --- One-way messages for other components (e.g. spectator frames) ---
+    def listen(self, op: str, handler: Callable[[dict], None]):
+        """Bus messages with this op go to `handler` (called synchronously, like the bus handler)"""
+        self._listeners[op] = handler
+
+    def send(self, worker: int, data: dict):
+        self.bus.send(worker, data)
+
+    # --- Edge side: a client socket for a room another worker owns ---
+    async def proxy(self, websocket, room_code: str, player_name: str):
+        owner = self.owner_of(room_code)
+        # Negotiated here, where the real handshake happens; every worker has the same codecs
+        _, subprotocol = negotiate_socket(websocket)
+        if subprotocol:
+            await websocket.accept(subprotocol=subprotocol)
+        else:
+            await websocket.accept()
+        conn = f"{self.index}:{next(self._ids)}"
+        tunnel = _EdgeTunnel(websocket, owner, self.tunnel_queue)
+        self._edges[conn] = tunnel
+        self.bus.send(owner, {"op": "open", "conn": conn, "room": room_code,
+                              "player": player_name, "edge": self.index, "subprotocol": subprotocol})
+        writer = self._spawn(tunnel.writer())
+        watchdog = self._spawn(self._expect_owner(conn, tunnel))
+        try:
+            while not writer.done():
+                text = await websocket.receive_text()
+                self.bus.send(owner, {"op": "in", "conn": conn, "text": text})
+        except Exception:
+            pass  # client disconnect, or the socket was closed by the writer
+        finally:
+            self._edges.pop(conn, None)
+            writer.cancel()
+            watchdog.cancel()
+            if not tunnel.finished:
+                self.bus.send(owner, {"op": "hangup", "conn": conn})
+
+    async def _expect_owner(self, conn: str, tunnel: _EdgeTunnel):
+        try:
+            await asyncio.wait_for(tunnel.heard.wait(), TUNNEL_OPEN_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"ERROR: Owner of tunnel {conn} never answered, closing it")
+            if self._edges.pop(conn, None) is not None:
+                await tunnel.websocket.close(code=1011)
+
+    # --- Bus dispatch ---
+    def _on_message(self, data: dict):
+        op = data.get("op")
+        conn = data.get("conn")
+        if op == "out" or op == "close":
+            tunnel = self._edges.get(conn)
+            if tunnel is None:
+                return
+            if op == "close":
+                item = ("close", data.get("code", 1000))
+            elif "bin" in data:
+                item = ("bytes", base64.b64decode(data["bin"]))
+            else:
+                item = ("frame", data["frame"])
+            if not tunnel.deliver(item):
+                # Same policy as a slow local socket: don't let it buffer without bound
+                print(f"DEBUG: Slow tunnelled client {conn}, disconnecting")
+                self._edges.pop(conn, None)
+                tunnel.finished = True
+                self.bus.send(tunnel.owner, {"op": "hangup", "conn": conn})
+                self._spawn(tunnel.websocket.close(code=1008))
+        elif op == "in":
+            remote = self._remotes.get(conn)
+            if remote is not None and not remote.closed:
+                remote.inbox.put_nowait(data["text"])
+        elif op == "open":
+            remote = RemoteWebSocket(self, conn, data["edge"], data.get("subprotocol"))
+            self._remotes[conn] = remote
+            self._spawn(self._run_remote(remote, data["room"], data["player"]))
+        elif op == "hangup":
+            remote = self._remotes.get(conn)
+            if remote is not None:
+                remote.hang_up()
+        elif op == "call":
+            self._answer_call(data)
+        elif op == "reply":
+            future = self._calls.get(data.get("id"))
+            if future is not None and not future.done():
+                future.set_result(data.get("result"))
+        elif op in self._listeners:
+            self._listeners[op](data)
+
+    async def _run_remote(self, remote: RemoteWebSocket, room_code: str, player_name: str):
+        try:
+            await self.session(remote, room_code, player_name)
+        except Exception as e:
+            print(f"ERROR in tunnelled session {remote.conn}: {e!r}")
+        finally:
+            self._remotes.pop(remote.conn, None)
+            if not remote.closed:
+                await remote.close()
+
+    def _answer_call(self, data: dict):
+        handler = self._handlers.get(data.get("name"))
+        result = handler(**data.get("args", {})) if handler else None
+        self.bus.send(data["from"], {"op": "reply", "id": data["id"], "result": result})
+
+
+# --- Launcher ---
+def reuseport_socket(host: str, port: int) -> socket.socket:
+    """Each worker binds its own listening socket; the kernel balances between them"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(host: str, port: int, app_path: str, factory: bool = False):
+    import importlib
+    import uvicorn
+    from .ws_deflate import uvicorn_ws_options
+
+    module_name, _, attr = app_path.partition(":")
+    app = getattr(importlib.import_module(module_name), attr or "app")
+    if factory:
+        app = app()
+    sock = reuseport_socket(host, port)
+    server = uvicorn.Server(uvicorn.Config(app, log_level="warning", **uvicorn_ws_options()))
+    server.run(sockets=[sock])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--app", default="backend.main:app", help="module:attribute of the ASGI app")
+    parser.add_argument("--factory", action="store_true", help="--app names a function that returns the app")
+    parser.add_argument("--bus-dir", default=None, help="directory for the workers' Unix sockets")
+    parser.add_argument("--worker-index", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_index is not None:
+        run_worker(args.host, args.port, args.app, args.factory)
+        return
+
+    bus_dir = args.bus_dir or tempfile.mkdtemp(prefix="quizportal-bus-")
+    procs = []
+    for index in range(args.workers):
+        env = dict(os.environ, WORKER_INDEX=str(index), WORKER_COUNT=str(args.workers),
+                   CLUSTER_BUS_DIR=bus_dir)
+        procs.append(subprocess.Popen(
+            [sys.executable, "-m", "backend.cluster", "--host", args.host, "--port", str(args.port),
+             "--app", args.app, "--worker-index", str(index)] + (["--factory"] if args.factory else []),
+            env=env,
+        ))
+    print(f"DEBUG: Started {args.workers} workers on {args.host}:{args.port} (bus: {bus_dir})")
+    try:
+        for proc in procs:
+            proc.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in procs:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+
+if __name__ == "__main__":
+    main()
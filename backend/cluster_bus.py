@@ -0,0 +1,210 @@
+import os
+import json
+import asyncio
+from collections import deque
+from typing import Callable, Deque, Dict, Optional
+
+Handler = Callable[[dict], None]
+
+# Longest single bus message (a full roster snapshot for a big room fits easily)
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+# Unsent bytes allowed per peer (socket buffer, or backlog while connecting). Past this the
+# peer is treated as stalled: the link is dropped, and the next send reconnects.
+SEND_BUFFER_LIMIT = 4 * MAX_MESSAGE_BYTES
+CONNECT_RETRIES = 50
+CONNECT_RETRY_DELAY = 0.1
+
+
+class Bus:
+    """
+    Point-to-point + fan-out messaging between worker processes.
+    send() is non-blocking and keeps per-destination order; the handler
+    given to start() is called synchronously for every message addressed to us.
+    """
+
+    index: int = 0
+    count: int = 1
+
+    async def start(self, handler: Handler):
+        raise NotImplementedError
+
+    def send(self, worker: int, data: dict):
+        raise NotImplementedError
+
+    def publish(self, data: dict):
+        """Sends to every other worker"""
+        for worker in range(self.count):
+            if worker != self.index:
+                self.send(worker, data)
+
+    async def close(self):
+        pass
+
+
+class LocalHub:
+    """In-process stand-in for a broker: lets several nodes share one event loop (tests)"""
+
+    def __init__(self, count: int):
+        self.count = count
+        self.handlers: Dict[int, Handler] = {}
+
+    def bus(self, index: int) -> "LocalBus":
+        return LocalBus(self, index)
+
+
+class LocalBus(Bus):
+    def __init__(self, hub: LocalHub, index: int):
+        self.hub = hub
+        self.index = index
+        self.count = hub.count
+
+    async def start(self, handler: Handler):
+        self.hub.handlers[self.index] = handler
+
+    def send(self, worker: int, data: dict):
+        handler = self.hub.handlers.get(worker)
+        if handler is not None:
+            # Round-trip through JSON so tests catch anything that wouldn't survive a real bus
+            asyncio.get_running_loop().call_soon(handler, json.loads(json.dumps(data)))
+
+    async def close(self):
+        self.hub.handlers.pop(self.index, None)
+
+
+class _PeerLink:
+    """Outbound connection to one peer, with a backlog while it's (re)connecting"""
+
+    def __init__(self):
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.pending: Deque[bytes] = deque()
+        self.pending_bytes = 0
+        self.connecting: Optional[asyncio.Task] = None
+
+
+class UnixSocketBus(Bus):
+    """
+    Full mesh of Unix sockets in one directory: worker i listens on worker-i.sock and
+    dials the others lazily. Newline-delimited JSON, one outbound connection per peer,
+    so messages between two workers stay in order. No broker process to bottleneck on.
+    """
+
+    def __init__(self, directory: str, index: int, count: int,
+                 max_message: int = MAX_MESSAGE_BYTES, send_buffer_limit: int = SEND_BUFFER_LIMIT):
+        self.directory = directory
+        self.index = index
+        self.count = count
+        self.max_message = max_message
+        self.send_buffer_limit = send_buffer_limit
+        self._handler: Optional[Handler] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._links: Dict[int, _PeerLink] = {}
+        self._readers = set()
+
+    def path_for(self, worker: int) -> str:
+        return os.path.join(self.directory, f"worker-{worker}.sock")
+
+    async def start(self, handler: Handler):
+        self._handler = handler
+        path = self.path_for(self.index)
+        if os.path.exists(path):
+            os.unlink(path)  # left over from a crashed worker
+        self._server = await asyncio.start_unix_server(self._serve_peer, path, limit=self.max_message)
+
+    async def _serve_peer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._readers.add(task)
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError:
+                    break  # peer closed (a partial last line is never a whole message)
+                except asyncio.LimitOverrunError as e:
+                    # Drop just this message; the link and everything after it stay usable
+                    print(f"ERROR: Worker {self.index} dropped a bus message over {self.max_message} bytes")
+                    await self._skip_line(reader, e.consumed)
+                    continue
+                try:
+                    self._handler(json.loads(line))
+                except Exception as e:
+                    print(f"ERROR handling bus message on worker {self.index}: {e!r}")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._readers.discard(task)
+            writer.close()
+
+    @staticmethod
+    async def _skip_line(reader: asyncio.StreamReader, consumed: int):
+        """Discards the rest of an oversized line without ever buffering all of it"""
+        while True:
+            await reader.readexactly(consumed)
+            try:
+                await reader.readuntil(b"\n")
+                return
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    def send(self, worker: int, data: dict):
+        line = (json.dumps(data, separators=(",", ":")) + "\n").encode()
+        if worker == self.index:
+            asyncio.get_running_loop().call_soon(self._handler, json.loads(line))
+            return
+        if len(line) > self.max_message:
+            # The peer would only skip it; don't waste the link on it
+            print(f"ERROR: Worker {self.index} can't send a {len(line)} byte message to worker {worker}")
+            return
+        link = self._links.get(worker)
+        if link is None:
+            link = self._links[worker] = _PeerLink()
+        if link.writer is not None and not link.writer.is_closing():
+            link.writer.write(line)
+            if link.writer.transport.get_write_buffer_size() > self.send_buffer_limit:
+                print(f"ERROR: Worker {worker} isn't reading, dropping the link and its unsent messages")
+                link.writer.transport.abort()
+                link.writer = None
+            return
+        link.writer = None
+        if link.pending_bytes + len(line) > self.send_buffer_limit:
+            print(f"ERROR: Backlog for worker {worker} is full, dropping a message")
+            return
+        link.pending.append(line)
+        link.pending_bytes += len(line)
+        if link.connecting is None or link.connecting.done():
+            link.connecting = asyncio.create_task(self._connect(worker, link))
+
+    async def _connect(self, worker: int, link: _PeerLink):
+        # Peers start at slightly different times; keep trying for a few seconds
+        for _ in range(CONNECT_RETRIES):
+            try:
+                _, writer = await asyncio.open_unix_connection(self.path_for(worker), limit=self.max_message)
+                break
+            except (FileNotFoundError, ConnectionError):
+                await asyncio.sleep(CONNECT_RETRY_DELAY)
+        else:
+            print(f"ERROR: Worker {self.index} can't reach worker {worker}, dropping {len(link.pending)} messages")
+            link.pending.clear()
+            link.pending_bytes = 0
+            return
+        while link.pending:
+            writer.write(link.pending.popleft())
+        link.pending_bytes = 0
+        link.writer = writer
+
+    async def close(self):
+        for link in self._links.values():
+            if link.connecting is not None:
+                link.connecting.cancel()
+            if link.writer is not None:
+                link.writer.close()
+        self._links.clear()
+        for task in list(self._readers):
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+            try:
+                os.unlink(self.path_for(self.index))
+            except FileNotFoundError:
+                pass
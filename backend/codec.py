@@ -0,0 +1,145 @@
+"""
+Wire codecs for server -> client frames.
+
+JSON text is the default. A client that offers the "quiz.msgpack.v1" subprotocol
+gets MessagePack binary frames in a compact shape: "type" becomes a small int,
+the long keys get short aliases, and player/leaderboard entries become
+positional rows instead of dicts. Client actions are a few bytes, so they stay
+JSON text in both modes.
+
+msgpack is optional: without it every client gets JSON. The tables below are
+append-only and mirrored in frontend/src/wireCodec.js. Keys not in KEYS pass
+through unchanged, so a new field works before it gets an alias (just don't
+name it like one of the aliases).
+"""
+import json
+from operator import itemgetter
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON_SUBPROTOCOL = "quiz.json.v1"
+MSGPACK_SUBPROTOCOL = "quiz.msgpack.v1"
+
+# Code = position in the list
+MESSAGE_TYPES = [
+    None, "PLAYER_UPDATE", "PLAYER_DELTA", "NEW_QUESTION", "ANSWER_ACK", "ROUND_REVEAL",
+    "STATUS_UPDATE", "GENERATION_PROGRESS", "GAME_OVER", "SPECTATOR_VIEW",
+]
+KEYS = {
+    "type": "t", "version": "v", "base": "b", "players": "p", "removed": "x",
+    "answered": "a", "connected": "c", "question": "q", "options": "o",
+    "correct_index": "k", "explanation": "e", "index": "i", "total": "n",
+    "time_limit": "tl", "time_left": "tr", "timed_out": "to", "correct": "ok",
+    "state": "s", "ready": "y", "room": "rm", "leaderboard": "lb",
+}
+# Lists of dicts sent as rows, fields in this order
+ROWS = {
+    "players": ("id", "name", "score", "is_host", "is_connected", "has_answered", "current_answer"),
+    "leaderboard": ("rank", "name", "score"),
+}
+
+TYPE_CODES = {name: code for code, name in enumerate(MESSAGE_TYPES) if name}
+_ROW_GETTERS = {key: itemgetter(*fields) for key, fields in ROWS.items()}
+_LONG_KEYS = {short: key for key, short in KEYS.items()}
+
+Frame = Union[str, bytes]
+
+
+def compact(message: dict) -> dict:
+    """Verbose message -> compact shape (one level deep, that's all our messages use)"""
+    out = {}
+    for key, value in message.items():
+        if key == "type":
+            value = TYPE_CODES.get(value, value)
+        elif key in _ROW_GETTERS and isinstance(value, list):
+            getter = _ROW_GETTERS[key]
+            value = [getter(item) for item in value]
+        elif isinstance(value, dict):
+            value = {KEYS.get(k, k): v for k, v in value.items()}
+        out[KEYS.get(key, key)] = value
+    return out
+
+
+def expand(message: dict) -> dict:
+    """Inverse of compact() (tests, benchmarks and Python clients)"""
+    out = {}
+    for short, value in message.items():
+        key = _LONG_KEYS.get(short, short)
+        if key == "type" and isinstance(value, int):
+            value = MESSAGE_TYPES[value]
+        elif key in ROWS and isinstance(value, list):
+            value = [dict(zip(ROWS[key], row)) for row in value]
+        elif isinstance(value, dict):
+            value = {_LONG_KEYS.get(k, k): v for k, v in value.items()}
+        out[key] = value
+    return out
+
+
+class JsonCodec:
+    name = "json"
+    binary = False
+
+    def encode(self, message: dict) -> str:
+        return json.dumps(message, separators=(",", ":"))
+
+    def decode(self, frame: Frame) -> dict:
+        return json.loads(frame)
+
+
+class MsgpackCodec:
+    name = "msgpack"
+    binary = True
+
+    def encode(self, message: dict) -> bytes:
+        return msgpack.packb(compact(message))
+
+    def decode(self, frame: Frame) -> dict:
+        return expand(msgpack.unpackb(frame))
+
+
+JSON = JsonCodec()
+MSGPACK = MsgpackCodec() if msgpack is not None else None
+Codec = Union[JsonCodec, MsgpackCodec]
+
+
+def negotiate(offered: Iterable[str]) -> Tuple[Codec, Optional[str]]:
+    """
+    Picks the codec for a new socket from the subprotocols the client offered.
+    Returns the codec and the subprotocol to accept with: browsers fail the
+    handshake if they offered subprotocols and we don't pick one.
+    """
+    offered = list(offered or ())
+    if MSGPACK is not None and MSGPACK_SUBPROTOCOL in offered:
+        return MSGPACK, MSGPACK_SUBPROTOCOL
+    if JSON_SUBPROTOCOL in offered:
+        return JSON, JSON_SUBPROTOCOL
+    return JSON, None
+
+
+def negotiate_socket(websocket) -> Tuple[Codec, Optional[str]]:
+    scope = getattr(websocket, "scope", None) or {}
+    return negotiate(scope.get("subprotocols", ()))
+
+
+class FrameCache:
+    """One broadcast, encoded at most once per codec in use"""
+
+    __slots__ = ("message", "frames", "uses")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.frames: Dict[str, Frame] = {}
+        self.uses: Dict[str, int] = {}  # recipients per codec, for the bytes metric
+
+    def get(self, codec: Codec) -> Frame:
+        name = codec.name
+        frame = self.frames.get(name)
+        if frame is None:
+            frame = self.frames[name] = codec.encode(self.message)
+            self.uses[name] = 0
+        self.uses[name] += 1
+        return frame
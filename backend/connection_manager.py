@@ -0,0 +1,201 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+from . import metrics
+from .codec import JSON, Codec, Frame, FrameCache
+
+log = logging.getLogger(__name__)
+
+# --- Outbound Queue Settings ---
+# Each socket gets its own bounded queue + writer task, so one slow phone
+# can't hold up the rest of the room.
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+# "drop" = throw away the oldest queued message, "disconnect" = kick the client
+SLOW_CONSUMER_POLICY = os.getenv("WS_SLOW_CONSUMER_POLICY", "disconnect")
+
+
+async def send_with_timeout(send, frame: Frame, timeout: float):
+    """
+    asyncio.wait_for(send(frame), timeout) without its pre-3.12 bug: a cancel that
+    lands just as the send completes is swallowed, and a writer loop then waits
+    for its next frame forever instead of stopping. The send runs inline and a
+    timer cancels it, so there's no extra task per frame either.
+    """
+    task = asyncio.current_task()
+    expired = False
+
+    def expire():
+        nonlocal expired
+        expired = True
+        task.cancel()
+
+    timer = asyncio.get_running_loop().call_later(timeout, expire)
+    try:
+        await send(frame)
+    except asyncio.CancelledError:
+        if not expired:
+            raise
+        if hasattr(task, "uncancel"):  # 3.11+: our own cancel doesn't count as a request
+            task.uncancel()
+        raise asyncio.TimeoutError() from None
+    finally:
+        timer.cancel()
+
+
+class ClientConnection:
+    """One websocket + its outbound queue and writer task, in the codec it negotiated"""
+
+    def __init__(self, websocket, room_code: str, max_queue: int, policy: str, send_timeout: float,
+                 codec: Codec = JSON):
+        self.websocket = websocket
+        self.room_code = room_code
+        self.codec = codec
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.closed = False
+        self.dropped = 0
+        self.writer_task: Optional[asyncio.Task] = None
+
+    def start(self, on_dead):
+        self.writer_task = asyncio.create_task(self._writer(on_dead))
+
+    def enqueue(self, frame: Frame) -> bool:
+        """Non-blocking. Returns False if the client should be dropped."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            if self.policy == "drop":
+                # Keep the newest state, lose the oldest
+                self.queue.get_nowait()
+                self.queue.put_nowait(frame)
+                self.dropped += 1
+                metrics.SLOW_CONSUMER_DROPS.inc()
+                return True
+            return False
+
+    async def _writer(self, on_dead):
+        send = self.websocket.send_bytes if self.codec.binary else self.websocket.send_text
+        try:
+            while True:
+                frame = await self.queue.get()
+                await send_with_timeout(send, frame, self.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Dead socket or stalled too long: stop writing and let the manager clean up
+            log.debug("Writer for room %s stopped: %r", self.room_code, e)
+            self.closed = True
+            on_dead(self)
+
+    async def close(self, code: int = 1000):
+        self.closed = True
+        if self.writer_task and self.writer_task is not asyncio.current_task():
+            self.writer_task.cancel()
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
+
+
+class ConnectionManager:
+    def __init__(self, max_queue: int = SEND_QUEUE_SIZE, policy: str = SLOW_CONSUMER_POLICY,
+                 send_timeout: float = SEND_TIMEOUT):
+        self.active_connections: Dict[str, List[ClientConnection]] = {}
+        # keyed by id(): Starlette's WebSocket is a Mapping, so it isn't hashable
+        self.clients: Dict[int, ClientConnection] = {}
+        self.max_queue = max_queue
+        self.policy = policy
+        self.send_timeout = send_timeout
+        # Told about every room broadcast (the spectator tier re-renders that room)
+        self.on_broadcast: Optional[Callable[[str], None]] = None
+        # Sockets being closed in the background; referenced so they aren't garbage collected
+        self._closing: Set[asyncio.Task] = set()
+
+    async def connect(self, websocket, room_code: str, codec: Codec = JSON, subprotocol: Optional[str] = None):
+        if subprotocol:
+            await websocket.accept(subprotocol=subprotocol)
+        else:
+            await websocket.accept()
+        client = ClientConnection(websocket, room_code, self.max_queue, self.policy, self.send_timeout, codec)
+        if room_code not in self.active_connections:
+            self.active_connections[room_code] = []
+        self.active_connections[room_code].append(client)
+        self.clients[id(websocket)] = client
+        client.start(self._on_dead)
+
+    def disconnect(self, websocket, room_code: str):
+        client = self.clients.pop(id(websocket), None)
+        if client is None:
+            return
+        client.closed = True
+        if client.writer_task and client.writer_task is not asyncio.current_task():
+            client.writer_task.cancel()
+        if room_code in self.active_connections:
+            if client in self.active_connections[room_code]:
+                self.active_connections[room_code].remove(client)
+            if not self.active_connections[room_code]:
+                del self.active_connections[room_code]
+
+    def _on_dead(self, client: ClientConnection):
+        self.disconnect(client.websocket, client.room_code)
+        # Closing the socket wakes up the receive loop, which runs the normal disconnect path
+        self._close_later(client, 1011)
+
+    def _kick(self, client: ClientConnection):
+        log.debug("Slow consumer in room %s, disconnecting", client.room_code)
+        metrics.SLOW_CONSUMER_KICKS.inc()
+        self.disconnect(client.websocket, client.room_code)
+        self._close_later(client, 1008)
+
+    def _close_later(self, client: ClientConnection, code: int):
+        task = asyncio.create_task(client.close(code=code))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def send_personal(self, message: dict, websocket):
+        """Queued send to one socket (keeps ordering with broadcasts)"""
+        client = self.clients.get(id(websocket))
+        if client is None:
+            return
+        frame = client.codec.encode(message)
+        if metrics.ENABLED:
+            metrics.WS_SENT_BYTES.labels(client.codec.name).inc(len(frame))
+        if not client.enqueue(frame):
+            self._kick(client)
+
+    async def broadcast(self, message: dict, room_code: str):
+        if self.on_broadcast is not None:
+            self.on_broadcast(room_code)
+        if room_code in self.active_connections:
+            started = time.perf_counter() if metrics.ENABLED else 0.0
+            # Encoded once per codec in use, the same frame is shared by every recipient
+            frames = FrameCache(message)
+            # Copy: a kick modifies the list while we walk it
+            clients = list(self.active_connections[room_code])
+            for client in clients:
+                if not client.enqueue(frames.get(client.codec)):
+                    self._kick(client)
+            if metrics.ENABLED:
+                metrics.BROADCAST_SECONDS.observe(time.perf_counter() - started)
+                metrics.BROADCAST_RECIPIENTS.inc(len(clients))
+                metrics.ROOM_MESSAGES.labels(room_code).inc()
+                for name, uses in frames.uses.items():
+                    metrics.WS_SENT_BYTES.labels(name).inc(uses * len(frames.frames[name]))
+
+    @property
+    def connection_count(self) -> int:
+        return len(self.clients)
+
+    async def close_room(self, room_code: str, code: int = 1000):
+        """Closes every socket in a room (room evicted)"""
+        for client in list(self.active_connections.get(room_code, [])):
+            self.disconnect(client.websocket, room_code)
+            await client.close(code=code)
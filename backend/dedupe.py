@@ -0,0 +1,172 @@
+import os
+import re
+import itertools
+from zlib import crc32
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+# --- Dedupe Settings ---
+# Estimated Jaccard similarity (of character shingles) at which two questions with the
+# same correct answer count as the same. Different answers are never duplicates.
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.5"))
+SHINGLE_SIZE = 4
+# Signature = BANDS * ROWS MinHash values; LSH looks a pair up if any band matches exactly.
+# 16 x 3 finds pairs at J=0.5 with ~88% and at J=0.6 with ~98% probability, unrelated
+# questions (J~0.1) only collide ~1.6% of the time, and the verify step drops those.
+BANDS = 16
+ROWS = 3
+BINS = BANDS * ROWS
+
+# question_signature(): hash of the correct answer, then the BINS MinHash values
+Signature = Tuple[int, ...]
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+# "Paris, France" / "Mercury (planet)": the qualifier isn't part of the answer's identity.
+# Needs the space, so "1,000" stays whole.
+_QUALIFIER = re.compile(r",\s|\(")
+_ARTICLES = {"the", "a", "an"}
+_EMPTY = 0xFFFFFFFF
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(_PUNCTUATION.sub(" ", text.casefold()).split())
+
+
+def answer_key(question: Dict[str, Any]) -> str:
+    """
+    The correct answer as the LSH buckets see it: "The Beatles", "beatles." and
+    "Beatles (band)" are one answer, so rewordings that also touch the answer are still compared.
+    """
+    options = question.get("options") or []
+    index = question.get("correct_index", 0)
+    if not (isinstance(index, int) and 0 <= index < len(options)):
+        return ""
+    words = normalize_text(_QUALIFIER.split(str(options[index]), 1)[0]).split()
+    return " ".join([w for w in words if w not in _ARTICLES] or words)
+
+
+def question_text(question: Dict[str, Any]) -> str:
+    """
+    What the shingles are taken from: the question plus its correct answer (as answer_key).
+    Wrong options are left out, or questions sharing a set of options would look alike.
+    """
+    return normalize_text(f"{question.get('question', '')} {answer_key(question)}")
+
+
+def signature(text: str) -> Signature:
+    """
+    One-permutation MinHash: each shingle is hashed once (crc32) and only
+    competes for the minimum of the bin its hash lands in, instead of BINS
+    separate hash functions per shingle. ~20 us for a typical question.
+    """
+    data = text.encode()
+    bins = [_EMPTY] * BINS
+    for i in range(max(len(data) - SHINGLE_SIZE + 1, 1)):
+        h = crc32(data[i:i + SHINGLE_SIZE])
+        b = h % BINS
+        if h < bins[b]:
+            bins[b] = h
+    # Densify: an empty bin borrows from the next filled one, mixed with the distance
+    # so it isn't a plain copy. Both sides of a comparison do the same, so it stays comparable.
+    if _EMPTY in bins and bins.count(_EMPTY) < BINS:
+        original = list(bins)
+        for b in range(BINS):
+            if original[b] == _EMPTY:
+                step = 1
+                while original[(b + step) % BINS] == _EMPTY:
+                    step += 1
+                bins[b] = crc32(original[(b + step) % BINS].to_bytes(4, "little"), step)
+    return tuple(bins)
+
+
+def question_signature(question: Dict[str, Any]) -> Signature:
+    """
+    Templated questions ("capital of France" / "of Germany", "WWI" / "WWII") share
+    most of their shingles, so the answer is a hard requirement on top: it leads
+    the signature and is part of every LSH band key.
+    """
+    return (crc32(answer_key(question).encode()),) + signature(question_text(question))
+
+
+def similarity(a: Signature, b: Signature) -> float:
+    """Estimated Jaccard similarity of two question signatures: the fraction of equal bins, 0 if the answers differ"""
+    if a[0] != b[0]:
+        return 0.0
+    return sum(x == y for x, y in zip(a[1:], b[1:])) / BINS
+
+
+class NearDuplicateIndex:
+    """
+    LSH index of question signatures. Lookups only compare against entries that
+    share a whole band with the query, so checking a candidate costs the same
+    with 10 or 10,000 questions indexed.
+    """
+
+    def __init__(self, threshold: float = DEDUPE_THRESHOLD):
+        self.threshold = threshold
+        self._signatures: Dict[Hashable, Signature] = {}
+        self._ids = itertools.count()
+        self._buckets: List[Dict[Signature, Set[Hashable]]] = [{} for _ in range(BANDS)]
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._signatures
+
+    def _bands(self, sig: Signature):
+        # Keyed by the answer too: only questions with the same answer are ever compared
+        for band in range(BANDS):
+            yield band, (sig[0],) + sig[1 + band * ROWS:1 + (band + 1) * ROWS]
+
+    def get(self, key: Hashable) -> Optional[Signature]:
+        return self._signatures.get(key)
+
+    def find(self, sig: Signature) -> Optional[Hashable]:
+        """Key of an indexed near-duplicate, or None"""
+        checked = set()
+        for band, rows in self._bands(sig):
+            for key in self._buckets[band].get(rows, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                if similarity(sig, self._signatures[key]) >= self.threshold:
+                    return key
+        return None
+
+    def add(self, key: Hashable, sig: Signature):
+        if key in self._signatures:
+            self.remove(key)
+        self._signatures[key] = sig
+        for band, rows in self._bands(sig):
+            self._buckets[band].setdefault(rows, set()).add(key)
+
+    def remove(self, key: Hashable):
+        sig = self._signatures.pop(key, None)
+        if sig is None:
+            return
+        for band, rows in self._bands(sig):
+            bucket = self._buckets[band].get(rows)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][rows]
+
+    def clear(self):
+        self._signatures.clear()
+        for buckets in self._buckets:
+            buckets.clear()
+
+    def signatures(self) -> List[Signature]:
+        """Everything indexed, for snapshots (see add_signature)"""
+        return list(self._signatures.values())
+
+    def add_signature(self, sig: Signature):
+        self.add(next(self._ids), tuple(sig))
+
+    def add_question(self, question: Dict[str, Any]) -> bool:
+        """Indexes a question unless a near-duplicate is already in. True if it was new."""
+        sig = question_signature(question)
+        if self.find(sig) is not None:
+            return False
+        self.add(next(self._ids), sig)
+        return True
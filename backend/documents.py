@@ -0,0 +1,265 @@
+"""
+Document mode: quizzes from long pasted or uploaded text (manuals, lecture notes).
+
+The text is read as a stream and cut into chunks at paragraph boundaries, each
+tagged with the section (heading) it came from. Only DOCUMENT_MAX_CHUNKS chunks
+are kept, evenly spread over the document, so memory stays the same for a
+50 KB or a 50 MB upload. Generation is a map-reduce: a few chunks at a time are
+turned into candidate questions (map, under the shared rate limit), and the
+candidates are merged (reduce) with near-duplicate filtering and a per-section
+quota, so one dense chapter can't take over the quiz. Only as many chunks as
+the quiz needs are sent upstream, DOCUMENT_PARALLELISM at a time.
+"""
+import os
+import re
+import math
+import asyncio
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from . import metrics
+from .dedupe import NearDuplicateIndex, question_signature
+from .generation_scheduler import BACKGROUND_ROOM
+
+# --- Document Settings ---
+DOCUMENT_CHUNK_CHARS = int(os.getenv("DOCUMENT_CHUNK_CHARS", "6000"))
+DOCUMENT_MAX_CHUNKS = int(os.getenv("DOCUMENT_MAX_CHUNKS", "32"))  # kept per document
+DOCUMENT_MAX_BYTES = int(os.getenv("DOCUMENT_MAX_BYTES", str(20 * 1024 * 1024)))  # upload cap
+DOCUMENT_PARALLELISM = int(os.getenv("DOCUMENT_PARALLELISM", "4"))  # chunks in flight per game
+QUESTIONS_PER_CHUNK = int(os.getenv("DOCUMENT_QUESTIONS_PER_CHUNK", "3"))
+
+# "# Title", "Chapter 3", "BAB II", "2.1 Safety checks" (short, no full stop)
+_HEADING = re.compile(
+    r"^\s*(#{1,6}\s+\S.*|(chapter|section|part|bab|bagian)\s+[\w.]+.*|\d+(\.\d+)*\.?\s+[A-Z].*)$",
+    re.IGNORECASE)
+_MAX_HEADING = 100
+
+
+class Chunk:
+    __slots__ = ("index", "section", "text")
+
+    def __init__(self, index: int, section: str, text: str):
+        self.index = index
+        self.section = section
+        self.text = text
+
+    def to_dict(self) -> dict:
+        return {"index": self.index, "section": self.section, "text": self.text}
+
+    def prompt_text(self) -> str:
+        """What the provider gets as input_text in "document" mode"""
+        if self.section:
+            return f"[Section: {self.section}]\n{self.text}"
+        return self.text
+
+
+def _spread(n: int) -> List[float]:
+    """Radical inverse of 0..n-1: sorting by it visits positions 0, n/2, n/4, 3n/4, ..."""
+    out = []
+    for i in range(n):
+        value, denom = 0.0, 1.0
+        while i:
+            denom *= 2
+            value += (i & 1) / denom
+            i >>= 1
+        out.append(value)
+    return out
+
+
+class Document:
+    """What's kept of an uploaded text: at most DOCUMENT_MAX_CHUNKS chunks, spread over it"""
+
+    def __init__(self, chunks: List[Chunk], title: str = "", total_chunks: int = 0, total_chars: int = 0):
+        self.chunks = chunks
+        self.title = title
+        self.total_chunks = total_chunks or len(chunks)
+        self.total_chars = total_chars
+
+    @property
+    def sections(self) -> List[str]:
+        return list(dict.fromkeys(c.section for c in self.chunks))
+
+    def work_order(self) -> List[Chunk]:
+        """
+        The order chunks are sent upstream in: round-robin over sections, sections
+        and the chunks within each visited spread out (first, middle, quarters...),
+        so whatever prefix is needed covers the whole document.
+        """
+        by_section: Dict[str, List[Chunk]] = {}
+        for chunk in self.chunks:
+            by_section.setdefault(chunk.section, []).append(chunk)
+        section_rank = dict(zip(by_section, _spread(len(by_section))))
+        keyed = []
+        for section, chunks in by_section.items():
+            for spread, chunk in zip(_spread(len(chunks)), chunks):
+                keyed.append(((spread, section_rank[section]), chunk))
+        keyed.sort(key=lambda item: item[0])
+        return [chunk for _, chunk in keyed]
+
+    def to_dict(self) -> dict:
+        return {"title": self.title, "total_chunks": self.total_chunks, "total_chars": self.total_chars,
+                "chunks": [c.to_dict() for c in self.chunks]}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Document":
+        chunks = [Chunk(c["index"], c["section"], c["text"]) for c in data["chunks"]]
+        return cls(chunks, data.get("title", ""), data.get("total_chunks", 0), data.get("total_chars", 0))
+
+
+class DocumentChunker:
+    """
+    Incremental splitter: feed() text as it arrives, finish() for the Document.
+    Holds one chunk being built plus the kept ones. When more than max_chunks
+    would be kept, every other one is dropped and only every 2nd (then 4th, ...)
+    chunk is kept from then on, so the kept chunks stay evenly spread.
+    """
+
+    def __init__(self, chunk_chars: int = DOCUMENT_CHUNK_CHARS, max_chunks: int = DOCUMENT_MAX_CHUNKS):
+        self.chunk_chars = chunk_chars
+        self.max_chunks = max_chunks
+        self.title = ""
+        self.section = ""
+        self.kept: List[Chunk] = []
+        self.stride = 1
+        self.count = 0
+        self.chars = 0
+        self._lines: List[str] = []
+        self._size = 0
+        self._partial = ""
+
+    def feed(self, text: str):
+        self.chars += len(text)
+        lines = (self._partial + text).split("\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._add_line(self._cut_long(line))
+        self._partial = self._cut_long(self._partial)
+
+    def _cut_long(self, line: str) -> str:
+        """Feeds whole pieces of an overlong line (one giant paragraph, no newlines), returns the rest"""
+        while len(line) > self.chunk_chars:
+            cut = line.rfind(" ", 0, self.chunk_chars)
+            cut = cut if cut > 0 else self.chunk_chars
+            self._add_line(line[:cut])
+            line = line[cut:].lstrip()
+        return line
+
+    def finish(self) -> Document:
+        if self._partial:
+            self._add_line(self._partial)
+            self._partial = ""
+        self._flush()
+        return Document(self.kept, self.title, self.count, self.chars)
+
+    def _add_line(self, line: str):
+        stripped = line.strip()
+        if stripped and len(stripped) <= _MAX_HEADING and _HEADING.match(stripped):
+            # Chunks don't straddle sections (unless the last one was tiny)
+            if self._size >= self.chunk_chars // 4:
+                self._flush()
+            self.section = stripped.lstrip("#").strip()
+            self.title = self.title or self.section
+        elif self._lines and self._size + len(line) >= self.chunk_chars * 3 // 2:
+            self._flush()
+        self._lines.append(line)
+        self._size += len(line) + 1
+        # Cut at a paragraph break once big enough; hard cut if a paragraph runs long
+        if (self._size >= self.chunk_chars and not stripped) or self._size >= self.chunk_chars * 3 // 2:
+            self._flush()
+
+    def _flush(self):
+        text = "\n".join(self._lines).strip()
+        self._lines = []
+        self._size = 0
+        if not text:
+            return
+        index = self.count
+        self.count += 1
+        if index % self.stride:
+            return
+        self.kept.append(Chunk(index, self.section, text))
+        if len(self.kept) > self.max_chunks:
+            self.stride *= 2
+            self.kept = [c for c in self.kept if c.index % self.stride == 0]
+
+
+def chunk_text(text: str, **kwargs) -> Document:
+    chunker = DocumentChunker(**kwargs)
+    chunker.feed(text)
+    return chunker.finish()
+
+
+async def stream_document_questions(provider, document: Document, count: int = 10,
+                                    room: str = BACKGROUND_ROOM, seen: Optional[NearDuplicateIndex] = None,
+                                    parallel: int = DOCUMENT_PARALLELISM,
+                                    per_chunk: int = QUESTIONS_PER_CHUNK) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Map: up to `parallel` workers take chunks in work_order() and ask the provider
+    for `per_chunk` questions each, until there are enough candidates.
+    Reduce: near-duplicates (within the quiz, or of the room's history in `seen`)
+    are dropped; a candidate is yielded right away while its section is under its
+    share of the quiz, otherwise parked until the end to fill what's left.
+    """
+    queue = document.work_order()
+    if not queue:
+        return
+    sections = {c.section for c in queue}
+    quota = max(1, math.ceil(count / len(sections)))
+    ready: asyncio.Queue = asyncio.Queue()
+    batch = NearDuplicateIndex()
+    per_section: Dict[str, int] = {}
+    parked: List[Dict[str, Any]] = []
+    emitted = 0
+    errors: List[Exception] = []
+
+    async def worker():
+        while queue and emitted + len(parked) + ready.qsize() < count:
+            chunk = queue.pop(0)
+            try:
+                questions = await provider.request_questions("document", chunk.prompt_text(), per_chunk, room=room)
+            except Exception as e:
+                print(f"DEBUG: Document chunk {chunk.index} failed: {e!r}")
+                errors.append(e)
+                continue
+            metrics.DOCUMENT_CHUNKS.inc()
+            for q in questions:
+                ready.put_nowait((chunk.section, q))
+
+    workers = [asyncio.create_task(worker()) for _ in range(max(1, parallel))]
+    done = asyncio.gather(*workers)
+    try:
+        while emitted < count:
+            if ready.empty():
+                if done.done():
+                    break
+                getter = asyncio.ensure_future(ready.get())
+                await asyncio.wait([getter, done], return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    continue
+                section, q = getter.result()
+            else:
+                section, q = ready.get_nowait()
+
+            sig = question_signature(q)
+            if batch.find(sig) is not None:
+                metrics.DEDUPE_DROPPED.labels("batch").inc()
+                continue
+            batch.add(len(batch), sig)
+            if seen is not None and seen.find(sig) is not None:
+                metrics.DEDUPE_DROPPED.labels("history").inc()
+                continue
+            if per_section.get(section, 0) >= quota:
+                parked.append(q)
+                continue
+            per_section[section] = per_section.get(section, 0) + 1
+            emitted += 1
+            yield q
+
+        for q in parked[:count - emitted]:
+            emitted += 1
+            yield q
+        if not emitted and errors:
+            raise errors[-1]
+    finally:
+        done.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
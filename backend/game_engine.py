@@ -1,9 +1,15 @@
-import random
-import string
+import time
 import asyncio
-from typing import Dict, List, Optional, Union
+from typing import Dict, Iterable, List, Optional, Set, Union
 from pydantic import BaseModel
 
+from . import metrics
+from .dedupe import NearDuplicateIndex
+from .leaderboard import Leaderboard
+from .questions import PreparedQuestion, prepare_question
+from .room_lifecycle import MAX_ROOMS, RoomCodeAllocator, RoomLimitError
+from .room_store import RoomStore
+
 # --- Data Models ---
 class Player(BaseModel):
     id: str
@@ -20,6 +26,37 @@ class Question(BaseModel):
     correct_index: int
     explanation: str
 
+class PlayerState:
+    """
+    Hot-path player record: a plain __slots__ object, much cheaper to mutate and
+    serialize than a Pydantic model. Player is only built at the API boundary.
+    """
+    __slots__ = ("id", "name", "score", "is_host", "is_connected", "has_answered", "current_answer")
+
+    def __init__(self, id: str, name: str, is_host: bool = False):
+        self.id = id
+        self.name = name
+        self.score = 0
+        self.is_host = is_host
+        self.is_connected = True
+        self.has_answered = False
+        self.current_answer: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        # Same shape as Player.dict()
+        return {
+            "id": self.id,
+            "name": self.name,
+            "score": self.score,
+            "is_host": self.is_host,
+            "is_connected": self.is_connected,
+            "has_answered": self.has_answered,
+            "current_answer": self.current_answer,
+        }
+
+    def to_model(self) -> Player:
+        return Player(**self.to_dict())
+
 class GameState:
     WAITING = "WAITING"
     GENERATING = "GENERATING"
@@ -31,29 +68,290 @@ class GameState:
 class GameLobby:
     def __init__(self, room_code: str):
         self.room_code = room_code
-        self.players: Dict[str, Player] = {}
-        self.state = GameState.WAITING
-        # questions can be Pydantic models OR dictionaries depending on source
-        self.questions: List[Union[Question, dict]] = []
+        self.players: Dict[str, PlayerState] = {}
+        # Running counters so "has everyone answered?" is O(1)
+        self.connected_count = 0
+        self.answered_count = 0  # answered AND connected
+        # This round's answers only: scoring and round reset touch answerers, not the whole room
+        self._round_answers: Dict[str, int] = {}
+        self._state = GameState.WAITING
+        # Validated at ingest (append_question), with their payloads prebuilt
+        self.questions: List[PreparedQuestion] = []
+        # Every question this room has been served, across RESET_LOBBY, so new games don't repeat them
+        self.history = NearDuplicateIndex()
         self.current_question_index = 0
         self.topic = ""
-    
-    def add_player(self, player_id: str, name: str) -> Player:
+        # documents.Document the host uploaded for "document" mode (not journaled: re-upload after a crash)
+        self.document = None
+        self.created_at = time.monotonic()
+        self.last_activity = self.created_at
+        # Streaming generation: questions arrive one by one while the game runs
+        self.expected_questions = 0
+        self.generation_done = True
+        self._question_arrived = asyncio.Event()
+        self.generation_task: Optional[asyncio.Task] = None
+        self.advance_task: Optional[asyncio.Task] = None
+        # Roster versioning: clients apply deltas on top of the last version they saw
+        self.roster_version = 0
+        self._dirty_players: Set[str] = set()
+        self._removed_players: Set[str] = set()
+        # Kept sorted as scores change, for spectators' top-K
+        self.leaderboard = Leaderboard()
+        # Event log for crash recovery (None = persistence off); see room_journal.py
+        self._journal = None
+        # Deadlines: handles on the shared TimerWheel, never a task per room
+        self.time_limit = 0.0  # seconds per question, 0 = wait for everyone
+        self.round_deadline: Optional[float] = None  # time.monotonic()
+        self.round_timer = None
+        self.lobby_timer = None
+
+    # --- State ---
+    @property
+    def state(self) -> str:
+        return self._state
+
+    @state.setter
+    def state(self, value: str):
+        self._record("s", value)
+        self._set_state(value)
+
+    def _set_state(self, value: str):
+        # Every transition goes through here, so this is the one place to count them
+        if metrics.ENABLED and value != self._state:
+            metrics.STATE_TRANSITIONS.labels(value).inc()
+        self._state = value
+
+    # --- Journal ---
+    # Public mutators record one short event; internal helpers (_set_state, _start_round, ...)
+    # don't, so replaying an event never records the nested steps twice.
+    REPLAY = {
+        "s": "_replay_state", "j": "add_player", "l": "handle_disconnect", "k": "remove_player",
+        "a": "submit_answer", "c": "calculate_scores", "r": "start_round", "n": "next_question",
+        "x": "reset", "b": "begin_generation", "q": "append_question", "d": "finish_generation",
+        "t": "set_time_limit",
+    }
+
+    def _record(self, op: str, *args):
+        if self._journal is not None:
+            self._journal.record(self.room_code, op, *args)
+
+    def _replay_state(self, value: str):
+        self._set_state(value)
+
+    def apply_event(self, op: str, args: list):
+        """Replays one journal event (only while no journal is attached)"""
+        getattr(self, self.REPLAY[op])(*args)
+
+    def to_snapshot(self) -> dict:
+        return {
+            "state": self._state,
+            "topic": self.topic,
+            "questions": [q.to_dict() for q in self.questions],
+            "index": self.current_question_index,
+            "expected": self.expected_questions,
+            "done": self.generation_done,
+            "players": [p.to_dict() for p in self.players.values()],
+            "answers": dict(self._round_answers),
+            "time_limit": self.time_limit,
+            # Questions from earlier games too, so a restored room still won't repeat them
+            "history": self.history.signatures(),
+        }
+
+    @classmethod
+    def from_snapshot(cls, room_code: str, data: dict) -> "GameLobby":
+        lobby = cls(room_code)
+        lobby._state = data["state"]
+        lobby.topic = data.get("topic", "")
+        lobby.questions = [prepare_question(q) for q in data["questions"]]
+        if "history" in data:
+            for sig in data["history"]:
+                lobby.history.add_signature(sig)
+        else:
+            # Snapshot from before history was saved: the current game is all we know
+            for q in data["questions"]:
+                lobby.history.add_question(q)
+        lobby.current_question_index = data["index"]
+        lobby.expected_questions = data["expected"]
+        lobby.generation_done = data["done"]
+        for p in data["players"]:
+            player = PlayerState(p["id"], p["name"], p["is_host"])
+            player.score = p["score"]
+            player.is_connected = p["is_connected"]
+            player.has_answered = p["has_answered"]
+            player.current_answer = p["current_answer"]
+            lobby.players[player.id] = player
+            lobby.leaderboard.set(player.id, player.name, player.score)
+            if player.is_connected:
+                lobby.connected_count += 1
+                if player.has_answered:
+                    lobby.answered_count += 1
+        lobby._round_answers = dict(data["answers"])
+        lobby.time_limit = data.get("time_limit", 0.0)
+        return lobby
+
+    # --- Deadlines ---
+    def set_time_limit(self, seconds: float):
+        self._record("t", seconds)
+        self.time_limit = seconds
+
+    def round_timing(self) -> dict:
+        """Countdown fields for NEW_QUESTION: relative, so client clock skew doesn't matter"""
+        if self.round_deadline is None:
+            return {}
+        return {
+            "time_limit": self.time_limit,
+            "time_left": round(max(0.0, self.round_deadline - time.monotonic()), 2)
+        }
+
+    def cancel_round_timer(self):
+        if self.round_timer is not None:
+            self.round_timer.cancel()
+            self.round_timer = None
+        self.round_deadline = None
+
+    def cancel_lobby_timer(self):
+        if self.lobby_timer is not None:
+            self.lobby_timer.cancel()
+            self.lobby_timer = None
+
+    def cancel_timers(self):
+        self.cancel_round_timer()
+        self.cancel_lobby_timer()
+
+    def recover(self):
+        """After a restart: every socket is gone and so is the generation task"""
+        for player in self.players.values():
+            player.is_connected = False
+        self.connected_count = 0
+        self.answered_count = 0
+        self._finish_generation()
+        if self._state == GameState.GENERATING and not self.questions:
+            self._set_state(GameState.WAITING)
+        self.touch()
+
+    def mark_dirty(self, player_id: str):
+        self._dirty_players.add(player_id)
+
+    def roster_resync(self) -> dict:
+        """Full roster at the current version, for a joining client or one that fell out of sync.
+        Everything else (answers, scores, new rounds, resets) goes out as roster_delta()."""
+        return {
+            "version": self.roster_version,
+            "players": [p.to_dict() for p in self.players.values()]
+        }
+
+    def roster_delta(self) -> Optional[dict]:
+        """Only the players that changed since the last version, or None if nothing did"""
+        if not self._dirty_players and not self._removed_players:
+            return None
+        base = self.roster_version
+        self.roster_version += 1
+        changed = [self.players[p_id].to_dict() for p_id in self._dirty_players if p_id in self.players]
+        removed = list(self._removed_players)
+        self._dirty_players.clear()
+        self._removed_players.clear()
+        return {
+            "version": self.roster_version,
+            "base": base,
+            "players": changed,
+            "removed": removed
+        }
+
+    # --- Progressive question loading ---
+    def begin_generation(self, expected: int):
+        self._record("b", expected)
+        self.questions = []
+        self.current_question_index = 0
+        self.expected_questions = expected
+        self.generation_done = False
+
+    def append_question(self, question: Union[PreparedQuestion, Question, dict]):
+        """The ingest stage: raises QuestionError (and records nothing) for a malformed question"""
+        prepared = prepare_question(question)
+        data = prepared.to_dict()
+        self._record("q", data)
+        self.questions.append(prepared)
+        self.history.add_question(data)
+        self._question_arrived.set()
+
+    def finish_generation(self):
+        if not self.generation_done:
+            self._record("d")
+        self._finish_generation()
+
+    def _finish_generation(self):
+        self.generation_done = True
+        self._question_arrived.set()
+
+    @property
+    def is_generating(self) -> bool:
+        return self.generation_task is not None and not self.generation_task.done()
+
+    def cancel_generation(self):
+        """Stops the room's generation task (reset, or everyone left)"""
+        self._cancel_tasks()
+        self.finish_generation()
+
+    def _cancel_tasks(self):
+        for task in (self.generation_task, self.advance_task):
+            if task is not None and not task.done():
+                task.cancel()
+        self.generation_task = None
+        self.advance_task = None
+
+    @property
+    def total_questions(self) -> int:
+        """What clients see as 'total': the target while streaming, the real count after"""
+        if self.generation_done:
+            return len(self.questions)
+        return max(self.expected_questions, len(self.questions))
+
+    async def wait_for_question(self, index: int) -> bool:
+        """Waits until question `index` has arrived. False if generation ended without it."""
+        while index >= len(self.questions) and not self.generation_done:
+            self._question_arrived.clear()
+            await self._question_arrived.wait()
+        return index < len(self.questions)
+
+    def add_player(self, player_id: str, name: str) -> PlayerState:
+        self._record("j", player_id, name)
         # If player rejoins, recover their stats but mark connected
         if player_id in self.players:
-            self.players[player_id].is_connected = True
-            return self.players[player_id]
+            player = self.players[player_id]
+            if not player.is_connected:
+                player.is_connected = True
+                self.connected_count += 1
+                if player.has_answered:
+                    self.answered_count += 1
+            self.mark_dirty(player_id)
+            return player
 
         is_first = len(self.players) == 0
-        player = Player(id=player_id, name=name, is_host=is_first)
+        player = PlayerState(id=player_id, name=name, is_host=is_first)
         self.players[player_id] = player
+        self.leaderboard.set(player_id, name, 0)
+        self.connected_count += 1
+        self.mark_dirty(player_id)
         return player
     
+    def touch(self):
+        """Anything a player does keeps the room alive for the reaper"""
+        self.last_activity = time.monotonic()
+
+    def has_connected_players(self) -> bool:
+        return self.connected_count > 0
+
     def handle_disconnect(self, player_id: str):
         """Marks player as disconnected and migrates host if needed"""
         if player_id in self.players:
+            self._record("l", player_id)
             player = self.players[player_id]
-            player.is_connected = False
+            if player.is_connected:
+                player.is_connected = False
+                self.connected_count -= 1
+                if player.has_answered:
+                    self.answered_count -= 1
+            self.mark_dirty(player_id)
             
             # Host Migration: If host leaves, pick the next connected player
             if player.is_host:
@@ -61,11 +359,21 @@ class GameLobby:
                 for p_id, p in self.players.items():
                     if p.is_connected:
                         p.is_host = True
+                        self.mark_dirty(p_id)
                         break # Found a new host
 
     def remove_player(self, player_id: str):
         if player_id in self.players:
-            del self.players[player_id]
+            self._record("k", player_id)
+            player = self.players.pop(player_id)
+            if player.is_connected:
+                self.connected_count -= 1
+                if player.has_answered:
+                    self.answered_count -= 1
+            self._round_answers.pop(player_id, None)
+            self.leaderboard.remove(player_id)
+            self._dirty_players.discard(player_id)
+            self._removed_players.add(player_id)
             # Logic to reassign host could go here
 
     def submit_answer(self, player_id: str, answer_index: int):
@@ -74,59 +382,139 @@ class GameLobby:
             return
         
         player = self.players[player_id]
-        player.has_answered = True
+        self._record("a", player_id, answer_index)
+        if not player.has_answered:
+            player.has_answered = True
+            if player.is_connected:
+                self.answered_count += 1
         player.current_answer = answer_index 
+        self._round_answers[player_id] = answer_index
+        self.mark_dirty(player_id)
 
     def calculate_scores(self):
-        """Called once at the end of the round to update scores"""
-        current_q = self.questions[self.current_question_index]
-        
-        # Get correct index safely
-        if isinstance(current_q, dict):
-            correct_idx = current_q.get('correct_index')
-        else:
-            correct_idx = current_q.correct_index
+        """Called once at the end of the round to update scores. One pass over this round's answers."""
+        self._record("c")
+        correct_idx = self.questions[self.current_question_index].correct_index
 
-        for player in self.players.values():
-            if player.current_answer == correct_idx:
+        players = self.players
+        for player_id, answer in self._round_answers.items():
+            player = players.get(player_id)
+            if player is None:
+                continue
+            if answer == correct_idx:
                 player.score += 10
+                self.leaderboard.set(player_id, player.name, player.score)
             
             # Reset their round data for safety
             player.current_answer = None
+            self.mark_dirty(player_id)
     
     def check_all_answered(self) -> bool:
         """Returns True if all CONNECTED players have answered"""
-        connected_players = [p for p in self.players.values() if p.is_connected]
-        if not connected_players:
-            return False
-        return all(p.has_answered for p in connected_players)
+        return self.connected_count > 0 and self.answered_count == self.connected_count
+
+    def start_round(self):
+        """Clears answer status. Only players who answered need touching."""
+        self._record("r")
+        self._start_round()
+
+    def _start_round(self):
+        players = self.players
+        for player_id in self._round_answers:
+            player = players.get(player_id)
+            if player is not None:
+                player.has_answered = False
+                player.current_answer = None
+                self.mark_dirty(player_id)
+        self._round_answers.clear()
+        self.answered_count = 0
+
+    def reset(self):
+        """RESET_LOBBY: back to the waiting room with scores cleared"""
+        self._record("x")
+        self._cancel_tasks()
+        self._finish_generation()
+        self._set_state(GameState.WAITING)
+        self.questions = []
+        self.current_question_index = 0
+        self._start_round()
+        self.leaderboard.clear()
+        for p in self.players.values():
+            if p.score:
+                p.score = 0
+                self.mark_dirty(p.id)
+            self.leaderboard.set(p.id, p.name, 0)
 
-    def next_question(self) -> Optional[Union[Question, dict]]:
+    def next_question(self) -> Optional[PreparedQuestion]:
+        self._record("n")
         self.current_question_index += 1
         
         # Reset answer status for next round
-        for p in self.players.values():
-            p.has_answered = False
+        self._start_round()
 
         if self.current_question_index < len(self.questions):
             return self.questions[self.current_question_index]
         else:
-            self.state = GameState.FINISHED
+            self._set_state(GameState.FINISHED)
             return None
 
-class GameManager:
-    def __init__(self):
+class GameManager(RoomStore):
+    """In-memory RoomStore. With shards > 1 it only creates codes from its own shard."""
+
+    def __init__(self, max_rooms: int = MAX_ROOMS, shard: int = 0, shards: int = 1):
         self.active_games: Dict[str, GameLobby] = {}
+        self.max_rooms = max_rooms
+        self.shard = shard
+        self.shards = shards
+        self.codes = RoomCodeAllocator(shard=shard, shards=shards)
+        self.journal = None
 
     def create_game(self) -> str:
-        """Generates a 4-letter code and creates a lobby"""
-        code = "".join(random.choices(string.ascii_uppercase, k=4))
-        # Ensure uniqueness
-        while code in self.active_games:
-            code = "".join(random.choices(string.ascii_uppercase, k=4))
-        
-        self.active_games[code] = GameLobby(code)
+        """Allocates a 4-letter code and creates a lobby. Raises RoomLimitError when full."""
+        if len(self.active_games) >= self.max_rooms:
+            raise RoomLimitError(f"Room limit ({self.max_rooms}) reached")
+        code = self.codes.allocate()
+        lobby = GameLobby(code)
+        if self.journal is not None:
+            self.journal.record(code, "+")
+            lobby._journal = self.journal
+        self.active_games[code] = lobby
         return code
 
     def get_game(self, room_code: str) -> Optional[GameLobby]:
-        return self.active_games.get(room_code)
\ No newline at end of file
+        return self.active_games.get(room_code)
+
+    def remove_game(self, room_code: str) -> Optional[GameLobby]:
+        game = self.active_games.pop(room_code, None)
+        if game is not None:
+            self.codes.release(room_code)
+            if self.journal is not None:
+                self.journal.record(room_code, "-")
+        return game
+
+    # --- Persistence ---
+    def attach_journal(self, journal):
+        self.journal = journal
+        for lobby in self.active_games.values():
+            lobby._journal = journal
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {code: lobby.to_snapshot() for code, lobby in self.active_games.items()}
+
+    def restore(self, rooms: Dict[str, dict], events: Iterable[list]):
+        """Rebuilds rooms from a snapshot plus the events logged after it"""
+        for code, data in rooms.items():
+            self.active_games[code] = GameLobby.from_snapshot(code, data)
+        for code, op, *args in events:
+            if op == "+":
+                self.active_games[code] = GameLobby(code)
+            elif op == "-":
+                self.active_games.pop(code, None)
+            elif code in self.active_games:
+                try:
+                    self.active_games[code].apply_event(op, args)
+                except Exception as e:
+                    print(f"ERROR replaying {op} for room {code}: {e!r}")
+        for code, lobby in self.active_games.items():
+            lobby.recover()
+            self.codes.reserve(code)
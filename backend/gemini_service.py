@@ -1,68 +1,62 @@
 import os
 import json
-import asyncio
-import time
 import random  # Added for randomness
-import google.generativeai as genai
-from typing import List, Dict, Any
+from typing import Any, AsyncIterator, Dict, List, Optional
 from dotenv import load_dotenv
 import uuid
+import time
+
+from . import metrics
+from .generation_scheduler import BACKGROUND_ROOM, GenerationScheduler
+from .json_stream import JSONArrayStreamParser, is_valid_question
+from .providers import QuestionProvider
+from .question_bank import normalize_topic
 
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-if GOOGLE_API_KEY:
-    genai.configure(api_key=GOOGLE_API_KEY)
-
-class GeminiService:
-    def __init__(self):
-        # 'gemini-2.5-flash' is good, dont change this.
-        self.model = genai.GenerativeModel('gemini-2.5-flash') 
-        self.last_request_time = 0
-        self.min_interval = 14/60 # 14 requests per minute
-
-    def _shuffle_answers(self, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Shuffle answer positions in each question to randomize correct_index"""
-        shuffled_questions = []
-        
-        for q in questions:
-            # Get the correct answer
-            correct_index = q.get('correct_index', 0)
-            options = q.get('options', [])
-            
-            if correct_index >= len(options):
-                correct_index = 0
-            
-            correct_answer = options[correct_index]
-            
-            # Shuffle all options
-            shuffled_options = options.copy()
-            random.shuffle(shuffled_options)
-            
-            # Find the new position of the correct answer
-            new_correct_index = shuffled_options.index(correct_answer)
-            
-            # Update question with shuffled data
-            shuffled_q = q.copy()
-            shuffled_q['options'] = shuffled_options
-            shuffled_q['correct_index'] = new_correct_index
-            
-            shuffled_questions.append(shuffled_q)
-        
-        return shuffled_questions
+_genai = None
 
-    async def generate_questions(self, mode: str, input_text: str, count: int = 10) -> List[Dict[str, Any]]:
-        # --- RATE LIMITER ---
-        current_time = time.time()
-        time_since_last = current_time - self.last_request_time
-        
-        if time_since_last < self.min_interval:
-            wait_time = self.min_interval - time_since_last
-            print(f"DEBUG: Rate limit safety. Waiting {wait_time:.2f}s...")
-            await asyncio.sleep(wait_time)
-        
-        self.last_request_time = time.time()
 
+def load_genai():
+    """
+    google.generativeai pulls in grpc and protobuf, ~1s of import. It's loaded on
+    first use (or by warm() in the background at startup) instead of when this
+    module is imported, so workers and tests start without paying for it.
+    """
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        if GOOGLE_API_KEY:
+            genai.configure(api_key=GOOGLE_API_KEY)
+        _genai = genai
+    return _genai
+
+# 'gemini-2.5-flash' is good, dont change this.
+GEMINI_MODEL = "gemini-2.5-flash"
+# Optional second model, asked when the first is slow or down (see providers.py)
+GEMINI_BACKUP_MODEL = os.getenv("GEMINI_BACKUP_MODEL", "")
+
+class GeminiService(QuestionProvider):
+    def __init__(self, scheduler: Optional[GenerationScheduler] = None, model_name: str = GEMINI_MODEL):
+        self.model_name = model_name
+        self._model = None
+        self.name = f"gemini:{model_name}"
+        # Shared rate limit / concurrency / coalescing for every room in the process
+        self.scheduler = scheduler or GenerationScheduler()
+
+    @property
+    def model(self):
+        if self._model is None:
+            self._model = load_genai().GenerativeModel(self.model_name)
+        return self._model
+
+    def warm(self):
+        """Imports the SDK and builds the model ahead of the first game (blocking: run it in a thread)"""
+        self.model
+
+    def _build_prompt(self, mode: str, input_text: str, count: int) -> Optional[str]:
+        """Returns None for modes we can't generate yet"""
         schema_instruction = """
         You are a quiz engine. Output valid JSON only. 
         
@@ -94,7 +88,7 @@ class GeminiService:
         selected_guidelines = random.sample(dynamic_guidelines, 3)
 
         if mode == "topic":
-            prompt = f"""
+            return f"""
                 {schema_instruction}
                 Create {count} diverse trivia questions about: "{input_text}".
                 
@@ -105,36 +99,100 @@ class GeminiService:
                 4. {selected_guidelines[2]}
                 5. Ensure questions don't overlap in content or approach
                 """
-        else:
+        if mode == "document":
+            # input_text is one chunk of an uploaded document (see documents.py)
+            return f"""
+                {schema_instruction}
+                Create {count} quiz questions based ONLY on this excerpt from a longer document:
+                ---
+                {input_text}
+                ---
+
+                Guidelines:
+                1. Every question must be answerable from the excerpt alone, no outside knowledge
+                2. Ask about the key facts, definitions and steps, not incidental wording
+                3. Wrong options should be plausible for someone who skimmed the text
+                4. Ensure questions don't overlap in content or approach
+                """
+        return None
+
+    async def request_questions(self, mode: str, input_text: str, count: int = 10,
+                                room: str = BACKGROUND_ROOM) -> List[Dict[str, Any]]:
+        """Same as generate_questions, but raises instead of returning the error placeholder"""
+        prompt = self._build_prompt(mode, input_text, count)
+        if prompt is None:
             return []
 
+        # --- RATE LIMITER ---
+        # Identical requests from other rooms share this call
+        key = ("request", self.name, mode, normalize_topic(input_text), count)
+        return await self.scheduler.run(key, room, lambda: self._call_model(prompt))
+
+    async def _call_model(self, prompt: str) -> List[Dict[str, Any]]:
+        started = time.perf_counter()
+        try:
+            questions = await self._call_model_once(prompt)
+        except Exception:
+            metrics.GENERATION_FAILURES.labels("request").inc()
+            raise
+        metrics.GENERATION_SECONDS.labels("request").observe(time.perf_counter() - started)
+        return questions
+
+    async def _call_model_once(self, prompt: str) -> List[Dict[str, Any]]:
+        # We remove response_mime_type="application/json" temporarily
+        # because sometimes it conflicts with experimental models or older libraries.
+        response = await self.model.generate_content_async(prompt)
+
+        text_response = response.text
+        print(f"DEBUG: Raw AI Response: {text_response[:100]}...")
+
+        # Clean Markdown formatting
+        if "```" in text_response:
+            text_response = text_response.replace("```json", "").replace("```", "").strip()
+
+        questions = json.loads(text_response)
+
+        # Shuffle answer positions for each question
+        questions = self.shuffle_answers(questions)
+
+        print(f"DEBUG: Successfully parsed {len(questions)} questions.")
+        return questions
+
+    async def stream_questions(self, mode: str, input_text: str, count: int = 10,
+                               room: str = BACKGROUND_ROOM) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Yields each question as soon as its JSON object is complete in the model's
+        streamed output, instead of waiting for the whole array.
+        """
+        prompt = self._build_prompt(mode, input_text, count)
+        if prompt is None:
+            return
+
+        key = ("stream", self.name, mode, normalize_topic(input_text), count)
+        async for q in self.scheduler.stream(key, room, lambda: self._stream_model(prompt, count)):
+            yield q
+
+    async def _stream_model(self, prompt: str, count: int) -> AsyncIterator[Dict[str, Any]]:
+        started = time.perf_counter()
+        produced = 0
         try:
-            # We remove response_mime_type="application/json" temporarily 
-            # because sometimes it conflicts with experimental models or older libraries.
-            response = await self.model.generate_content_async(prompt)
-            
-            text_response = response.text
-            print(f"DEBUG: Raw AI Response: {text_response[:100]}...") 
-
-            # Clean Markdown formatting
-            if "```" in text_response:
-                text_response = text_response.replace("```json", "").replace("```", "").strip()
-
-            questions = json.loads(text_response)
-            
-            # Shuffle answer positions for each question
-            questions = self._shuffle_answers(questions)
-            
-            print(f"DEBUG: Successfully parsed {len(questions)} questions.")
-            return questions
-            
-        except Exception as e:
-            print(f"CRITICAL ERROR in Gemini Service: {e}")
-            return [
-                {
-                    "question": f"The AI failed to generate questions for '{input_text}'. Try a different topic.",
-                    "options": ["Ok", "Retry", "Sad", "Bug"],
-                    "correct_index": 0,
-                    "explanation": f"Error detail: {str(e)}"
-                }
-            ]
\ No newline at end of file
+            response = await self.model.generate_content_async(prompt, stream=True)
+            parser = JSONArrayStreamParser()
+            async for chunk in response:
+                for q in parser.feed(chunk.text):
+                    if not is_valid_question(q):
+                        print(f"DEBUG: Skipping malformed streamed question: {str(q)[:100]}")
+                        continue
+                    if produced == 0:
+                        metrics.GENERATION_FIRST_QUESTION_SECONDS.observe(time.perf_counter() - started)
+                    yield self.shuffle_answers([q])[0]
+                    produced += 1
+                    if produced >= count:
+                        return
+        except Exception:
+            metrics.GENERATION_FAILURES.labels("stream").inc()
+            raise
+        finally:
+            # Early return and cancellation land here too
+            metrics.GENERATION_SECONDS.labels("stream").observe(time.perf_counter() - started)
+        print(f"DEBUG: Streamed {produced} questions.")
@@ -0,0 +1,289 @@
+import os
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional
+
+from . import metrics
+
+# --- Upstream Quota Settings ---
+REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_RPM", "14"))
+BURST = float(os.getenv("GEMINI_BURST", "1"))
+MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+
+BACKGROUND_ROOM = "__background__"
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holds at most `capacity`"""
+
+    def __init__(self, rate_per_minute: float, capacity: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self) -> float:
+        """Takes a token and returns 0, or returns how many seconds until one is available.
+        No await between check and update, so this is atomic on the event loop."""
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class SchedulerStats:
+    def __init__(self, window: int = 500):
+        self.submitted = 0
+        self.coalesced = 0
+        self.granted = 0
+        self.max_queue_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.recent_waits: Deque[float] = deque(maxlen=window)
+
+    def record_wait(self, seconds: float):
+        metrics.GENERATION_QUEUE_WAIT_SECONDS.observe(seconds)
+        self.granted += 1
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+        self.recent_waits.append(seconds)
+
+    def _percentile(self, pct: float) -> float:
+        if not self.recent_waits:
+            return 0.0
+        ordered = sorted(self.recent_waits)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+    def snapshot(self, queue_depth: int, active: int, rooms_waiting: int, in_flight: int) -> dict:
+        return {
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "rooms_waiting": rooms_waiting,
+            "active": active,
+            "in_flight_keys": in_flight,
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "granted": self.granted,
+            "wait_avg_s": round(self.total_wait / self.granted, 4) if self.granted else 0.0,
+            "wait_p50_s": round(self._percentile(0.50), 4),
+            "wait_p95_s": round(self._percentile(0.95), 4),
+            "wait_max_s": round(self.max_wait, 4),
+        }
+
+
+class _Waiter:
+    __slots__ = ("room", "future", "enqueued_at")
+
+    def __init__(self, room: str, future: asyncio.Future):
+        self.room = room
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+
+class _Flight:
+    """One upstream call shared by everyone who asked for the same key"""
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.waiters = 0
+        # Only used for streams
+        self.items: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.changed = asyncio.Condition()
+
+
+class GenerationScheduler:
+    """
+    Process-wide gate in front of the question model:
+    - token bucket for requests/minute
+    - at most `max_concurrency` upstream calls at once
+    - waiting requests are granted round-robin per room, so one busy room can't starve others
+    - identical in-flight requests (same key) share one upstream call
+    """
+
+    def __init__(self, rate_per_minute: float = REQUESTS_PER_MINUTE, burst: float = BURST,
+                 max_concurrency: int = MAX_CONCURRENCY):
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.max_concurrency = max_concurrency
+        self.stats = SchedulerStats()
+        self._active = 0
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._rotation: Deque[str] = deque()
+        self._pump_task: Optional[asyncio.Task] = None
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._streams: Dict[Hashable, _Flight] = {}
+
+    @classmethod
+    def for_worker(cls, workers: int) -> "GenerationScheduler":
+        """
+        One cluster worker's share. Buckets aren't shared between processes, so
+        GEMINI_RPM is the whole cluster's budget and each worker gets 1/workers of it.
+        """
+        workers = max(workers, 1)
+        return cls(REQUESTS_PER_MINUTE / workers, BURST / workers)
+
+    # --- Fair queue ---
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def stats_snapshot(self) -> dict:
+        return self.stats.snapshot(self.queue_depth, self._active, len(self._queues),
+                                   len(self._flights) + len(self._streams))
+
+    @asynccontextmanager
+    async def slot(self, room: str = BACKGROUND_ROOM):
+        """Holds one upstream slot (token + concurrency) for the duration of the block"""
+        waiter = _Waiter(room, asyncio.get_running_loop().create_future())
+        if room not in self._queues:
+            self._queues[room] = deque()
+            self._rotation.append(room)
+        self._queues[room].append(waiter)
+        self.stats.submitted += 1
+        self.stats.max_queue_depth = max(self.stats.max_queue_depth, self.queue_depth)
+        self._kick()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                self._release()  # granted just as we were cancelled
+            else:
+                self._forget(waiter)
+            raise
+
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _forget(self, waiter: _Waiter):
+        queue = self._queues.get(waiter.room)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[waiter.room]
+                self._rotation.remove(waiter.room)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        while self._rotation:
+            room = self._rotation.popleft()
+            queue = self._queues[room]
+            waiter = queue.popleft()
+            if queue:
+                self._rotation.append(room)  # back of the line
+            else:
+                del self._queues[room]
+            if not waiter.future.done():
+                return waiter
+        return None
+
+    def _release(self):
+        self._active -= 1
+        self._kick()
+
+    def _kick(self):
+        if self._pump_task is None or self._pump_task.done():
+            self._pump_task = asyncio.create_task(self._pump())
+
+    async def _pump(self):
+        while self._rotation and self._active < self.max_concurrency:
+            wait = self.bucket.try_take()
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            waiter = self._next_waiter()
+            if waiter is None:
+                self.bucket.tokens += 1  # nobody left to use it
+                break
+            self._active += 1
+            self.stats.record_wait(time.monotonic() - waiter.enqueued_at)
+            waiter.future.set_result(None)
+
+    # --- Singleflight ---
+    async def run(self, key: Hashable, room: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Runs `call` under a slot, or joins an identical call that's already in flight"""
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(self._run_flight(key, room, call))
+            self._flights[key] = flight
+        else:
+            self.stats.coalesced += 1
+            metrics.GENERATION_COALESCED.inc()
+            print(f"DEBUG: Coalesced generation request for {key}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            # Last interested room went away: stop spending quota on it
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    async def _run_flight(self, key: Hashable, room: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            async with self.slot(room):
+                return await call()
+        finally:
+            self._flights.pop(key, None)
+
+    async def stream(self, key: Hashable, room: str,
+                     open_stream: Callable[[], AsyncIterator[Any]]) -> AsyncIterator[Any]:
+        """Streaming singleflight: every subscriber sees every item of one upstream stream"""
+        flight = self._streams.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.task = asyncio.create_task(self._run_stream(key, room, open_stream, flight))
+            self._streams[key] = flight
+        else:
+            self.stats.coalesced += 1
+            metrics.GENERATION_COALESCED.inc()
+            print(f"DEBUG: Coalesced generation stream for {key}")
+
+        flight.waiters += 1
+        seen = 0
+        try:
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: seen < len(flight.items) or flight.done)
+                while seen < len(flight.items):
+                    item = flight.items[seen]
+                    seen += 1
+                    yield item
+                if flight.done and seen >= len(flight.items):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    async def _run_stream(self, key: Hashable, room: str, open_stream, flight: _Flight):
+        try:
+            async with self.slot(room):
+                async for item in open_stream():
+                    flight.items.append(item)
+                    async with flight.changed:
+                        flight.changed.notify_all()
+        except asyncio.CancelledError:
+            flight.error = asyncio.CancelledError()
+            raise
+        except Exception as e:
+            flight.error = e
+        finally:
+            self._streams.pop(key, None)
+            flight.done = True
+            async with flight.changed:
+                flight.changed.notify_all()
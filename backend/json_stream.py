@@ -0,0 +1,87 @@
+import json
+from typing import Any, Dict, List
+
+
+def is_valid_question(q: Any) -> bool:
+    """Minimum shape we need to show and score a question"""
+    if not isinstance(q, dict):
+        return False
+    options = q.get("options")
+    return (
+        isinstance(q.get("question"), str)
+        and isinstance(options, list)
+        and len(options) >= 2
+        and isinstance(q.get("correct_index", 0), int)
+    )
+
+
+class JSONArrayStreamParser:
+    """
+    Incremental parser for a streamed JSON array of objects, e.g. the model's
+    `[ {...}, {...} ]` answer arriving in arbitrary text chunks.
+    feed() returns every top-level object that became complete with that chunk.
+    Text before the opening '[' (markdown fences, chatter) is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0            # next char of _buffer to scan
+        self._in_array = False
+        self._done = False
+        self._depth = 0          # nesting depth inside the current element
+        self._in_string = False
+        self._escape = False
+        self._start = -1         # where the current element begins in _buffer
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        if self._done or not chunk:
+            return []
+        self._buffer += chunk
+        completed = []
+        buf = self._buffer
+        i = self._pos
+
+        while i < len(buf):
+            ch = buf[i]
+            if not self._in_array:
+                if ch == "[":
+                    self._in_array = True
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Closing bracket of the outer array
+                    self._done = True
+                    break
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        completed.append(json.loads(buf[self._start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        print(f"DEBUG: Dropping unparseable streamed element: {e}")
+                    self._start = -1
+            i += 1
+
+        # Only keep the unfinished element around, so memory stays at one question
+        if self._start >= 0:
+            self._buffer = buf[self._start:]
+            self._pos = i - self._start
+            self._start = 0
+        else:
+            self._buffer = ""
+            self._pos = 0
+        return completed
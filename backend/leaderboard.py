@@ -0,0 +1,57 @@
+from bisect import bisect_left, insort
+from typing import Dict, List, Tuple
+
+Key = Tuple[int, str]  # (-score, player_id): ascending order = best first
+
+
+class Leaderboard:
+    """
+    Players kept sorted by score as scores change, so the top K is a slice,
+    not a sort of the whole room on every update. set()/remove() are a
+    bisect plus a list insert/delete (a memmove for the room sizes we have).
+    """
+
+    def __init__(self):
+        self._keys: List[Key] = []
+        self._by_player: Dict[str, Key] = {}
+        self._names: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def set(self, player_id: str, name: str, score: int):
+        self._names[player_id] = name
+        key = (-score, player_id)
+        old = self._by_player.get(player_id)
+        if old == key:
+            return
+        if old is not None:
+            del self._keys[bisect_left(self._keys, old)]
+        insort(self._keys, key)
+        self._by_player[player_id] = key
+
+    def remove(self, player_id: str):
+        old = self._by_player.pop(player_id, None)
+        self._names.pop(player_id, None)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, old)]
+
+    def clear(self):
+        self._keys.clear()
+        self._by_player.clear()
+        self._names.clear()
+
+    def rank(self, player_id: str) -> int:
+        """1-based, ties share a rank (1, 2, 2, 4)"""
+        key = self._by_player[player_id]
+        return bisect_left(self._keys, (key[0],)) + 1
+
+    def top(self, k: int) -> List[dict]:
+        entries = []
+        rank = 0
+        previous = None
+        for i, (neg_score, player_id) in enumerate(self._keys[:k]):
+            if neg_score != previous:
+                rank, previous = i + 1, neg_score
+            entries.append({"rank": rank, "name": self._names[player_id], "score": -neg_score})
+        return entries
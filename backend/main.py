@@ -1,91 +1,552 @@
+import time
+_import_started = time.perf_counter()
+
 import os
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Union
-import json
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Optional
+import codecs
 
+from . import metrics
+from .cluster import ClusterNode, RemoteDisconnect
+from .codec import negotiate_socket
 from .game_engine import GameManager, GameState
-from .gemini_service import GeminiService
+from .room_lifecycle import RoomLimitError, RoomReaper
+from .room_journal import JOURNAL_DIR, RoomJournal
+from .gemini_service import GEMINI_BACKUP_MODEL, GeminiService
+from .providers import HedgedProvider, OfflineProvider, load_dataset
+from .connection_manager import ConnectionManager
+from .documents import DOCUMENT_MAX_BYTES, Document, DocumentChunker, stream_document_questions
+from .generation_scheduler import GenerationScheduler
+from .question_bank import DEFAULT_DB_PATH, QuestionBank, worker_db_path
+from .questions import QuestionError
+from .update_coalescer import UpdateCoalescer
+from .spectators import SPECTATOR_LEADERBOARD_SIZE, SpectatorHub, SpectatorLimitError
+from .timer_wheel import TimerWheel
+
+# Warm the Gemini SDK in a background thread at startup (0 = import it on the first game)
+GEMINI_WARMUP = os.getenv("GEMINI_WARMUP", "1") != "0"
 
-app = FastAPI()
+router = APIRouter()
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# One worker by default; under `python -m backend.cluster` each worker owns a shard of room codes.
+# Plain in-memory state lives at module level; anything that does I/O or heavy imports is in Services.
+cluster = ClusterNode.from_env()
+game_manager = GameManager(shard=cluster.index, shards=cluster.count)
 
-game_manager = GameManager()
-gemini_service = GeminiService()
+class Services:
+    """
+    Question generation, built by the app's lifespan rather than at import:
+    opening the bank's SQLite file and loading the offline set happen on startup,
+    and the Gemini SDK is imported on first use or warmed in a background thread
+    while the worker already accepts sockets. None until startup.
+    """
 
-class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
-
-    async def connect(self, websocket: WebSocket, room_code: str):
-        await websocket.accept()
-        if room_code not in self.active_connections:
-            self.active_connections[room_code] = []
-        self.active_connections[room_code].append(websocket)
-
-    def disconnect(self, websocket: WebSocket, room_code: str):
-        if room_code in self.active_connections:
-            if websocket in self.active_connections[room_code]:
-                self.active_connections[room_code].remove(websocket)
-            if not self.active_connections[room_code]:
-                del self.active_connections[room_code]
-
-    async def broadcast(self, message: dict, room_code: str):
-        if room_code in self.active_connections:
-            for connection in self.active_connections[room_code]:
-                await connection.send_json(message)
+        self.gemini: Optional[GeminiService] = None
+        self.question_provider = None
+        self.question_bank: Optional[QuestionBank] = None
+        self.warmup: Optional[asyncio.Task] = None
+
+    def start(self, question_provider=None, bank_db_path: Optional[str] = None):
+        if question_provider is None:
+            # GEMINI_RPM is the cluster's total; every worker gets its share
+            self.gemini = GeminiService(GenerationScheduler.for_worker(cluster.count))
+            upstreams = [self.gemini]
+            if GEMINI_BACKUP_MODEL:
+                # Its own scheduler: quota is per model, and the two mustn't coalesce into one call
+                upstreams.append(GeminiService(GenerationScheduler.for_worker(cluster.count),
+                                               model_name=GEMINI_BACKUP_MODEL))
+            question_provider = HedgedProvider(upstreams)
+        self.question_provider = question_provider
+        if bank_db_path is None and cluster.count > 1:
+            bank_db_path = worker_db_path(DEFAULT_DB_PATH, cluster.index)
+        self.question_bank = QuestionBank(question_provider, **({"db_path": bank_db_path} if bank_db_path else {}))
+        if isinstance(question_provider, HedgedProvider):
+            if question_provider.offline is None:
+                # Last resort when every upstream is slow or down: banked questions for the topic, then the bundled set
+                question_provider.offline = OfflineProvider(bank=self.question_bank, dataset=load_dataset())
+            if GEMINI_WARMUP:
+                self.warmup = spawn(self._warm(question_provider.upstreams))
+
+    async def _warm(self, upstreams):
+        started = time.perf_counter()
+        for upstream in upstreams:
+            if hasattr(upstream, "warm"):
+                try:
+                    await asyncio.to_thread(upstream.warm)
+                except Exception as e:
+                    print(f"ERROR warming up {upstream.name}: {e}")
+        startup_seconds["provider_warmup"] = time.perf_counter() - started
+        print(f"DEBUG: Question providers warmed up in {startup_seconds['provider_warmup']:.2f}s")
+
+    async def stop(self):
+        if self.warmup is not None and not self.warmup.done():
+            self.warmup.cancel()
+        self.warmup = None
+        if self.question_bank is not None:
+            # Stops top-ups, writes the pending served counts, closes SQLite
+            await self.question_bank.close()
+
+services = Services()
 
 manager = ConnectionManager()
+# Every round deadline and lobby timeout in the process lives on this one wheel
+timers = TimerWheel()
 
-# --- SECURITY HELPER ---
-def get_public_question(q: Union[dict, object]) -> dict:
-    """Removes the answer key from the question object"""
-    # Handle Pydantic model or Dict
-    if hasattr(q, "dict"): 
-        q = q.dict()
-    
+async def evict_room(room_code: str):
+    """Drops a room for good: stops its generation, closes its sockets, frees its code"""
+    game = game_manager.get_game(room_code)
+    if game is None:
+        return
+    game.cancel_generation()
+    game.cancel_timers()
+    coalescer.cancel(room_code)
+    game_manager.remove_game(room_code)
+    await manager.close_room(room_code, code=4001)
+    await spectators.close_room(room_code, code=4001)
+    # Per-room series would otherwise grow with every room ever created
+    metrics.ROOM_MESSAGES.remove(room_code)
+
+reaper = RoomReaper(game_manager, evict_room)
+# Set JOURNAL_DIR to survive restarts; each worker keeps its own log
+journal = RoomJournal(os.path.join(JOURNAL_DIR, f"worker-{cluster.index}")) if JOURNAL_DIR else None
+
+# Cold start, for /metrics and backend/benchmarks/startup.py
+startup_seconds: Dict[str, float] = {}
+
+def create_app(question_provider=None, bank_db_path: Optional[str] = None) -> FastAPI:
+    """
+    App factory: `uvicorn --factory backend.main:create_app`. Services are built
+    in the lifespan, so importing this module stays cheap. `question_provider`
+    replaces the Gemini stack (benchmarks, tests). One app per process: rooms
+    and sockets are module-level.
+    """
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        started = time.perf_counter()
+        services.start(question_provider, bank_db_path)
+        if journal is not None:
+            # Players reconnect to restored rooms through the normal catch-up path
+            journal.recover(game_manager)
+            journal.start(game_manager)
+            for game in game_manager.active_games.values():
+                restart_timers(game)
+        reaper.start()
+        await cluster.start(run_session)
+        startup_seconds["lifespan"] = time.perf_counter() - started
+        try:
+            yield
+        finally:
+            # Generation, round advances, reveals: nothing may still use the bank when it closes
+            for task in list(background_tasks):
+                task.cancel()
+            await asyncio.gather(*background_tasks, return_exceptions=True)
+            await services.stop()
+            await reaper.stop()
+            await timers.stop()
+            await cluster.stop()
+            if journal is not None:
+                await journal.close()
+
+    app = FastAPI(lifespan=lifespan)
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+# --- Gauges (computed at scrape time, nothing to keep in sync) ---
+def rooms_by_state():
+    counts = {}
+    for game in game_manager.active_games.values():
+        counts[(game.state,)] = counts.get((game.state,), 0) + 1
+    return counts
+
+def player_counts():
+    games = game_manager.active_games.values()
     return {
-        "question": q["question"],
-        "options": q["options"],
-        # We deliberately EXCLUDE 'correct_index' and 'explanation'
+        ("connected",): sum(g.connected_count for g in games),
+        ("total",): sum(len(g.players) for g in games),
+    }
+
+metrics.gauge("quiz_active_rooms", "Rooms by state", ["state"], callback=rooms_by_state)
+metrics.gauge("quiz_active_connections", "Open websocket connections",
+              callback=lambda: {(): manager.connection_count})
+metrics.gauge("quiz_spectators", "Open spectator connections", callback=lambda: {(): spectators.count})
+metrics.gauge("quiz_players", "Players in all rooms", ["status"], callback=player_counts)
+metrics.gauge("quiz_generation_queue_depth", "Requests waiting for the generation rate limiter",
+              callback=lambda: {(): services.gemini.scheduler.queue_depth if services.gemini else 0})
+metrics.gauge("quiz_provider_circuit_open", "1 while a provider's circuit breaker is open or half-open",
+              ["provider"], callback=lambda: {
+                  (name,): int(breaker.state != "closed")
+                  for name, breaker in getattr(services.question_provider, "breakers", {}).items()})
+metrics.gauge("quiz_startup_seconds", "Cold start: module import, lifespan startup, provider warm-up",
+              ["phase"], callback=lambda: {(phase,): seconds for phase, seconds in startup_seconds.items()})
+
+QUESTION_COUNT = 10
+# Seconds per question when the host doesn't pick one (0 = wait for every answer)
+ROUND_TIME_LIMIT = float(os.getenv("ROUND_TIME_LIMIT", "0"))
+MAX_ROUND_TIME_LIMIT = 300
+# A room that sits in the lobby (never started, or game over) this long is closed
+LOBBY_TIMEOUT = float(os.getenv("LOBBY_TIMEOUT", "1200"))
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "90"))
+# Keeps references to fire-and-forget tasks so they aren't garbage collected
+background_tasks = set()
+
+def spawn(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
+
+# --- Deadlines ---
+def arm_round_timer(game):
+    """Starts the clock on the current question (no-op without a time limit)"""
+    game.cancel_round_timer()
+    if game.time_limit > 0:
+        game.round_deadline = time.monotonic() + game.time_limit
+        game.round_timer = timers.call_later(game.time_limit, on_round_deadline,
+                                             game.room_code, game.current_question_index)
+
+def on_round_deadline(room_code: str, index: int):
+    game = game_manager.get_game(room_code)
+    # The round may have been revealed/reset in the meantime
+    if game and game.state == GameState.PLAYING and game.current_question_index == index:
+        spawn(reveal_round(game, timed_out=True))
+
+def arm_lobby_timer(game):
+    game.cancel_lobby_timer()
+    if LOBBY_TIMEOUT > 0:
+        game.lobby_timer = timers.call_later(LOBBY_TIMEOUT, on_lobby_timeout, game.room_code)
+
+def on_lobby_timeout(room_code: str):
+    game = game_manager.get_game(room_code)
+    if game and game.state in (GameState.WAITING, GameState.FINISHED):
+        print(f"DEBUG: Room {room_code} sat in the lobby for {LOBBY_TIMEOUT}s, closing it")
+        spawn(evict_room(room_code))
+
+def restart_timers(game):
+    """After recovery: the current question gets a fresh clock, lobbies a fresh timeout"""
+    if game.state == GameState.PLAYING:
+        arm_round_timer(game)
+    elif game.state in (GameState.WAITING, GameState.FINISHED):
+        arm_lobby_timer(game)
+
+async def run_generation(game, mode: str, topic: str):
+    """The room's generation task: streams questions in, starts the game on the first one"""
+    room_code = game.room_code
+    try:
+        await asyncio.wait_for(stream_into_lobby(game, mode, topic), GENERATION_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"ERROR: Generation for {room_code} timed out after {GENERATION_TIMEOUT}s")
+    except asyncio.CancelledError:
+        print(f"DEBUG: Generation for {room_code} cancelled")
+        raise
+    except Exception as e:
+        print(f"ERROR while streaming questions for {room_code}: {e}")
+    finally:
+        # A reset may already have started a newer generation; leave that one alone
+        if game.generation_task is asyncio.current_task():
+            game.finish_generation()
+            game.generation_task = None
+        print(f"DEBUG: Room {room_code} has {len(game.questions)} questions.")
+
+    if not game.questions and game.state == GameState.GENERATING:
+        # Nothing usable came back: let the host try again
+        game.state = GameState.WAITING
+        arm_lobby_timer(game)
+        await manager.broadcast({"type": "STATUS_UPDATE", "state": "WAITING"}, room_code)
+
+async def stream_into_lobby(game, mode: str, topic: str):
+    room_code = game.room_code
+    # history: skip anything this room already played, also before a RESET_LOBBY
+    if mode == "document":
+        # Straight to the provider: document questions are one room's, not worth caching
+        if game.document is None:
+            raise ValueError("No document uploaded for this room")
+        stream = stream_document_questions(services.question_provider, game.document, QUESTION_COUNT,
+                                           room=room_code, seen=game.history)
+    else:
+        stream = services.question_bank.stream_questions(mode, topic, QUESTION_COUNT, room=room_code,
+                                                         seen=game.history)
+    try:
+        async for q in stream:
+            try:
+                game.append_question(q)
+            except QuestionError as e:
+                # Malformed model output is dropped here, never found at reveal time
+                print(f"DEBUG: Dropped a malformed question for {room_code}: {e}")
+                metrics.QUESTIONS_REJECTED.inc()
+                continue
+            await manager.broadcast({
+                "type": "GENERATION_PROGRESS",
+                "ready": len(game.questions),
+                "total": game.expected_questions
+            }, room_code)
+
+            if len(game.questions) == 1:
+                # Start as soon as the first question is ready, the rest keep streaming in
+                game.state = GameState.PLAYING
+                game.start_round()
+                arm_round_timer(game)
+
+                # SECURE BROADCAST: public payload only (no answer key)
+                await manager.broadcast({
+                    "type": "NEW_QUESTION",
+                    "question": game.questions[0].public,
+                    "index": 0,
+                    "total": game.total_questions,
+                    **game.round_timing()
+                }, room_code)
+    finally:
+        # Propagates cancellation to the scheduler so abandoned rooms stop using quota
+        await stream.aclose()
+
+async def advance_question(game):
+    """NEXT_QUESTION: moves on once the next question has streamed in (or the set is done)"""
+    room_code = game.room_code
+    await game.wait_for_question(game.current_question_index + 1)
+    next_q = game.next_question()
+    if next_q:
+        game.state = GameState.PLAYING
+        arm_round_timer(game)
+        # SECURE BROADCAST
+        await manager.broadcast({
+            "type": "NEW_QUESTION",
+            "question": next_q.public,
+            "index": game.current_question_index,
+            "total": game.total_questions,
+            **game.round_timing()
+        }, room_code)
+        # Only last round's answerers changed (has_answered cleared)
+        await coalescer.flush_now(room_code)
+    else:
+        arm_lobby_timer(game)
+        # Scores went out with the last reveal; clients keep their roster
+        await coalescer.flush_now(room_code)
+        await manager.broadcast({"type": "GAME_OVER"}, room_code)
+
+async def flush_room_updates(room_code: str):
+    """One coalesced PLAYER_DELTA: players changed since the last version + answer progress"""
+    game = game_manager.get_game(room_code)
+    if game is None:
+        return
+    delta = game.roster_delta()
+    if delta:
+        await manager.broadcast({
+            "type": "PLAYER_DELTA",
+            **delta,
+            "answered": game.answered_count,
+            "connected": game.connected_count
+        }, room_code)
+
+coalescer = UpdateCoalescer(flush_room_updates)
+
+def spectator_view(room_code: str):
+    """What spectators see: a summary, never the full roster (that's O(players) per frame)"""
+    game = game_manager.get_game(room_code)
+    if game is None:
+        return None
+    view = {
+        "type": "SPECTATOR_VIEW",
+        "room": room_code,
+        "state": game.state,
+        "players": {"total": len(game.players), "connected": game.connected_count},
+        "answered": game.answered_count,
+        "leaderboard": game.leaderboard.top(SPECTATOR_LEADERBOARD_SIZE)
     }
+    if game.state == GameState.GENERATING:
+        view["ready"] = len(game.questions)
+        view["total"] = game.expected_questions
+    elif game.state in (GameState.PLAYING, GameState.REVEAL) and game.questions:
+        current_q = game.questions[game.current_question_index]
+        # Same rule as players: no answer key until the reveal
+        if game.state == GameState.REVEAL:
+            view["question"] = current_q.full
+        else:
+            view["question"] = current_q.public
+            view.update(game.round_timing())
+        view["index"] = game.current_question_index
+        view["total"] = game.total_questions
+    return view
 
-def get_full_question(q: Union[dict, object]) -> dict:
-    """Returns everything (used only for REVEAL phase)"""
-    if hasattr(q, "dict"): 
-        q = q.dict()
-    # Ensure all required fields exist
-    if not isinstance(q, dict):
-        return {"question": "", "options": [], "correct_index": 0, "explanation": ""}
-    return q
+# Viewers live on their own fan-out tier; every room broadcast just marks the room for it
+spectators = SpectatorHub(spectator_view, node=cluster)
+manager.on_broadcast = spectators.mark
+
+async def reveal_round(game, timed_out: bool = False):
+    """Ends the round (everyone answered, or the deadline hit): scores it and sends the answer key.
+    No-op unless the round is live."""
+    if game.state != GameState.PLAYING:
+        return
+    game.cancel_round_timer()
+    game.calculate_scores()
+    game.state = GameState.REVEAL
+    
+    # New scores first, as a delta of this round's answerers, then the answer key.
+    # Questions were validated at ingest, so the key is always there.
+    await coalescer.flush_now(game.room_code)
+    await manager.broadcast({
+        "type": "ROUND_REVEAL",
+        **game.questions[game.current_question_index].reveal,
+        "timed_out": timed_out
+    }, game.room_code)
 # -----------------------
 
-@app.get("/")
+@router.get("/")
 def read_root():
     return {"status": "QuizPortal API is running"}
 
-@app.post("/create-room")
-def create_room():
-    room_code = game_manager.create_game()
+@router.post("/create-room")
+async def create_room():
+    # async on purpose: runs on the event loop, which owns the timer wheel and the journal
+    try:
+        room_code = game_manager.create_game()
+    except RoomLimitError:
+        raise HTTPException(status_code=503, detail="Server is full, try again later")
+    arm_lobby_timer(game_manager.get_game(room_code))
     return {"room_code": room_code}
 
-@app.get("/check-room/{room_code}")
-def check_room(room_code: str):
+def room_info(room_code: str):
     game = game_manager.get_game(room_code)
     if not game:
-        raise HTTPException(status_code=404, detail="Room not found")
+        return None
     return {"exists": True, "players": len(game.players)}
 
-@app.websocket("/ws/{room_code}/{player_name}")
+cluster.register("room_info", room_info)
+
+@router.get("/check-room/{room_code}")
+async def check_room(room_code: str):
+    # The room may live on another worker; ask its owner
+    try:
+        info = await cluster.call(cluster.owner_of(room_code), "room_info", room_code=room_code)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Room server is not responding")
+    if not info:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return info
+
+def document_access(room_code: str, player_id: str) -> str:
+    game = game_manager.get_game(room_code)
+    if not game:
+        return "missing"
+    player = game.players.get(player_id)
+    if not player or not player.is_host:
+        return "forbidden"
+    return "ok"
+
+def attach_document(room_code: str, player_id: str, document: dict):
+    access = document_access(room_code, player_id)
+    if access == "ok":
+        game = game_manager.get_game(room_code)
+        game.document = Document.from_dict(document)
+        game.touch()
+    return access
+
+cluster.register("document_access", document_access)
+cluster.register("attach_document", attach_document)
+
+async def call_document_owner(room_code: str, name: str, **kwargs):
+    try:
+        result = await cluster.call(cluster.owner_of(room_code), name, room_code=room_code, **kwargs)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Room server is not responding")
+    if result == "missing":
+        raise HTTPException(status_code=404, detail="Room not found")
+    if result == "forbidden":
+        raise HTTPException(status_code=403, detail="Only the host can upload a document")
+
+@router.post("/rooms/{room_code}/document")
+async def upload_document(room_code: str, player_id: str, request: Request):
+    """
+    Host uploads the text for "document" mode (raw UTF-8 body, any size up to
+    DOCUMENT_MAX_BYTES). It's chunked as it streams in, so only the kept chunks
+    are ever in memory, then handed to the room's owner.
+    """
+    # Cheap checks first: don't read 20 MB for a room that doesn't exist or a non-host
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > DOCUMENT_MAX_BYTES:
+        raise HTTPException(status_code=413, detail="Document is too large")
+    await call_document_owner(room_code, "document_access", player_id=player_id)
+
+    chunker = DocumentChunker()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    received = 0
+    async for body in request.stream():
+        received += len(body)
+        if received > DOCUMENT_MAX_BYTES:
+            raise HTTPException(status_code=413, detail="Document is too large")
+        chunker.feed(decoder.decode(body))
+    chunker.feed(decoder.decode(b"", final=True))
+    document = chunker.finish()
+    if not document.chunks:
+        raise HTTPException(status_code=400, detail="Document is empty")
+
+    # Checked again: the host may have left while the body streamed in
+    await call_document_owner(room_code, "attach_document", player_id=player_id, document=document.to_dict())
+    return {"title": document.title, "sections": len(document.sections),
+            "chunks": len(document.chunks), "total_chunks": document.total_chunks}
+
+@router.get("/generation-stats")
+def generation_stats():
+    """Queue depth / wait times of the shared generation scheduler, and the providers' breakers"""
+    stats = services.gemini.scheduler.stats_snapshot() if services.gemini else {}
+    breakers = getattr(services.question_provider, "breakers", {})
+    stats["providers"] = {name: breaker.state for name, breaker in breakers.items()}
+    return stats
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@router.websocket("/spectate/{room_code}")
+async def spectator_endpoint(websocket: WebSocket, room_code: str):
+    """Read-only view of a room. Spectators never join the game, so they don't hold up a round."""
+    if cluster.is_local(room_code):
+        exists = game_manager.get_game(room_code) is not None
+    else:
+        try:
+            exists = bool(await cluster.call(cluster.owner_of(room_code), "room_info", room_code=room_code))
+        except asyncio.TimeoutError:
+            exists = False
+    if not exists:
+        await websocket.close(code=4000)
+        return
+    try:
+        viewer = await spectators.attach(websocket, room_code)
+    except SpectatorLimitError:
+        await websocket.close(code=1013)
+        return
+    try:
+        while True:
+            # Nothing to say to us; this just notices the disconnect
+            await websocket.receive_text()
+    except Exception:
+        pass  # client left, or we closed it (room evicted / too slow)
+    finally:
+        spectators.detach(viewer)
+
+@router.websocket("/ws/{room_code}/{player_name}")
 async def websocket_endpoint(websocket: WebSocket, room_code: str, player_name: str):
+    if not cluster.is_local(room_code):
+        # Another worker owns this room: tunnel the socket to it
+        await cluster.proxy(websocket, room_code, player_name)
+        return
+    await run_session(websocket, room_code, player_name)
+
+async def run_session(websocket, room_code: str, player_name: str):
+    """One player's session. `websocket` is a Starlette WebSocket or a cluster RemoteWebSocket."""
     game = game_manager.get_game(room_code)
     if not game:
         await websocket.close(code=4000)
@@ -93,178 +554,133 @@ async def websocket_endpoint(websocket: WebSocket, room_code: str, player_name:
 
     player_id = player_name
     game.add_player(player_id, player_name)
+    game.touch()
     
-    await manager.connect(websocket, room_code)
+    # JSON unless the client offered the binary subprotocol; every send below goes through its codec
+    codec, subprotocol = negotiate_socket(websocket)
+    await manager.connect(websocket, room_code, codec, subprotocol)
     
-    await manager.broadcast({
-        "type": "PLAYER_UPDATE",
-        "players": [p.dict() for p in game.players.values()]
-    }, room_code)
+    # Newcomer gets the full roster, everyone else just the delta
+    await manager.send_personal({"type": "PLAYER_UPDATE", **game.roster_resync()}, websocket)
+    coalescer.request(room_code)
 
     # --- CATCH-UP LOGIC (SECURED) ---
     if game.state in [GameState.PLAYING, GameState.REVEAL]:
         current_q = game.questions[game.current_question_index]
         
-        # If REVEAL, send everything. If PLAYING, send only public data.
-        if game.state == GameState.REVEAL:
-            question_payload = get_full_question(current_q)
-        else:
-            question_payload = get_public_question(current_q)
-
-        await websocket.send_json({
+        # If REVEAL, send everything. If PLAYING, send only public data. Both prebuilt at ingest.
+        await manager.send_personal({
             "type": "NEW_QUESTION",
-            "question": question_payload,
+            "question": current_q.full if game.state == GameState.REVEAL else current_q.public,
             "index": game.current_question_index,
-            "total": len(game.questions)
-        })
+            "total": game.total_questions,
+            **game.round_timing()
+        }, websocket)
 
         player = game.players.get(player_id)
         if player and player.has_answered:
-            await websocket.send_json({
+            await manager.send_personal({
                 "type": "ANSWER_ACK",
                 "correct": None 
-            })
+            }, websocket)
 
         if game.state == GameState.REVEAL:
              # If reconnecting during reveal, send the answer key immediately
-             full_q_data = get_full_question(current_q)
-             await websocket.send_json({
+             await manager.send_personal({
                 "type": "ROUND_REVEAL",
-                "players": [p.dict() for p in game.players.values()],
-                "correct_index": full_q_data['correct_index'],
-                "explanation": full_q_data.get('explanation', '')
-            })
+                **game.roster_resync(),
+                **current_q.reveal
+            }, websocket)
+
+    if game.state == GameState.PLAYING and game.check_all_answered():
+        # Restored room: everyone back so far had answered before the restart, and
+        # without a time limit nothing else would end the round
+        await reveal_round(game)
 
     try:
         while True:
             data = await websocket.receive_json()
+            game.touch()
             action = data.get("action")
             payload = data.get("payload")
 
             if action == "START_GAME":
+                # GENERATING doubles as the lock against a second start
+                if game.state == GameState.GENERATING or game.is_generating:
+                    continue
                 game.state = GameState.GENERATING
+                game.cancel_lobby_timer()
+                await coalescer.flush_now(room_code)
                 await manager.broadcast({"type": "STATUS_UPDATE", "state": "GENERATING"}, room_code)
                 
                 topic = payload.get("topic", "General Knowledge")
                 mode = payload.get("mode", "topic")
-                questions = await gemini_service.generate_questions(mode, topic)
-                game.questions = questions
-                game.state = GameState.PLAYING
-                
-                for p in game.players.values(): p.has_answered = False
-
-                if questions:
-                    # SECURE BROADCAST: Use public question only
-                    await manager.broadcast({
-                        "type": "NEW_QUESTION",
-                        "question": get_public_question(questions[0]), 
-                        "index": 0,
-                        "total": len(questions)
-                    }, room_code)
+                try:
+                    time_limit = float(payload.get("time_limit") or ROUND_TIME_LIMIT)
+                except (TypeError, ValueError):
+                    time_limit = ROUND_TIME_LIMIT
+                game.set_time_limit(min(max(time_limit, 0.0), MAX_ROUND_TIME_LIMIT))
+                game.begin_generation(QUESTION_COUNT)
+                # Runs in the background so this socket keeps handling RESET_LOBBY / disconnects
+                game.generation_task = spawn(run_generation(game, mode, topic))
 
             elif action == "SUBMIT_ANSWER":
                 answer_index = payload.get("index")
                 game.submit_answer(player_id, answer_index)
                 
-                await websocket.send_json({
+                await manager.send_personal({
                     "type": "ANSWER_ACK",
                     "correct": None 
-                })
-
-                await manager.broadcast({
-                    "type": "PLAYER_UPDATE",
-                    "players": [p.dict() for p in game.players.values()]
-                }, room_code)
+                }, websocket)
 
                 if game.check_all_answered():
-                    game.calculate_scores()
-                    game.state = GameState.REVEAL
-                    
-                    # Now we send the answer key
-                    try:
-                        current_q_obj = game.questions[game.current_question_index]
-                        full_data = get_full_question(current_q_obj)
-                        
-                        # Ensure required fields exist
-                        correct_index = full_data.get('correct_index')
-                        if correct_index is None:
-                            print(f"ERROR: Question missing correct_index. Question data: {full_data}")
-                            correct_index = 0
-                        
-                        await manager.broadcast({
-                            "type": "ROUND_REVEAL",
-                            "players": [p.dict() for p in game.players.values()],
-                            "correct_index": correct_index,
-                            "explanation": full_data.get('explanation', '')
-                        }, room_code)
-                    except Exception as e:
-                        print(f"ERROR in ROUND_REVEAL: {e}")
-                        await manager.broadcast({
-                            "type": "ROUND_REVEAL",
-                            "players": [p.dict() for p in game.players.values()],
-                            "correct_index": 0,
-                            "explanation": "Error retrieving answer"
-                        }, room_code)
+                    await reveal_round(game)
+                else:
+                    # Batched: one PLAYER_DELTA per tick, however fast answers come in
+                    coalescer.request(room_code)
 
             elif action == "NEXT_QUESTION":
-                next_q = game.next_question()
-                if next_q:
-                    game.state = GameState.PLAYING
-                    # SECURE BROADCAST
-                    await manager.broadcast({
-                        "type": "NEW_QUESTION",
-                        "question": get_public_question(next_q),
-                        "index": game.current_question_index,
-                        "total": len(game.questions)
-                    }, room_code)
-                    
-                    await manager.broadcast({
-                        "type": "PLAYER_UPDATE",
-                        "players": [p.dict() for p in game.players.values()]
-                    }, room_code)
-                else:
-                    await manager.broadcast({
-                        "type": "GAME_OVER",
-                        "players": [p.dict() for p in game.players.values()]
-                    }, room_code)
+                # Next question may still be streaming in; wait for it off the receive loop
+                if game.advance_task is None or game.advance_task.done():
+                    game.advance_task = spawn(advance_question(game))
             
             elif action == "RESET_LOBBY":
-                game.state = GameState.WAITING
-                game.questions = []
-                game.current_question_index = 0
-                for p in game.players.values():
-                    p.score = 0
-                    p.has_answered = False
+                game.reset()
+                game.cancel_round_timer()
+                arm_lobby_timer(game)
                 
                 await manager.broadcast({
                     "type": "STATUS_UPDATE",
                     "state": "WAITING"
                 }, room_code)
 
-                await manager.broadcast({
-                    "type": "PLAYER_UPDATE",
-                    "players": [p.dict() for p in game.players.values()]
-                }, room_code)
+                # Only players who had points or an answer changed
+                await coalescer.flush_now(room_code)
+
+            elif action == "RESYNC":
+                # Client missed a roster version; resend the full list to it only
+                await manager.send_personal({"type": "PLAYER_UPDATE", **game.roster_resync()}, websocket)
 
-    except WebSocketDisconnect:
+    except (WebSocketDisconnect, RemoteDisconnect):
         manager.disconnect(websocket, room_code)
         game.handle_disconnect(player_id)
-        
-        await manager.broadcast({
-            "type": "PLAYER_UPDATE",
-            "players": [p.dict() for p in game.players.values()]
-        }, room_code)
+        game.touch()
+
+        if not game.has_connected_players():
+            # Nobody left to play: don't keep spending quota on this room
+            game.cancel_generation()
+            if game.state == GameState.GENERATING:
+                # Cancelled before the first question: back to the lobby, or a rejoin could never start
+                game.state = GameState.WAITING
+                arm_lobby_timer(game)
+                await manager.broadcast({"type": "STATUS_UPDATE", "state": "WAITING"}, room_code)
         
         if game.state == GameState.PLAYING and game.check_all_answered():
-            game.state = GameState.REVEAL
-            
-            # EDGE CASE: Secure reveal on disconnect
-            current_q_obj = game.questions[game.current_question_index]
-            full_data = get_full_question(current_q_obj)
+            # EDGE CASE: last player we were waiting for left
+            await reveal_round(game)
+        else:
+            coalescer.request(room_code)
 
-            await manager.broadcast({
-                "type": "ROUND_REVEAL",
-                "players": [p.dict() for p in game.players.values()],
-                "correct_index": full_data['correct_index'],
-                "explanation": full_data.get('explanation', '')
-            }, room_code)
\ No newline at end of file
+# `uvicorn backend.main:app` and the cluster launcher; still cheap, services start in the lifespan
+app = create_app()
+startup_seconds["import"] = time.perf_counter() - _import_started
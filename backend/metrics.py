@@ -0,0 +1,266 @@
+import os
+import math
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Set METRICS_ENABLED=0 to turn every hook into a flag check and nothing else
+ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, *values):
+        """Drops one label set (e.g. a room that no longer exists)"""
+        self._children.pop(tuple(str(v) for v in values), None)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type_name}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key, child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class _CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        if ENABLED:
+            self.value += amount
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        if ENABLED:
+            self.labels().inc(amount)
+
+
+class _GaugeChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        if ENABLED:
+            self.value = value
+
+
+class Gauge(_Metric):
+    """Set directly, or give it a callback that's only evaluated at scrape time"""
+    type_name = "gauge"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 callback: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None):
+        super().__init__(name, help_text, labelnames)
+        self.callback = callback
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        if ENABLED:
+            self.labels().set(value)
+
+    def render(self) -> List[str]:
+        if self.callback is not None:
+            # Rebuild from scratch so label sets that went away (e.g. no FINISHED rooms) disappear
+            self._children = {}
+            for key, value in self.callback().items():
+                self.labels(*key).value = value
+        return super().render()
+
+
+class _HistogramChild:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        if not ENABLED:
+            return
+        self.sum += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        if ENABLED:
+            self.labels().observe(value)
+
+    @contextmanager
+    def time(self, *label_values):
+        if not ENABLED:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.labels(*label_values).observe(time.perf_counter() - start)
+
+    def _render_child(self, key, child) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(child.buckets, child.counts):
+            cumulative += count
+            le = f'le="{_format_value(bound)}"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+        inf = 'le="+Inf"'
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf)} {child.count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {child.count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Prometheus text exposition format (0.0.4)"""
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, help_text: str, labelnames: Iterable[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, help_text, labelnames))
+
+
+def gauge(name: str, help_text: str, labelnames: Iterable[str] = (), callback=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help_text, labelnames, callback))
+
+
+def histogram(name: str, help_text: str, labelnames: Iterable[str] = (),
+              buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, help_text, labelnames, buckets))
+
+
+# --- Hot-path metrics (shared by all modules) ---
+GENERATION_SECONDS = histogram(
+    "quiz_generation_seconds", "Upstream question generation time", ["kind"])
+GENERATION_FIRST_QUESTION_SECONDS = histogram(
+    "quiz_generation_first_question_seconds", "Time until the first streamed question arrived")
+GENERATION_FAILURES = counter(
+    "quiz_generation_failures_total", "Failed upstream generation calls", ["kind"])
+GENERATION_QUEUE_WAIT_SECONDS = histogram(
+    "quiz_generation_queue_wait_seconds", "Time spent waiting for the rate limiter / a concurrency slot")
+GENERATION_COALESCED = counter(
+    "quiz_generation_coalesced_total", "Requests that joined an identical in-flight generation")
+PROVIDER_RESULTS = counter(
+    "quiz_provider_results_total", "Question provider calls by outcome (won, failed, empty, cancelled, skipped)",
+    ["provider", "outcome"])
+PROVIDER_HEDGES = counter(
+    "quiz_provider_hedges_total", "Backup calls started because the earlier providers were slow", ["provider"])
+DEDUPE_DROPPED = counter(
+    "quiz_dedupe_dropped_total", "Near-duplicate questions dropped", ["where"])
+DEDUPE_REFILLS = counter(
+    "quiz_dedupe_refills_total", "Extra provider requests for questions dropped as duplicates")
+QUESTIONS_REJECTED = counter(
+    "quiz_questions_rejected_total", "Generated questions dropped at ingest as malformed")
+DOCUMENT_CHUNKS = counter(
+    "quiz_document_chunks_total", "Document chunks turned into candidate questions")
+
+BROADCAST_SECONDS = histogram(
+    "quiz_broadcast_seconds", "Time to encode and fan a message out to a room's queues",
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+BROADCAST_RECIPIENTS = counter(
+    "quiz_broadcast_recipients_total", "Frames queued by broadcasts")
+ROOM_MESSAGES = counter(
+    "quiz_room_messages_total", "Broadcast messages per room", ["room"])
+WS_SENT_BYTES = counter(
+    "quiz_ws_sent_bytes_total", "Payload bytes queued to websockets (before permessage-deflate)", ["codec"])
+SLOW_CONSUMER_DROPS = counter(
+    "quiz_ws_dropped_messages_total", "Messages dropped for slow consumers")
+SLOW_CONSUMER_KICKS = counter(
+    "quiz_ws_slow_consumer_disconnects_total", "Clients disconnected for being too slow")
+
+SPECTATOR_FRAMES = counter(
+    "quiz_spectator_frames_total", "Room views rendered and fanned out to spectators")
+SPECTATOR_SKIPPED_FRAMES = counter(
+    "quiz_spectator_skipped_frames_total", "Frames a slow spectator skipped (replaced by a newer one)")
+SPECTATOR_FANOUT_SECONDS = histogram(
+    "quiz_spectator_fanout_seconds", "Time to hand one frame to all of a room's spectators",
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
+
+STATE_TRANSITIONS = counter(
+    "quiz_room_state_transitions_total", "GameLobby state changes", ["state"])
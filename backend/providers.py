@@ -0,0 +1,422 @@
+"""
+Where questions come from when the bank can't serve them.
+
+HedgedProvider puts the upstream models (GeminiService, optionally a backup
+model) and the OfflineProvider behind the interface QuestionBank already uses.
+A room that is still waiting for its first question after PROVIDER_HEDGE_AFTER
+seconds also asks the next upstream, and after PROVIDER_OFFLINE_AFTER the
+offline provider; the first to answer wins and the others are cancelled. Each
+upstream sits behind a circuit breaker, so a provider that's down costs nothing
+until it's retried. That caps how long START_GAME can wait for a first question.
+"""
+import os
+import json
+import math
+import time
+import random
+import asyncio
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from . import metrics
+from .generation_scheduler import BACKGROUND_ROOM
+from .json_stream import is_valid_question
+from .question_bank import normalize_topic
+
+# --- Provider Settings ---
+# Seconds without a first question before the next upstream is asked as well
+HEDGE_AFTER = float(os.getenv("PROVIDER_HEDGE_AFTER", "5"))
+# ... and before the offline provider is (right away when every upstream failed or is open)
+OFFLINE_AFTER = float(os.getenv("PROVIDER_OFFLINE_AFTER", "15"))
+# Failures in a row that open a breaker, and how long it stays open before one trial call
+CIRCUIT_FAILURES = int(os.getenv("PROVIDER_CIRCUIT_FAILURES", "3"))
+CIRCUIT_RESET = float(os.getenv("PROVIDER_CIRCUIT_RESET", "30"))
+OFFLINE_DATASET_PATH = os.getenv(
+    "OFFLINE_DATASET_PATH",
+    os.path.join(os.path.dirname(__file__), "data", "offline_questions.json")
+)
+
+_SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "ta", "vo", "si", "pe", "da", "gu", "ri", "zo", "fa", "be")
+
+
+class ProviderUnavailableError(Exception):
+    pass
+
+
+def shuffle_answers(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Shuffle answer positions in each question to randomize correct_index"""
+    shuffled_questions = []
+
+    for q in questions:
+        # Get the correct answer
+        correct_index = q.get('correct_index', 0)
+        options = q.get('options', [])
+
+        if correct_index >= len(options):
+            correct_index = 0
+
+        correct_answer = options[correct_index]
+
+        # Shuffle all options
+        shuffled_options = options.copy()
+        random.shuffle(shuffled_options)
+
+        # Update question with shuffled data
+        shuffled_q = q.copy()
+        shuffled_q['options'] = shuffled_options
+        shuffled_q['correct_index'] = shuffled_options.index(correct_answer)
+
+        shuffled_questions.append(shuffled_q)
+
+    return shuffled_questions
+
+
+def load_dataset(path: str = OFFLINE_DATASET_PATH) -> List[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"ERROR loading offline questions from {path}: {e}")
+        return []
+    return [q for q in data if is_valid_question(q)]
+
+
+class QuestionProvider:
+    """What QuestionBank talks to: request_questions, stream_questions and the helpers below"""
+
+    name = "provider"
+
+    def shuffle_answers(self, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Answer order for questions this provider hands out (QuestionBank uses it for cache hits)"""
+        return shuffle_answers(questions)
+
+    def error_questions(self, input_text: str, error: Exception) -> List[Dict[str, Any]]:
+        """Placeholder 'question' shown when generation fails"""
+        return [
+            {
+                "question": f"The AI failed to generate questions for '{input_text}'. Try a different topic.",
+                "options": ["Ok", "Retry", "Sad", "Bug"],
+                "correct_index": 0,
+                "explanation": f"Error detail: {str(error)}"
+            }
+        ]
+
+    async def generate_questions(self, mode: str, input_text: str, count: int = 10) -> List[Dict[str, Any]]:
+        try:
+            return await self.request_questions(mode, input_text, count)
+        except Exception as e:
+            print(f"CRITICAL ERROR in {self.name}: {e}")
+            return self.error_questions(input_text, e)
+
+    async def request_questions(self, mode: str, input_text: str, count: int = 10,
+                                room: str = BACKGROUND_ROOM) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    async def stream_questions(self, mode: str, input_text: str, count: int = 10,
+                               room: str = BACKGROUND_ROOM) -> AsyncIterator[Dict[str, Any]]:
+        """Providers that can't stream hand over the whole set at once"""
+        for q in await self.request_questions(mode, input_text, count, room=room):
+            yield q
+
+
+class CircuitBreaker:
+    """
+    Closed until `failures` calls in a row fail, then open: the provider is
+    skipped for `reset_after` seconds. After that one trial call goes through
+    (half-open); it closes the breaker again or reopens it.
+    """
+
+    def __init__(self, failures: int = CIRCUIT_FAILURES, reset_after: float = CIRCUIT_RESET,
+                 clock: Callable[[], float] = time.monotonic):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.clock = clock
+        self.consecutive = 0
+        self.opened_at: Optional[float] = None
+        self._trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self.clock() - self.opened_at >= self.reset_after:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.consecutive = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.consecutive += 1
+        self._trial = False
+        if self.opened_at is not None or self.consecutive >= self.failures:
+            if self.opened_at is None:
+                print(f"DEBUG: Circuit opened after {self.consecutive} failures")
+            self.opened_at = self.clock()
+
+    def release(self):
+        """The call ended without a verdict (lost a race, or came back empty)"""
+        self._trial = False
+
+
+class OfflineProvider(QuestionProvider):
+    """
+    Questions without an upstream: the bank's cached questions for the topic,
+    then the bundled dataset (questions tagged with a word of the topic first,
+    then general ones). Dataset questions are marked "offline" so the bank
+    doesn't file them under the topic.
+
+    With neither a bank nor a dataset it makes questions up, deterministically:
+    the stand-in for Gemini in tests and benchmarks. Questions then depend only
+    on (mode, input_text, index); `latency` is the time to the first question
+    and `per_question` the gap between streamed questions.
+    """
+
+    name = "offline"
+
+    def __init__(self, bank=None, dataset: Optional[List[Dict[str, Any]]] = None,
+                 latency: float = 0.0, per_question: float = 0.0, seed: int = 0):
+        self.bank = bank
+        self.dataset = dataset
+        self.latency = latency
+        self.per_question = per_question
+        self.seed = seed
+        self.calls = 0
+
+    @property
+    def synthetic(self) -> bool:
+        return self.bank is None and self.dataset is None
+
+    def make_question(self, mode: str, input_text: str, index: int) -> Dict[str, Any]:
+        rng = random.Random(f"{self.seed}:{mode}:{input_text}:{index}")
+
+        def word() -> str:
+            return "".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+        # Made-up words, so questions don't look alike to the dedupe index
+        correct = rng.randrange(4)
+        return {
+            "question": f"#{index + 1}: which {word()} is the {word()} of {word()} {word()}?",
+            "options": [word().capitalize() for _ in range(4)],
+            "correct_index": correct,
+            "explanation": f"Generated for '{input_text}': option {chr(65 + correct)} is the answer."
+        }
+
+    def shuffle_answers(self, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        if self.synthetic:
+            # Deterministic on purpose: keep answer positions as generated
+            return [dict(q) for q in questions]
+        return shuffle_answers(questions)
+
+    async def pick(self, mode: str, input_text: str, count: int) -> List[Dict[str, Any]]:
+        if self.synthetic:
+            return [self.make_question(mode, input_text, i) for i in range(count)]
+        if mode != "topic":
+            return []
+
+        picked = await self.bank.cached_questions(mode, input_text, count) if self.bank is not None else []
+        if len(picked) < count and self.dataset:
+            words = set(normalize_topic(input_text).split())
+            rng = random.Random(f"{self.seed}:{input_text}:{self.calls}")
+            on_topic = [q for q in self.dataset if words & set(q.get("tags", ()))]
+            general = [q for q in self.dataset if not words & set(q.get("tags", ()))]
+            rng.shuffle(on_topic)
+            rng.shuffle(general)
+            for q in (on_topic + general)[:count - len(picked)]:
+                question = {k: v for k, v in q.items() if k != "tags"}
+                question["offline"] = True
+                picked.append(question)
+        return self.shuffle_answers(picked)
+
+    async def request_questions(self, mode: str, input_text: str, count: int = 10,
+                                room: str = BACKGROUND_ROOM) -> List[Dict[str, Any]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency + self.per_question * max(count - 1, 0))
+        return await self.pick(mode, input_text, count)
+
+    async def stream_questions(self, mode: str, input_text: str, count: int = 10,
+                               room: str = BACKGROUND_ROOM) -> AsyncIterator[Dict[str, Any]]:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        for i, q in enumerate(await self.pick(mode, input_text, count)):
+            if i:
+                await asyncio.sleep(self.per_question)
+            yield q
+
+
+class HedgedProvider(QuestionProvider):
+    """
+    Upstreams in order of preference, each behind a CircuitBreaker, plus an
+    optional offline provider of last resort (see the module docstring).
+    Background top-ups (room=BACKGROUND_ROOM) aren't in a hurry: they only move
+    on to the next upstream when one fails, and never use the offline provider.
+    """
+
+    name = "hedged"
+
+    def __init__(self, upstreams: List[QuestionProvider], offline: Optional[QuestionProvider] = None,
+                 hedge_after: float = HEDGE_AFTER, offline_after: float = OFFLINE_AFTER,
+                 breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker):
+        self.upstreams = list(upstreams)
+        self.offline = offline
+        self.hedge_after = hedge_after
+        self.offline_after = offline_after
+        self.breakers: Dict[str, CircuitBreaker] = {p.name: breaker_factory() for p in self.upstreams}
+
+    def _plan(self, room: str, exclude=()) -> List[Tuple[QuestionProvider, float]]:
+        """(provider, seconds after the start it joins in), in order"""
+        hedge = room != BACKGROUND_ROOM
+        upstreams = [p for p in self.upstreams if p not in exclude]
+        plan = [(p, 0.0 if i == 0 else (self.hedge_after * i if hedge else math.inf))
+                for i, p in enumerate(upstreams)]
+        if hedge and self.offline is not None and self.offline not in exclude:
+            plan.append((self.offline, self.offline_after))
+        return plan
+
+    async def _race(self, plan: List[Tuple[QuestionProvider, float]],
+                    open_iter: Callable[[QuestionProvider], AsyncIterator]):
+        """
+        Starts the plan's first provider, and each next one once its delay has
+        passed or nothing else is running. Returns (provider, iterator, first item)
+        of the first to produce something, or None if they all came back empty.
+        """
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        plan = list(plan)
+        running: Dict[asyncio.Future, Tuple[QuestionProvider, AsyncIterator]] = {}
+        error: Optional[Exception] = None
+        launched = False
+
+        def launch_due(force: bool):
+            nonlocal launched
+            while plan:
+                provider, delay = plan[0]
+                if not force and loop.time() - started < delay:
+                    return
+                plan.pop(0)
+                breaker = self.breakers.get(provider.name)
+                if breaker is not None and not breaker.allow():
+                    metrics.PROVIDER_RESULTS.labels(provider.name, "skipped").inc()
+                    continue
+                if running:
+                    metrics.PROVIDER_HEDGES.labels(provider.name).inc()
+                    print(f"DEBUG: Hedging generation with {provider.name}")
+                iterator = open_iter(provider).__aiter__()
+                running[asyncio.ensure_future(iterator.__anext__())] = (provider, iterator)
+                launched = True
+                force = False
+
+        try:
+            launch_due(force=True)
+            while running:
+                timeout = None
+                if plan and plan[0][1] != math.inf:
+                    timeout = max(0.0, started + plan[0][1] - loop.time())
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    provider, iterator = running.pop(task)
+                    breaker = self.breakers.get(provider.name)
+                    try:
+                        first = task.result()
+                    except StopAsyncIteration:
+                        metrics.PROVIDER_RESULTS.labels(provider.name, "empty").inc()
+                        if breaker is not None:
+                            breaker.release()
+                        continue
+                    except Exception as e:
+                        print(f"DEBUG: Provider {provider.name} failed: {e!r}")
+                        metrics.PROVIDER_RESULTS.labels(provider.name, "failed").inc()
+                        if breaker is not None:
+                            breaker.record_failure()
+                        error = e
+                        continue
+                    metrics.PROVIDER_RESULTS.labels(provider.name, "won").inc()
+                    if breaker is not None:
+                        breaker.record_success()
+                    return provider, iterator, first
+                launch_due(force=not running)
+        finally:
+            for task, (provider, iterator) in running.items():
+                await self._discard(provider, task, iterator)
+
+        if error is not None:
+            raise error
+        if not launched:
+            raise ProviderUnavailableError("Every question provider is unavailable")
+        return None
+
+    async def _discard(self, provider: QuestionProvider, task: asyncio.Future, iterator: AsyncIterator):
+        """Cancels a provider that lost the race (stops its upstream call and frees its quota slot)"""
+        metrics.PROVIDER_RESULTS.labels(provider.name, "cancelled").inc()
+        breaker = self.breakers.get(provider.name)
+        if breaker is not None:
+            breaker.release()
+        task.cancel()
+        await asyncio.wait([task])
+        try:
+            await iterator.aclose()
+        except Exception:
+            pass
+
+    async def request_questions(self, mode: str, input_text: str, count: int = 10,
+                                room: str = BACKGROUND_ROOM) -> List[Dict[str, Any]]:
+        async def once(provider):
+            questions = await provider.request_questions(mode, input_text, count, room=room)
+            if questions:
+                yield questions
+
+        result = await self._race(self._plan(room), once)
+        if result is None:
+            return []
+        _, iterator, questions = result
+        await iterator.aclose()
+        return questions
+
+    async def stream_questions(self, mode: str, input_text: str, count: int = 10,
+                               room: str = BACKGROUND_ROOM) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streams from whichever provider produced a first question first. If that
+        one fails halfway, the rest of the set comes from the others.
+        """
+        produced = 0
+        failed = set()
+        while produced < count:
+            try:
+                result = await self._race(
+                    self._plan(room, failed),
+                    lambda p: p.stream_questions(mode, input_text, count - produced, room=room))
+            except Exception:
+                if produced:
+                    return  # a short set beats an error; the bank asks for the rest next time
+                raise
+            if result is None:
+                return
+            provider, iterator, first = result
+            try:
+                yield first
+                produced += 1
+                async for q in iterator:
+                    if produced >= count:
+                        break
+                    yield q
+                    produced += 1
+                return
+            except Exception as e:
+                print(f"DEBUG: Provider {provider.name} failed mid-stream: {e!r}")
+                metrics.PROVIDER_RESULTS.labels(provider.name, "failed").inc()
+                breaker = self.breakers.get(provider.name)
+                if breaker is not None:
+                    breaker.record_failure()
+                failed.add(provider)
+            finally:
+                await iterator.aclose()
@@ -0,0 +1,385 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import asyncio
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+
+from . import metrics
+from .dedupe import NearDuplicateIndex, question_signature
+from .generation_scheduler import BACKGROUND_ROOM
+
+# --- Bank Settings ---
+DEFAULT_DB_PATH = os.getenv(
+    "QUESTION_BANK_PATH",
+    os.path.join(os.path.dirname(__file__), "question_bank.sqlite3")
+)
+BANK_TTL = float(os.getenv("QUESTION_BANK_TTL", str(7 * 24 * 3600)))  # seconds before a pool is refreshed
+LRU_SIZE = int(os.getenv("QUESTION_BANK_LRU_SIZE", "256"))
+# Keep a few games' worth of questions per key so consecutive games don't repeat
+POOL_FACTOR = int(os.getenv("QUESTION_BANK_POOL_FACTOR", "4"))
+# How many times a stream asks the provider again for questions it dropped as duplicates
+DEDUPE_MAX_REFILLS = int(os.getenv("DEDUPE_MAX_REFILLS", "2"))
+# "Served" counters are written in one batch this long after the first unsaved one
+SERVED_FLUSH_DELAY = float(os.getenv("QUESTION_BANK_SERVED_FLUSH", "2"))
+
+
+def normalize_topic(topic: str) -> str:
+    """'  Sejarah  MAKASSAR ' -> 'sejarah makassar'"""
+    return " ".join(topic.lower().split())
+
+
+def worker_db_path(path: str, index: int) -> str:
+    """A cluster worker's own bank file: one SQLite writer per file, no lock contention"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.worker-{index}{ext}"
+
+
+def bank_key(mode: str, topic: str, count: int) -> str:
+    return f"{mode}:{count}:{normalize_topic(topic)}"
+
+
+def fingerprint(question: Dict[str, Any]) -> str:
+    return " ".join(str(question.get("question", "")).lower().split())
+
+
+class BankEntry:
+    """All cached questions for one key, plus how often each was served"""
+
+    def __init__(self, key: str, refreshed_at: float):
+        self.key = key
+        self.refreshed_at = refreshed_at
+        self.questions: Dict[str, Dict[str, Any]] = {}  # fingerprint -> question
+        self.served: Dict[str, int] = {}
+        self.index = NearDuplicateIndex()  # fingerprint -> signature; keeps rewordings out of the pool
+
+    def add(self, question: Dict[str, Any]) -> Optional[str]:
+        fp = fingerprint(question)
+        if not fp or fp in self.questions:
+            return None
+        sig = question_signature(question)
+        if self.index.find(sig) is not None:
+            metrics.DEDUPE_DROPPED.labels("bank").inc()
+            return None
+        self.index.add(fp, sig)
+        self.questions[fp] = question
+        self.served[fp] = 0
+        return fp
+
+    def retire(self, fp: str):
+        del self.questions[fp]
+        del self.served[fp]
+        self.index.remove(fp)
+
+    def pick(self, count: int, seen: Optional[NearDuplicateIndex] = None) -> List[str]:
+        """
+        Least-served first, random among ties, never the same question twice.
+        Skips questions close to one in `seen` (the room's history).
+        """
+        order = sorted(self.questions, key=lambda fp: (self.served[fp], random.random()))
+        if seen is None:
+            return order[:count]
+        picked = []
+        for fp in order:
+            if seen.find(self.index.get(fp)) is None:
+                picked.append(fp)
+                if len(picked) == count:
+                    break
+        return picked
+
+
+class QuestionBank:
+    """
+    Cache in front of the question provider.
+    Memory LRU -> SQLite -> provider. Hits are served instantly and the pool is
+    topped up in the background when it's small or older than the TTL.
+
+    SQLite never runs on the event loop: every query goes through one dedicated
+    thread (which also keeps the connection single-threaded), and "served"
+    counters are batched into one write per SERVED_FLUSH_DELAY.
+    """
+
+    def __init__(self, provider, db_path: str = DEFAULT_DB_PATH, ttl: float = BANK_TTL,
+                 lru_size: int = LRU_SIZE, pool_factor: int = POOL_FACTOR):
+        self.provider = provider
+        self.ttl = ttl
+        self.lru_size = lru_size
+        self.pool_factor = pool_factor
+        self._lru: "OrderedDict[str, BankEntry]" = OrderedDict()
+        self._refreshing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._served_pending: Dict[tuple, int] = {}  # (key, fingerprint) -> increments not written yet
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="question-bank")
+        # Only ever used from the executor's one thread (and here, before it starts)
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " key TEXT NOT NULL, fingerprint TEXT NOT NULL, data TEXT NOT NULL,"
+            " served INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL,"
+            " PRIMARY KEY (key, fingerprint))"
+        )
+        self.db.execute("CREATE TABLE IF NOT EXISTS pools (key TEXT PRIMARY KEY, refreshed_at REAL NOT NULL)")
+        self.db.commit()
+
+    # --- SQLite (runs on the bank's thread) ---
+    async def _db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    def _load_rows(self, key: str):
+        row = self.db.execute("SELECT refreshed_at FROM pools WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return row[0], self.db.execute(
+            "SELECT fingerprint, data, served FROM questions WHERE key = ?", (key,)).fetchall()
+
+    def _write_pool(self, key: str, rows: list, now: float, retired: List[str]):
+        self.db.executemany(
+            "INSERT OR IGNORE INTO questions (key, fingerprint, data, created) VALUES (?, ?, ?, ?)", rows)
+        self.db.execute("INSERT OR REPLACE INTO pools (key, refreshed_at) VALUES (?, ?)", (key, now))
+        if retired:
+            self.db.executemany("DELETE FROM questions WHERE key = ? AND fingerprint = ?",
+                                [(key, fp) for fp in retired])
+        self.db.commit()
+
+    def _write_served(self, pending: Dict[tuple, int]):
+        self.db.executemany(
+            "UPDATE questions SET served = served + ? WHERE key = ? AND fingerprint = ?",
+            [(n, key, fp) for (key, fp), n in pending.items()])
+        self.db.commit()
+
+    def _select_cached(self, mode: str, topic: str, count: int) -> List[str]:
+        keys = [key for (key,) in self.db.execute("SELECT key FROM pools")
+                if key.startswith(f"{mode}:") and key.split(":", 2)[2] == topic]
+        if not keys:
+            return []
+        rows = self.db.execute(
+            f"SELECT data FROM questions WHERE key IN ({','.join('?' * len(keys))})"
+            " ORDER BY served, RANDOM() LIMIT ?", (*keys, count))
+        return [data for (data,) in rows]
+
+    # --- Cache layers ---
+    async def _get_entry(self, key: str) -> Optional[BankEntry]:
+        entry = self._lru.get(key)
+        if entry is not None:
+            self._lru.move_to_end(key)
+            return entry
+
+        loaded = await self._db(self._load_rows, key)
+        if loaded is None:
+            return None
+        if key in self._lru:  # another caller loaded it while we waited
+            return self._lru[key]
+        refreshed_at, rows = loaded
+        entry = BankEntry(key, refreshed_at)
+        for fp, data, served in rows:
+            # Rows banked before dedupe may hold rewordings; they just stay out of memory
+            if entry.add(json.loads(data)) == fp:
+                entry.served[fp] = served + self._served_pending.get((key, fp), 0)
+        self._remember(entry)
+        return entry
+
+    def _remember(self, entry: BankEntry):
+        self._lru[entry.key] = entry
+        self._lru.move_to_end(entry.key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    async def _store(self, key: str, questions: List[Dict[str, Any]], count: int) -> BankEntry:
+        entry = await self._get_entry(key) or BankEntry(key, 0)
+        now = time.time()
+        entry.refreshed_at = now
+        rows = []
+        for q in questions:
+            if q.get("offline"):
+                continue  # stand-ins from the offline dataset, not questions about this topic
+            fp = entry.add(q)
+            if fp:
+                rows.append((key, fp, json.dumps(q), now))
+
+        # TTL refreshes keep adding questions; retire the most-served ones past the cap
+        retired = []
+        max_pool = count * self.pool_factor * 2
+        if len(entry.questions) > max_pool:
+            worn = sorted(entry.questions, key=lambda fp: entry.served[fp], reverse=True)
+            retired = worn[:len(entry.questions) - max_pool]
+            for fp in retired:
+                entry.retire(fp)
+                self._served_pending.pop((key, fp), None)
+        self._remember(entry)
+        await self._db(self._write_pool, key, rows, now, retired)
+        return entry
+
+    def _mark_served(self, entry: BankEntry, fps: List[str]):
+        """In memory now, on disk with the next batch (losing a few counts in a crash is fine)"""
+        for fp in fps:
+            entry.served[fp] += 1
+            pending_key = (entry.key, fp)
+            self._served_pending[pending_key] = self._served_pending.get(pending_key, 0) + 1
+        if fps and self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                SERVED_FLUSH_DELAY, lambda: self._spawn(self.flush_served()))
+
+    async def flush_served(self):
+        self._flush_handle = None
+        if not self._served_pending:
+            return
+        pending, self._served_pending = self._served_pending, {}
+        await self._db(self._write_served, pending)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def close(self):
+        """Stops top-ups, writes pending counters and closes the database"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        await self.flush_served()
+        await self._db(self.db.close)
+        self._executor.shutdown(wait=True)
+
+    # --- Public API ---
+    async def get_questions(self, mode: str, topic: str, count: int = 10,
+                            room: str = BACKGROUND_ROOM) -> List[Dict[str, Any]]:
+        key = bank_key(mode, topic, count)
+        entry = await self._get_entry(key)
+
+        if entry is None or len(entry.questions) < count:
+            # Cold miss: wait for the provider once, then everything after is a hit
+            try:
+                fresh = await self.provider.request_questions(mode, topic, count, room=room)
+            except Exception as e:
+                print(f"CRITICAL ERROR in Question Bank: {e}")
+                if entry and entry.questions:
+                    return self._serve(entry, count)
+                return self.provider.error_questions(topic, e)
+            if not fresh:
+                return []
+            entry = await self._store(key, fresh, count)
+            return self._serve(entry, count)
+
+        print(f"DEBUG: Question bank hit for '{key}' ({len(entry.questions)} cached)")
+        questions = self._serve(entry, count)
+        self._maybe_top_up(entry, mode, topic, count)
+        return questions
+
+    async def stream_questions(self, mode: str, topic: str, count: int = 10, room: str = BACKGROUND_ROOM,
+                               seen: Optional[NearDuplicateIndex] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Like get_questions, but a miss streams questions from the provider one by
+        one as they're generated (and banks them once the stream ends).
+
+        `seen` is the room's history. Questions close to one it already played,
+        or to one earlier in this set, are dropped, and only the missing number
+        is asked for again (up to DEDUPE_MAX_REFILLS times). If the provider
+        keeps repeating itself, history repeats beat a short game.
+        """
+        key = bank_key(mode, topic, count)
+        entry = await self._get_entry(key)
+        batch = NearDuplicateIndex()  # this set so far
+        served = 0
+
+        if entry is not None and entry.questions:
+            cached = self._serve(entry, count, seen)
+            if len(cached) == count:
+                print(f"DEBUG: Question bank hit for '{key}' ({len(entry.questions)} cached)")
+                self._maybe_top_up(entry, mode, topic, count)
+            for q in cached:
+                batch.add(len(batch), question_signature(q))
+                served += 1
+                yield q
+            if served == count:
+                return
+
+        fresh: List[Dict[str, Any]] = []  # everything new, for the bank (history repeats too)
+        repeats: List[Dict[str, Any]] = []
+        refills = 0
+        try:
+            while served < count:
+                dropped = 0
+                stream = self.provider.stream_questions(mode, topic, count - served, room=room)
+                try:
+                    async for q in stream:
+                        sig = question_signature(q)
+                        if batch.find(sig) is not None:
+                            metrics.DEDUPE_DROPPED.labels("batch").inc()
+                            dropped += 1
+                            continue
+                        batch.add(len(batch), sig)
+                        fresh.append(q)
+                        if seen is not None and seen.find(sig) is not None:
+                            metrics.DEDUPE_DROPPED.labels("history").inc()
+                            repeats.append(q)
+                            dropped += 1
+                        elif served < count:
+                            served += 1
+                            yield q
+                finally:
+                    await stream.aclose()
+                if not dropped or refills >= DEDUPE_MAX_REFILLS:
+                    break
+                refills += 1
+                metrics.DEDUPE_REFILLS.inc()
+                print(f"DEBUG: Dropped {dropped} near-duplicates for '{key}', asking for {count - served} more")
+            for q in repeats[:count - served]:
+                served += 1
+                yield q
+            banked, fresh = fresh, []
+            await self._store(key, banked, count)
+        except Exception as e:
+            print(f"CRITICAL ERROR in Question Bank stream: {e}")
+            if not served:
+                fallback = self._serve(entry, count) if entry and entry.questions else None
+                for q in fallback or self.provider.error_questions(topic, e):
+                    yield q
+                return
+        finally:
+            # Consumer stopped early or we failed: still bank what we got, in the
+            # background since the generator may be getting cancelled
+            if fresh:
+                self._spawn(self._store(key, fresh, count))
+
+    async def cached_questions(self, mode: str, topic: str, count: int) -> List[Dict[str, Any]]:
+        """Least-served questions banked for this topic under any count (for the offline provider)"""
+        rows = await self._db(self._select_cached, mode, normalize_topic(topic), count)
+        return [json.loads(data) for data in rows]
+
+    def _serve(self, entry: BankEntry, count: int,
+               seen: Optional[NearDuplicateIndex] = None) -> List[Dict[str, Any]]:
+        fps = entry.pick(count, seen)
+        self._mark_served(entry, fps)
+        return self.provider.shuffle_answers([entry.questions[fp] for fp in fps])
+
+    def _maybe_top_up(self, entry: BankEntry, mode: str, topic: str, count: int):
+        stale = time.time() - entry.refreshed_at > self.ttl
+        if stale or len(entry.questions) < count * self.pool_factor:
+            self._top_up(entry.key, mode, topic, count)
+
+    def _top_up(self, key: str, mode: str, topic: str, count: int):
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def refresh():
+            try:
+                fresh = await self.provider.request_questions(mode, topic, count)
+                await self._store(key, fresh, count)
+                print(f"DEBUG: Question bank topped up '{key}'")
+            except Exception as e:
+                print(f"DEBUG: Question bank top-up failed for '{key}': {e}")
+            finally:
+                self._refreshing.discard(key)
+
+        self._spawn(refresh())
@@ -0,0 +1,83 @@
+"""
+Ingest stage for generated questions.
+
+Whatever a provider returns (dicts from the model, the bank or the offline set,
+a Question model, a journal replay) goes through prepare_question() once, when
+it joins a game. That validates and normalizes it into a PreparedQuestion, which
+can't be changed afterwards and carries the payloads every send needs, already
+built: NEW_QUESTION and spectators get `public` (no answer key), ROUND_REVEAL
+gets `reveal`, catch-up during a reveal gets `full`. Nothing downstream looks
+at raw question data again, so bad model output is dropped at ingest instead of
+breaking the reveal.
+"""
+from typing import Any, Dict, Tuple
+
+MIN_OPTIONS = 2
+MAX_OPTIONS = 6
+
+
+class QuestionError(ValueError):
+    """A generated question we can't show or score"""
+
+
+class PreparedQuestion:
+    __slots__ = ("question", "options", "correct_index", "explanation", "public", "reveal", "full")
+
+    def __init__(self, question: str, options: Tuple[str, ...], correct_index: int, explanation: str = ""):
+        init = object.__setattr__
+        init(self, "question", question)
+        init(self, "options", options)
+        init(self, "correct_index", correct_index)
+        init(self, "explanation", explanation)
+        # Built once; sends put these in messages as they are, so they must never be mutated
+        init(self, "public", {"question": question, "options": list(options)})
+        init(self, "reveal", {"correct_index": correct_index, "explanation": explanation})
+        init(self, "full", {**self.public, **self.reveal})
+
+    def __setattr__(self, name, value):
+        raise AttributeError("PreparedQuestion is immutable")
+
+    def __repr__(self) -> str:
+        return f"PreparedQuestion({self.question!r}, correct={self.correct_index})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Plain dict for the journal and the dedupe index (a copy: safe to mutate)"""
+        return {"question": self.question, "options": list(self.options), **self.reveal}
+
+
+def prepare_question(raw: Any) -> PreparedQuestion:
+    """Validates and normalizes one question. Raises QuestionError."""
+    if isinstance(raw, PreparedQuestion):
+        return raw
+    if hasattr(raw, "dict") and not isinstance(raw, dict):
+        # Pydantic Question (v2 deprecates .dict())
+        raw = raw.model_dump() if hasattr(raw, "model_dump") else raw.dict()
+    if not isinstance(raw, dict):
+        raise QuestionError(f"not a question: {type(raw).__name__}")
+
+    question = raw.get("question")
+    if not isinstance(question, str) or not question.strip():
+        raise QuestionError("missing question text")
+
+    options = raw.get("options")
+    if not isinstance(options, (list, tuple)) or not MIN_OPTIONS <= len(options) <= MAX_OPTIONS:
+        raise QuestionError(f"needs {MIN_OPTIONS}-{MAX_OPTIONS} options")
+    # Models sometimes answer with bare numbers ("1945"); anything else is broken output
+    if not all(isinstance(o, (str, int, float)) and not isinstance(o, bool) for o in options):
+        raise QuestionError("options must be text")
+    options = tuple(str(o).strip() for o in options)
+    if not all(options) or len(set(options)) != len(options):
+        raise QuestionError("empty or repeated options")
+
+    correct_index = raw.get("correct_index")
+    if isinstance(correct_index, str) and correct_index.strip().isdigit():
+        correct_index = int(correct_index)
+    if not isinstance(correct_index, int) or isinstance(correct_index, bool) \
+            or not 0 <= correct_index < len(options):
+        raise QuestionError(f"bad correct_index: {correct_index!r}")
+
+    explanation = raw.get("explanation") or ""
+    if not isinstance(explanation, str):
+        explanation = str(explanation)
+
+    return PreparedQuestion(question.strip(), options, correct_index, explanation.strip())
@@ -0,0 +1,180 @@
+import os
+import glob
+import json
+import time
+import asyncio
+from typing import Dict, List, Optional, Tuple
+
+# --- Persistence Settings ---
+# Empty = rooms live in memory only (a restart loses them)
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "")
+JOURNAL_FLUSH_INTERVAL = float(os.getenv("JOURNAL_FLUSH_MS", "50")) / 1000
+SNAPSHOT_INTERVAL = float(os.getenv("JOURNAL_SNAPSHOT_INTERVAL", "60"))
+SNAPSHOT_EVENTS = int(os.getenv("JOURNAL_SNAPSHOT_EVENTS", "20000"))
+
+
+class RoomJournal:
+    """
+    Append-only event log of room mutations + periodic snapshots.
+
+    record() only appends a line to an in-memory buffer, so the answer path never
+    touches the disk. A background task writes and fsyncs the buffer every
+    `flush_interval` in a worker thread, i.e. one write+fsync per batch.
+
+    Files: journal-<seq>.log segments and snapshot-<seq>.json, where a snapshot
+    covers everything logged before segment <seq>. Recovery = newest snapshot +
+    the segments from its seq on, so restart time is bounded by the snapshot cadence.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL, snapshot_events: int = SNAPSHOT_EVENTS):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.snapshot_interval = snapshot_interval
+        self.snapshot_events = snapshot_events
+        os.makedirs(directory, exist_ok=True)
+        self._buffer: List[str] = []
+        self._events = 0  # since the last snapshot
+        self._segment = self._latest_seq() + 1
+        self._store = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Hot path ---
+    def record(self, room_code: str, op: str, *args):
+        self._buffer.append(json.dumps([room_code, op, *args], separators=(",", ":")))
+        self._events += 1
+
+    # --- Files ---
+    def _path(self, kind: str, seq: int) -> str:
+        ext = "json" if kind == "snapshot" else "log"
+        return os.path.join(self.directory, f"{kind}-{seq:010d}.{ext}")
+
+    def _seqs(self, kind: str) -> List[int]:
+        seqs = []
+        for path in glob.glob(os.path.join(self.directory, f"{kind}-*")):
+            name = os.path.basename(path).split("-", 1)[1].split(".", 1)[0]
+            if name.isdigit() and not path.endswith(".tmp"):
+                seqs.append(int(name))
+        return sorted(seqs)
+
+    def _latest_seq(self) -> int:
+        return max(self._seqs("journal") + self._seqs("snapshot") + [0])
+
+    def _append_lines(self, segment: int, lines: List[str]):
+        with open(self._path("journal", segment), "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _write_snapshot(self, seq: int, rooms: Dict[str, dict]):
+        path = self._path("snapshot", seq)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"segment": seq, "rooms": rooms}, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+        # Everything older is covered by the snapshot now
+        for old in self._seqs("journal"):
+            if old < seq:
+                os.unlink(self._path("journal", old))
+        for old in self._seqs("snapshot"):
+            if old < seq:
+                os.unlink(self._path("snapshot", old))
+
+    # --- Recovery ---
+    def load(self) -> Tuple[Dict[str, dict], List[list]]:
+        """Newest snapshot's rooms + every event logged after it"""
+        rooms: Dict[str, dict] = {}
+        start = 0
+        snapshots = self._seqs("snapshot")
+        if snapshots:
+            with open(self._path("snapshot", snapshots[-1]), encoding="utf-8") as f:
+                data = json.load(f)
+            rooms, start = data["rooms"], data["segment"]
+
+        events = []
+        for seq in self._seqs("journal"):
+            if seq < start:
+                continue
+            with open(self._path("journal", seq), encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Torn write from a crash: only ever the tail of the last batch
+                        print(f"DEBUG: Skipping unreadable journal line in segment {seq}")
+        return rooms, events
+
+    def recover(self, store) -> int:
+        """Rebuilds the store's rooms. Call before start()."""
+        started = time.perf_counter()
+        rooms, events = self.load()
+        store.restore(rooms, events)
+        print(f"DEBUG: Recovered {len(store.active_games)} rooms from {len(rooms)} snapshotted "
+              f"+ {len(events)} logged events in {time.perf_counter() - started:.3f}s")
+        return len(store.active_games)
+
+    # --- Background writer ---
+    def start(self, store):
+        self._store = store
+        store.attach_journal(self)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        # Compact whatever we just recovered, so the next restart starts from here
+        await self.snapshot()
+        last_snapshot = time.monotonic()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                due = time.monotonic() - last_snapshot >= self.snapshot_interval
+                if self._events >= self.snapshot_events or (due and self._events):
+                    await self.snapshot()
+                    last_snapshot = time.monotonic()
+                else:
+                    await self.flush()
+            except Exception as e:
+                print(f"ERROR writing room journal: {e!r}")
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        await asyncio.to_thread(self._append_lines, self._segment, lines)
+
+    async def snapshot(self):
+        # Capture and rotate without awaiting in between: the snapshot then covers
+        # exactly the events before the new segment
+        rooms = self._store.snapshot()
+        lines, self._buffer = self._buffer, []
+        old_segment = self._segment
+        self._segment += 1
+        self._events = 0
+        new_segment = self._segment
+
+        def write():
+            if lines:
+                # Still logged, in case the snapshot write itself fails
+                self._append_lines(old_segment, lines)
+            self._write_snapshot(new_segment, rooms)
+
+        await asyncio.to_thread(write)
+
+    async def close(self):
+        """Final snapshot on a clean shutdown, so the next start has no log to replay"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._store is not None:
+            await self.snapshot()
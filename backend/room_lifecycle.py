@@ -0,0 +1,148 @@
+import os
+import time
+import random
+import string
+import asyncio
+from collections import deque
+from math import gcd
+from typing import Awaitable, Callable, Deque, List, Optional, Set
+
+# --- Lifecycle Settings ---
+MAX_ROOMS = int(os.getenv("MAX_ROOMS", "5000"))
+REAP_INTERVAL = float(os.getenv("ROOM_REAP_INTERVAL", "30"))
+EMPTY_ROOM_TTL = float(os.getenv("EMPTY_ROOM_TTL", "300"))        # nobody connected
+FINISHED_ROOM_TTL = float(os.getenv("FINISHED_ROOM_TTL", "600"))  # game over, nobody reset
+IDLE_ROOM_TTL = float(os.getenv("IDLE_ROOM_TTL", "1800"))         # no activity at all
+
+ALPHABET = string.ascii_uppercase
+CODE_LENGTH = 4
+CODE_SPACE = len(ALPHABET) ** CODE_LENGTH  # 456,976
+
+
+class RoomLimitError(Exception):
+    """No room codes (or room slots) left"""
+
+
+def index_to_code(index: int) -> str:
+    chars = []
+    for _ in range(CODE_LENGTH):
+        index, digit = divmod(index, len(ALPHABET))
+        chars.append(ALPHABET[digit])
+    return "".join(reversed(chars))
+
+
+def code_to_index(code: str) -> int:
+    index = 0
+    for ch in code:
+        index = index * len(ALPHABET) + ALPHABET.index(ch)
+    return index
+
+
+class RoomCodeAllocator:
+    """
+    O(1) room codes without retry loops.
+    Fresh codes walk a random affine permutation of the whole code space
+    (i -> a*i + b mod N, a coprime with N), so they look random but never collide.
+    Once that's used up, released codes are recycled oldest-first.
+    With shards > 1 only codes whose index % shards == shard are handed out,
+    so every worker can allocate on its own and still own all of its codes.
+    """
+
+    def __init__(self, space: int = CODE_SPACE, rng: Optional[random.Random] = None,
+                 shard: int = 0, shards: int = 1):
+        rng = rng or random.Random()
+        self.space = space
+        self.shard = shard
+        self.shards = shards
+        # Number of codes in this shard: shard, shard + shards, shard + 2*shards, ...
+        self.slots = len(range(shard, space, shards))
+        self._a = 1
+        while self.slots > 1:
+            self._a = rng.randrange(1, self.slots)
+            if gcd(self._a, self.slots) == 1:
+                break
+        self._b = rng.randrange(self.slots) if self.slots else 0
+        self._cursor = 0
+        self._free: Deque[str] = deque()
+        # Restored rooms' codes: the permutation walk skips each of them once
+        self._reserved: Set[str] = set()
+
+    def allocate(self) -> str:
+        while self._cursor < self.slots:
+            slot = (self._a * self._cursor + self._b) % self.slots
+            self._cursor += 1
+            code = index_to_code(self.shard + slot * self.shards)
+            if code in self._reserved:
+                self._reserved.discard(code)
+                continue
+            return code
+        if self._free:
+            return self._free.popleft()
+        raise RoomLimitError("All room codes are in use")
+
+    def release(self, code: str):
+        self._free.append(code)
+
+    def reserve(self, code: str):
+        """Marks a code as in use without allocating it (room restored after a restart)"""
+        self._reserved.add(code)
+
+
+class RoomReaper:
+    """
+    Timer-driven sweep over all rooms. Evicts rooms that are empty, finished or
+    idle for longer than their TTL so long-running servers don't grow forever.
+    """
+
+    def __init__(self, game_manager, on_evict: Callable[[str], Awaitable[None]],
+                 interval: float = REAP_INTERVAL, empty_ttl: float = EMPTY_ROOM_TTL,
+                 finished_ttl: float = FINISHED_ROOM_TTL, idle_ttl: float = IDLE_ROOM_TTL):
+        self.game_manager = game_manager
+        self.on_evict = on_evict
+        self.interval = interval
+        self.empty_ttl = empty_ttl
+        self.finished_ttl = finished_ttl
+        self.idle_ttl = idle_ttl
+        self._task: Optional[asyncio.Task] = None
+
+    def expired(self, now: Optional[float] = None) -> List[str]:
+        now = time.monotonic() if now is None else now
+        codes = []
+        for code, game in self.game_manager.active_games.items():
+            idle = now - game.last_activity
+            if idle >= self.idle_ttl:
+                codes.append(code)
+            elif idle >= self.empty_ttl and not game.has_connected_players():
+                codes.append(code)
+            elif idle >= self.finished_ttl and game.state == "FINISHED":
+                codes.append(code)
+        return codes
+
+    async def sweep(self, now: Optional[float] = None) -> List[str]:
+        codes = self.expired(now)
+        for code in codes:
+            await self.on_evict(code)
+        if codes:
+            print(f"DEBUG: Reaped {len(codes)} rooms, {len(self.game_manager.active_games)} left")
+        return codes
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"ERROR in room reaper: {e}")
@@ -0,0 +1,43 @@
+from typing import TYPE_CHECKING, Dict, Optional
+
+from .room_lifecycle import code_to_index
+
+if TYPE_CHECKING:
+    from .game_engine import GameLobby
+
+
+def shard_of(room_code: str, shards: int) -> Optional[int]:
+    """Which worker owns a room code. None for strings that can't be a room code."""
+    if shards <= 1:
+        return 0
+    try:
+        return code_to_index(room_code) % shards
+    except ValueError:
+        return None
+
+
+class RoomStore:
+    """
+    Where a worker keeps the rooms it owns.
+    GameManager (in-memory) is the default; rooms hold live asyncio tasks and
+    sockets, so scaling out shards rooms across workers instead of sharing them.
+    """
+
+    shard: int = 0
+    shards: int = 1
+    active_games: Dict[str, "GameLobby"]
+
+    def create_game(self) -> str:
+        """Creates a room owned by this store. Raises RoomLimitError when full."""
+        raise NotImplementedError
+
+    def get_game(self, room_code: str) -> Optional["GameLobby"]:
+        raise NotImplementedError
+
+    def remove_game(self, room_code: str) -> Optional["GameLobby"]:
+        raise NotImplementedError
+
+    def owns(self, room_code: str) -> bool:
+        owner = shard_of(room_code, self.shards)
+        # Junk codes can't exist anywhere, so answering "not found" locally is fine
+        return owner is None or owner == self.shard
@@ -0,0 +1,238 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Callable, Dict, Optional, Set
+
+from . import metrics
+from .codec import JSON, Codec, Frame, FrameCache, negotiate_socket
+from .connection_manager import SEND_TIMEOUT, send_with_timeout
+
+log = logging.getLogger(__name__)
+
+# --- Spectator Settings ---
+# At most one frame per watched room per tick (default 250 ms); changes in between are merged
+SPECTATOR_TICK = float(os.getenv("SPECTATOR_TICK_MS", "250")) / 1000
+SPECTATOR_LEADERBOARD_SIZE = int(os.getenv("SPECTATOR_LEADERBOARD_SIZE", "10"))
+# Fan-out hands a frame to this many spectators, then yields so player messages go first
+SPECTATOR_BATCH = int(os.getenv("SPECTATOR_BATCH", "256"))
+MAX_SPECTATORS = int(os.getenv("MAX_SPECTATORS", "20000"))  # per worker
+
+
+class SpectatorLimitError(Exception):
+    pass
+
+
+class Spectator:
+    """
+    One read-only viewer. Every frame is a complete view of the room, so it only
+    keeps the latest one: a slow viewer skips frames instead of queueing them.
+    """
+    __slots__ = ("websocket", "room_code", "codec", "frame", "wakeup", "writer_task")
+
+    def __init__(self, websocket, room_code: str, codec: Codec = JSON):
+        self.websocket = websocket
+        self.room_code = room_code
+        self.codec = codec
+        self.frame: Optional[Frame] = None
+        self.wakeup = asyncio.Event()
+        self.writer_task: Optional[asyncio.Task] = None
+
+    def offer(self, frame: Frame):
+        if self.frame is not None:
+            metrics.SPECTATOR_SKIPPED_FRAMES.inc()
+        self.frame = frame
+        self.wakeup.set()
+
+    async def _writer(self, send_timeout: float, on_dead):
+        send = self.websocket.send_bytes if self.codec.binary else self.websocket.send_text
+        try:
+            while True:
+                await self.wakeup.wait()
+                self.wakeup.clear()
+                frame, self.frame = self.frame, None
+                if frame is not None:
+                    await send_with_timeout(send, frame, send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Routine when viewers drop, so debug only (a big event can lose thousands at once)
+            log.debug("Spectator writer for room %s stopped: %r", self.room_code, e)
+            on_dead(self)
+
+
+class SpectatorHub:
+    """
+    Read-only fan-out tier, separate from the players' ConnectionManager.
+
+    The player path only calls mark(room): a set add, and a no-op for rooms nobody
+    watches. Once per tick the hub renders each marked room into one message,
+    encodes it once per codec in use and hands the same frame to every viewer,
+    yielding to the event loop between batches, so thousands of viewers never
+    hold up an answer.
+
+    In a cluster, a viewer can land on a worker that doesn't own the room. That
+    worker asks the owner to "watch" the room and fans the owner's views out
+    locally, so the owner sends one copy per worker, not one per viewer.
+    """
+
+    def __init__(self, render: Callable[[str], Optional[dict]], node=None, tick: float = SPECTATOR_TICK,
+                 batch: int = SPECTATOR_BATCH, max_spectators: int = MAX_SPECTATORS,
+                 send_timeout: float = SEND_TIMEOUT):
+        self.render = render
+        self.node = node
+        self.tick = tick
+        self.batch = max(1, batch)
+        self.max_spectators = max_spectators
+        self.send_timeout = send_timeout
+        self.rooms: Dict[str, Set[Spectator]] = {}
+        self.count = 0
+        self._latest: Dict[str, FrameCache] = {}  # last view of each room we have viewers for
+        self._watchers: Dict[str, Set[int]] = {}  # owner side: other workers with viewers of our rooms
+        self._dirty: Set[str] = set()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._tasks = set()
+        if node is not None:
+            node.listen("watch", self._on_watch)
+            node.listen("unwatch", self._on_unwatch)
+            node.listen("spectate", self._on_frame)
+            node.listen("spectate_end", self._on_end)
+
+    def _is_local(self, room_code: str) -> bool:
+        return self.node is None or self.node.is_local(room_code)
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    # --- Player path ---
+    def mark(self, room_code: str):
+        """The room changed. Cheap enough to call on every broadcast."""
+        if room_code not in self.rooms and room_code not in self._watchers:
+            return
+        self._dirty.add(room_code)
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.tick)
+        # Drop our slot first so changes made during the fan-out schedule a new tick
+        self._flush_task = None
+        rooms, self._dirty = self._dirty, set()
+        for room_code in rooms:
+            try:
+                await self._publish(room_code)
+            except Exception as e:
+                print(f"ERROR publishing spectator view of {room_code}: {e!r}")
+
+    async def _publish(self, room_code: str):
+        message = self.render(room_code)
+        if message is None:
+            return
+        metrics.SPECTATOR_FRAMES.inc()
+        for worker in self._watchers.get(room_code, ()):
+            # The view, not a frame: the other worker encodes it for its own viewers' codecs
+            self.node.send(worker, {"op": "spectate", "room": room_code, "view": message})
+        await self._fan_out(room_code, FrameCache(message))
+
+    async def _fan_out(self, room_code: str, frames: FrameCache):
+        viewers = self.rooms.get(room_code)
+        if not viewers:
+            return
+        self._latest[room_code] = frames
+        started = time.perf_counter() if metrics.ENABLED else 0.0
+        # Copy: viewers come and go while we yield
+        targets = list(viewers)
+        for i, viewer in enumerate(targets, 1):
+            viewer.offer(frames.get(viewer.codec))
+            if i % self.batch == 0 and i < len(targets):
+                await asyncio.sleep(0)
+                if self._latest.get(room_code) is not frames:
+                    return  # a newer frame is already on its way to everyone
+        if metrics.ENABLED:
+            metrics.SPECTATOR_FANOUT_SECONDS.observe(time.perf_counter() - started)
+
+    # --- Viewers ---
+    async def attach(self, websocket, room_code: str) -> Spectator:
+        """Accepts the socket and starts sending the room's view. Raises SpectatorLimitError when full."""
+        if self.count >= self.max_spectators:
+            raise SpectatorLimitError(f"Spectator limit ({self.max_spectators}) reached")
+        codec, subprotocol = negotiate_socket(websocket)
+        if subprotocol:
+            await websocket.accept(subprotocol=subprotocol)
+        else:
+            await websocket.accept()
+        viewer = Spectator(websocket, room_code, codec)
+        viewers = self.rooms.get(room_code)
+        if viewers is None:
+            viewers = self.rooms[room_code] = set()
+            if not self._is_local(room_code):
+                self.node.send(self.node.owner_of(room_code),
+                               {"op": "watch", "room": room_code, "worker": self.node.index})
+        viewers.add(viewer)
+        self.count += 1
+        viewer.writer_task = self._spawn(viewer._writer(self.send_timeout, self._on_dead))
+
+        latest = self._latest.get(room_code)
+        if latest is not None:
+            viewer.offer(latest.get(codec))
+        elif self._is_local(room_code):
+            self.mark(room_code)
+        # Remote rooms: the owner sends a fresh frame when it gets our "watch"
+        return viewer
+
+    def detach(self, viewer: Spectator):
+        viewers = self.rooms.get(viewer.room_code)
+        if viewers is None or viewer not in viewers:
+            return
+        viewers.discard(viewer)
+        self.count -= 1
+        if viewer.writer_task is not None and viewer.writer_task is not asyncio.current_task():
+            viewer.writer_task.cancel()
+        if not viewers:
+            room_code = viewer.room_code
+            del self.rooms[room_code]
+            self._latest.pop(room_code, None)
+            if not self._is_local(room_code):
+                self.node.send(self.node.owner_of(room_code),
+                               {"op": "unwatch", "room": room_code, "worker": self.node.index})
+
+    def _on_dead(self, viewer: Spectator):
+        self.detach(viewer)
+        # Closing wakes up the endpoint's receive loop
+        self._spawn(self._close(viewer, 1011))
+
+    async def _close(self, viewer: Spectator, code: int):
+        try:
+            await viewer.websocket.close(code=code)
+        except Exception:
+            pass
+
+    async def close_room(self, room_code: str, code: int = 4001):
+        """Room evicted: closes its viewers here and on every watching worker"""
+        for worker in self._watchers.pop(room_code, ()):
+            self.node.send(worker, {"op": "spectate_end", "room": room_code, "code": code})
+        self._dirty.discard(room_code)
+        for viewer in list(self.rooms.get(room_code, ())):
+            self.detach(viewer)
+            await self._close(viewer, code)
+
+    # --- Cluster messages ---
+    def _on_watch(self, data: dict):
+        self._watchers.setdefault(data["room"], set()).add(data["worker"])
+        self.mark(data["room"])
+
+    def _on_unwatch(self, data: dict):
+        workers = self._watchers.get(data["room"])
+        if workers is not None:
+            workers.discard(data["worker"])
+            if not workers:
+                del self._watchers[data["room"]]
+
+    def _on_frame(self, data: dict):
+        self._spawn(self._fan_out(data["room"], FrameCache(data["view"])))
+
+    def _on_end(self, data: dict):
+        self._spawn(self.close_room(data["room"], data.get("code", 4001)))
@@ -0,0 +1,149 @@
+import os
+import sys
+import time
+import sqlite3
+import subprocess
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+from backend import main
+from backend.game_engine import GameState
+from backend.providers import HedgedProvider, OfflineProvider
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_importing_the_app_does_not_load_the_gemini_sdk():
+    probe = "import sys, backend.main; print('google.generativeai' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", probe], capture_output=True, text=True, check=True, cwd=REPO_ROOT)
+    assert out.stdout.strip().splitlines()[-1] == "False"
+
+
+def test_factory_builds_services_in_the_lifespan():
+    app = main.create_app(question_provider=OfflineProvider(), bank_db_path=":memory:")
+    with TestClient(app) as client:
+        assert main.services.question_bank is not None and main.services.gemini is None
+        assert "lifespan" in main.startup_seconds and "import" in main.startup_seconds
+
+        code = client.post("/create-room").json()["room_code"]
+        with client.websocket_connect(f"/ws/{code}/host") as ws:
+            ws.receive_json()
+            ws.send_json({"action": "START_GAME", "payload": {"topic": "Space", "mode": "topic"}})
+            while True:
+                message = ws.receive_json()
+                if message["type"] == "NEW_QUESTION":
+                    break
+        assert set(message["question"]) == {"question", "options"}
+        assert client.get("/generation-stats").json() == {"providers": {}}
+
+
+def test_leaving_during_generation_lets_a_rejoin_start_again():
+    provider = OfflineProvider(latency=0.5)
+    app = main.create_app(question_provider=provider, bank_db_path=":memory:")
+    with TestClient(app) as client:
+        code = client.post("/create-room").json()["room_code"]
+        with client.websocket_connect(f"/ws/{code}/host") as ws:
+            ws.receive_json()
+            ws.send_json({"action": "START_GAME", "payload": {"topic": "Rivers", "mode": "topic"}})
+            while ws.receive_json() != {"type": "STATUS_UPDATE", "state": "GENERATING"}:
+                pass
+
+        # Last player gone mid-generation: the room goes back to the lobby
+        game = main.game_manager.get_game(code)
+        deadline = time.monotonic() + 2
+        while game.state != GameState.WAITING and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert game.state == GameState.WAITING and not game.is_generating
+
+        provider.latency = 0
+        with client.websocket_connect(f"/ws/{code}/host") as ws:
+            ws.receive_json()
+            ws.send_json({"action": "START_GAME", "payload": {"topic": "Rivers", "mode": "topic"}})
+            while ws.receive_json()["type"] != "NEW_QUESTION":
+                pass
+
+
+def test_document_upload_checks_room_and_host_before_reading_the_body(monkeypatch):
+    app = main.create_app(question_provider=OfflineProvider(), bank_db_path=":memory:")
+    with TestClient(app) as client:
+        code = client.post("/create-room").json()["room_code"]
+        with client.websocket_connect(f"/ws/{code}/host") as host, \
+                client.websocket_connect(f"/ws/{code}/guest") as guest:
+            host.receive_json()
+            guest.receive_json()
+
+            def unread(*args, **kwargs):
+                raise AssertionError("body was read")
+
+            with monkeypatch.context() as patched:
+                patched.setattr(main, "DocumentChunker", unread)
+                patched.setattr(main, "DOCUMENT_MAX_BYTES", 16)
+                assert client.post("/rooms/ZZZZ/document?player_id=host", content=b"text").status_code == 404
+                assert client.post(f"/rooms/{code}/document?player_id=guest", content=b"text").status_code == 403
+                assert client.post(f"/rooms/{code}/document?player_id=host", content=b"x" * 17).status_code == 413
+
+            uploaded = client.post(f"/rooms/{code}/document?player_id=host", content=b"Chapter 1\nThe pump needs oil.")
+            assert uploaded.status_code == 200 and uploaded.json()["chunks"] == 1
+
+
+def test_warmup_runs_with_a_preset_offline_provider_and_shutdown_closes_the_bank():
+    warmed = []
+
+    class WarmProvider(OfflineProvider):
+        name = "warm"
+
+        def warm(self):
+            warmed.append(True)
+
+    provider = HedgedProvider([WarmProvider()], offline=OfflineProvider())
+    app = main.create_app(question_provider=provider, bank_db_path=":memory:")
+    with TestClient(app) as client:
+        code = client.post("/create-room").json()["room_code"]
+        with client.websocket_connect(f"/ws/{code}/host") as ws:
+            ws.receive_json()
+            ws.send_json({"action": "START_GAME", "payload": {"topic": "Rivers", "mode": "topic"}})
+            while ws.receive_json()["type"] != "NEW_QUESTION":
+                pass
+        bank = main.services.question_bank
+        deadline = time.monotonic() + 2
+        while not warmed and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert warmed
+
+    assert not main.background_tasks and not bank._tasks
+    with pytest.raises(sqlite3.ProgrammingError):
+        bank.db.execute("SELECT 1")
+
+
+def test_rounds_send_roster_deltas_not_full_rosters():
+    app = main.create_app(question_provider=OfflineProvider(), bank_db_path=":memory:")
+    with TestClient(app) as client:
+        code = client.post("/create-room").json()["room_code"]
+        with client.websocket_connect(f"/ws/{code}/host") as ws:
+            assert ws.receive_json()["type"] == "PLAYER_UPDATE"  # joining: the one full roster
+            ws.send_json({"action": "START_GAME", "payload": {"topic": "Space", "mode": "topic"}})
+            seen = []
+            while not seen or seen[-1]["type"] != "NEW_QUESTION":
+                seen.append(ws.receive_json())
+            ws.send_json({"action": "SUBMIT_ANSWER", "payload": {"index": 0}})
+            while seen[-1]["type"] != "ROUND_REVEAL":
+                seen.append(ws.receive_json())
+            reveal = seen[-1]
+            ws.send_json({"action": "NEXT_QUESTION", "payload": {}})
+            while seen[-1]["type"] != "NEW_QUESTION" or seen[-1]["index"] != 1:
+                seen.append(ws.receive_json())
+            ws.send_json({"action": "RESYNC", "payload": {}})
+            while seen[-1]["type"] != "PLAYER_UPDATE":
+                seen.append(ws.receive_json())
+
+        assert "players" not in reveal and "correct_index" in reveal
+        assert [m["type"] for m in seen].count("PLAYER_UPDATE") == 1  # only the RESYNC answer
+        deltas = [m for m in seen if m["type"] == "PLAYER_DELTA"]
+        assert deltas and all(len(m["players"]) <= 1 for m in deltas)
+        # Score (or its absence) arrived as a delta right before the reveal
+        assert seen[seen.index(reveal) - 1]["type"] == "PLAYER_DELTA"
@@ -0,0 +1,176 @@
+import json
+import random
+import asyncio
+
+import pytest
+
+from backend.cluster import ClusterNode, RemoteDisconnect
+from backend.cluster_bus import LocalHub, UnixSocketBus
+from backend.room_lifecycle import RoomCodeAllocator, RoomLimitError, code_to_index
+from backend.room_store import shard_of
+
+
+class ClientSocket:
+    """What the edge worker sees: a real client socket"""
+
+    def __init__(self, subprotocols=()):
+        self.scope = {"type": "websocket", "subprotocols": list(subprotocols)}
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.binary = []
+        self.closed_with = None
+        self.subprotocol = None
+
+    async def accept(self, subprotocol=None):
+        self.subprotocol = subprotocol
+
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+    async def send_bytes(self, data):
+        self.binary.append(data)
+
+    async def receive_text(self):
+        text = await self.incoming.get()
+        if text is None:
+            raise ConnectionError("client left")
+        return text
+
+    async def close(self, code=1000):
+        self.closed_with = code
+        self.incoming.put_nowait(None)
+
+
+def test_sharded_allocator_only_hands_out_its_own_codes():
+    space, shards = 26 * 26, 3
+    allocator = RoomCodeAllocator(space=space, rng=random.Random(3), shard=1, shards=shards)
+    codes = [allocator.allocate() for _ in range(len(range(1, space, shards)))]
+    assert len(set(codes)) == len(codes)
+    assert all(code_to_index(c) % shards == 1 for c in codes)
+    assert all(shard_of(c, shards) == 1 for c in codes)
+    with pytest.raises(RoomLimitError):
+        allocator.allocate()
+
+
+def test_shard_of_ignores_junk_codes():
+    assert shard_of("ab12", 4) is None
+    assert shard_of("ABCD", 1) == 0
+
+
+def test_socket_on_wrong_worker_is_tunnelled_to_owner():
+    async def scenario():
+        hub = LocalHub(2)
+        owner, edge = ClusterNode(0, 2, hub.bus(0)), ClusterNode(1, 2, hub.bus(1))
+        ended = []
+
+        async def echo_session(websocket, room_code, player_name):
+            await websocket.accept()
+            await websocket.send_text(json.dumps({"hello": player_name, "room": room_code}))
+            try:
+                while True:
+                    data = await websocket.receive_json()
+                    if data.get("action") == "BYE":
+                        await websocket.close(code=4001)
+                    await websocket.send_text(json.dumps({"echo": data}))
+            except RemoteDisconnect:
+                ended.append(player_name)
+
+        await owner.start(echo_session)
+        await edge.start(echo_session)
+        room = next(c for c in ("AAAA", "AAAB", "AAAC") if owner.owner_of(c) == 0)
+        assert not edge.is_local(room)
+
+        client = ClientSocket()
+        proxy = asyncio.create_task(edge.proxy(client, room, "ann"))
+        client.incoming.put_nowait(json.dumps({"action": "PING"}))
+        await asyncio.sleep(0.05)
+        assert client.sent == [{"hello": "ann", "room": room}, {"echo": {"action": "PING"}}]
+
+        # Owner closes (e.g. room evicted): the edge closes the real socket with the same code
+        client.incoming.put_nowait(json.dumps({"action": "BYE"}))
+        await asyncio.wait_for(proxy, 1)
+        assert client.closed_with == 4001
+        await asyncio.sleep(0.01)
+        assert ended == ["ann"] and not owner._remotes and not edge._edges
+
+        # Client leaves on its own: the owner's session sees a disconnect
+        client = ClientSocket()
+        proxy = asyncio.create_task(edge.proxy(client, room, "bob"))
+        await asyncio.sleep(0.02)
+        client.incoming.put_nowait(None)
+        await asyncio.wait_for(proxy, 1)
+        await asyncio.sleep(0.02)
+        assert ended == ["ann", "bob"] and not owner._remotes
+
+    asyncio.run(scenario())
+
+
+def test_tunnel_keeps_the_codec_the_edge_negotiated():
+    pytest.importorskip("msgpack")
+    from backend.codec import MSGPACK, MSGPACK_SUBPROTOCOL, negotiate_socket
+
+    async def scenario():
+        hub = LocalHub(2)
+        owner, edge = ClusterNode(0, 2, hub.bus(0)), ClusterNode(1, 2, hub.bus(1))
+
+        async def session(websocket, room_code, player_name):
+            codec, _ = negotiate_socket(websocket)
+            frame = codec.encode({"type": "ANSWER_ACK", "correct": None})
+            await (websocket.send_bytes(frame) if codec.binary else websocket.send_text(frame))
+            await websocket.close(code=4001)
+
+        await owner.start(session)
+        await edge.start(session)
+        room = next(c for c in ("AAAA", "AAAB", "AAAC") if owner.owner_of(c) == 0)
+        client = ClientSocket([MSGPACK_SUBPROTOCOL])
+        await asyncio.wait_for(edge.proxy(client, room, "ann"), 1)
+        assert client.subprotocol == MSGPACK_SUBPROTOCOL
+        assert [MSGPACK.decode(b) for b in client.binary] == [{"type": "ANSWER_ACK", "correct": None}]
+
+    asyncio.run(scenario())
+
+
+def test_rpc_over_unix_socket_bus(tmp_path):
+    async def scenario():
+        nodes = [ClusterNode(i, 2, UnixSocketBus(str(tmp_path), i, 2)) for i in range(2)]
+        for node in nodes:
+            node.register("room_info", lambda room_code, i=node.index: {"owner": i, "room": room_code})
+            await node.start(None)
+        try:
+            assert await nodes[1].call(0, "room_info", room_code="ABCD") == {"owner": 0, "room": "ABCD"}
+            assert await nodes[0].call(1, "room_info", room_code="WXYZ") == {"owner": 1, "room": "WXYZ"}
+        finally:
+            for node in nodes:
+                await node.stop()
+
+    asyncio.run(scenario())
+
+
+def test_unix_socket_bus_skips_oversized_messages_and_bounds_the_backlog(tmp_path):
+    async def scenario():
+        received = []
+        small = UnixSocketBus(str(tmp_path), 0, 2, max_message=1024)
+        sender = UnixSocketBus(str(tmp_path), 1, 2)
+        await small.start(received.append)
+        await sender.start(lambda data: None)
+        try:
+            # Bigger than the reader's buffer, and not even all there in one read
+            sender.send(0, {"big": "x" * 200_000})
+            sender.send(0, {"n": 1})
+            for _ in range(200):
+                if received:
+                    break
+                await asyncio.sleep(0.01)
+            assert received == [{"n": 1}]
+
+            # Nobody listening on worker 1's socket yet: the backlog stops growing at the limit
+            lonely = UnixSocketBus(str(tmp_path / "nowhere"), 0, 2, send_buffer_limit=100)
+            for i in range(50):
+                lonely.send(1, {"n": i})
+            assert lonely._links[1].pending_bytes <= 100
+            await lonely.close()
+        finally:
+            await small.close()
+            await sender.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,81 @@
+import json
+import asyncio
+
+import pytest
+
+from backend.codec import JSON, JSON_SUBPROTOCOL, MSGPACK_SUBPROTOCOL, ROWS, compact, expand, negotiate
+from backend.connection_manager import ConnectionManager
+
+PLAYERS = [
+    {"id": "ann", "name": "ann", "score": 20, "is_host": True, "is_connected": True,
+     "has_answered": False, "current_answer": None},
+    {"id": "bob", "name": "bob", "score": 0, "is_host": False, "is_connected": False,
+     "has_answered": True, "current_answer": 2},
+]
+
+
+class Socket:
+    def __init__(self, subprotocols=()):
+        self.scope = {"type": "websocket", "subprotocols": list(subprotocols)}
+        self.accepted_with = "not accepted"
+        self.text, self.binary = [], []
+
+    async def accept(self, subprotocol=None):
+        self.accepted_with = subprotocol
+
+    async def send_text(self, frame):
+        self.text.append(frame)
+
+    async def send_bytes(self, frame):
+        self.binary.append(frame)
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_compact_shape_round_trips():
+    message = {"type": "ROUND_REVEAL", "version": 4, "players": PLAYERS, "correct_index": 1,
+               "explanation": "because", "timed_out": False, "something_new": {"nested_field": 1}}
+    small = compact(message)
+    assert small["t"] == 5 and small["k"] == 1
+    assert small["p"][1] == ("bob", "bob", 0, False, False, True, 2)
+    assert expand(json.loads(json.dumps(small))) == message
+
+
+def test_player_rows_follow_player_state():
+    pytest.importorskip("pydantic")
+    from backend.game_engine import PlayerState
+
+    assert tuple(PlayerState("ann", "ann").to_dict()) == ROWS["players"]
+
+
+def test_negotiation_defaults_to_json():
+    assert negotiate([]) == (JSON, None)
+    assert negotiate(["chat", JSON_SUBPROTOCOL]) == (JSON, JSON_SUBPROTOCOL)
+
+
+def test_mixed_room_encodes_once_per_codec():
+    pytest.importorskip("msgpack")
+    from backend.codec import MSGPACK, negotiate_socket
+
+    async def scenario():
+        manager = ConnectionManager()
+        sockets = [Socket(), Socket([MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL]), Socket([MSGPACK_SUBPROTOCOL])]
+        for ws in sockets:
+            codec, subprotocol = negotiate_socket(ws)
+            await manager.connect(ws, "ABCD", codec, subprotocol)
+        assert [ws.accepted_with for ws in sockets] == [None, MSGPACK_SUBPROTOCOL, MSGPACK_SUBPROTOCOL]
+
+        message = {"type": "PLAYER_UPDATE", "version": 1, "players": PLAYERS}
+        await manager.broadcast(message, "ABCD")
+        await manager.send_personal({"type": "ANSWER_ACK", "correct": None}, sockets[1])
+        await asyncio.sleep(0.01)
+
+        plain, binary, other = sockets
+        assert json.loads(plain.text[0]) == message and not plain.binary
+        assert binary.binary[0] is other.binary[0]  # one encode for both msgpack clients
+        assert MSGPACK.decode(binary.binary[0]) == message
+        assert MSGPACK.decode(binary.binary[1]) == {"type": "ANSWER_ACK", "correct": None}
+        assert len(binary.binary[0]) * 3 < len(plain.text[0])
+
+    asyncio.run(scenario())
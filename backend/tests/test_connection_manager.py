@@ -0,0 +1,121 @@
+import json
+import asyncio
+
+import pytest
+
+from backend.connection_manager import ConnectionManager, send_with_timeout
+
+
+class FakeSocket:
+    def __init__(self, delay: float = 0, fail: bool = False):
+        self.delay = delay
+        self.fail = fail
+        self.sent = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        if self.fail:
+            raise RuntimeError("socket is gone")
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.sent.append(json.loads(frame))
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_slow_client_does_not_block_room():
+    async def scenario():
+        manager = ConnectionManager(max_queue=8, policy="disconnect", send_timeout=5)
+        fast, slow = FakeSocket(), FakeSocket(delay=1)
+        await manager.connect(fast, "ABCD")
+        await manager.connect(slow, "ABCD")
+
+        await manager.broadcast({"type": "PING"}, "ABCD")
+        await asyncio.sleep(0.05)
+        assert fast.sent == [{"type": "PING"}]
+        assert slow.sent == []
+
+    asyncio.run(scenario())
+
+
+def test_dead_socket_is_removed_without_breaking_broadcast():
+    async def scenario():
+        manager = ConnectionManager(max_queue=8, policy="disconnect", send_timeout=5)
+        good, dead = FakeSocket(), FakeSocket(fail=True)
+        await manager.connect(dead, "ABCD")
+        await manager.connect(good, "ABCD")
+
+        await manager.broadcast({"type": "PING"}, "ABCD")
+        await asyncio.sleep(0.05)
+        assert good.sent == [{"type": "PING"}]
+        assert [c.websocket for c in manager.active_connections["ABCD"]] == [good]
+        assert dead.closed_with == 1011
+
+    asyncio.run(scenario())
+
+
+def test_queue_overflow_policies():
+    async def scenario(policy):
+        manager = ConnectionManager(max_queue=2, policy=policy, send_timeout=5)
+        slow = FakeSocket(delay=1)
+        await manager.connect(slow, "ABCD")
+        for i in range(5):
+            await manager.broadcast({"n": i}, "ABCD")
+        # Background closes are held on to until they finish
+        assert policy == "drop" or manager._closing
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)  # done callbacks run one loop iteration later
+        assert not manager._closing
+        return manager, slow
+
+    manager, slow = asyncio.run(scenario("drop"))
+    assert manager.clients[id(slow)].dropped > 0
+
+    manager, slow = asyncio.run(scenario("disconnect"))
+    assert "ABCD" not in manager.active_connections
+    assert slow.closed_with == 1008
+
+
+def test_broadcast_encodes_once_and_shares_frame():
+    async def scenario():
+        manager = ConnectionManager(max_queue=8, policy="disconnect", send_timeout=5)
+        sockets = [FakeSocket() for _ in range(3)]
+        for ws in sockets:
+            await manager.connect(ws, "ABCD")
+        await manager.broadcast({"type": "PING"}, "ABCD")
+        frames = [manager.clients[id(ws)].queue.get_nowait() for ws in sockets]
+        assert all(f is frames[0] for f in frames)
+
+    asyncio.run(scenario())
+
+
+def test_send_with_timeout_times_out_and_never_swallows_a_cancel():
+    async def scenario():
+        async def stalled(frame):
+            await asyncio.sleep(10)
+
+        with pytest.raises(asyncio.TimeoutError):
+            await send_with_timeout(stalled, "x", 0.01)
+
+        # A writer cancelled right as its send finishes must still stop
+        sent = asyncio.Event()
+
+        async def instant(frame):
+            sent.set()
+
+        async def writer():
+            while True:
+                await send_with_timeout(instant, "x", 1)
+                await asyncio.sleep(0)
+
+        task = asyncio.create_task(writer())
+        await sent.wait()
+        task.cancel()
+        await asyncio.wait([task], timeout=1)
+        assert task.cancelled()
+
+    asyncio.run(scenario())
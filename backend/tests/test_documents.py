@@ -0,0 +1,118 @@
+import time
+import asyncio
+from collections import Counter
+
+import pytest
+
+from backend.dedupe import NearDuplicateIndex
+from backend.documents import Chunk, Document, DocumentChunker, chunk_text, stream_document_questions
+from backend.providers import OfflineProvider
+
+
+def manual(chapters=5, paragraphs=20):
+    parts = []
+    for c in range(chapters):
+        parts.append(f"Chapter {c + 1}")
+        for p in range(paragraphs):
+            parts.append(f"Paragraph {p} of chapter {c + 1}. " + "The pump needs oil. " * 10)
+            parts.append("")
+    return "\n".join(parts)
+
+
+class ChunkProvider(OfflineProvider):
+    """Synthetic questions per chunk; records which chunks were asked for and the peak concurrency"""
+
+    def __init__(self, latency=0.05, fail=False):
+        super().__init__(latency=latency)
+        self.fail = fail
+        self.inputs = []
+        self.active = 0
+        self.peak = 0
+
+    async def request_questions(self, mode, input_text, count=10, room="bg"):
+        assert mode == "document"
+        self.inputs.append(input_text)
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.fail:
+                raise RuntimeError("upstream down")
+            return [self.make_question(mode, input_text, i) for i in range(count)]
+        finally:
+            self.active -= 1
+
+
+def test_chunker_keeps_a_bounded_evenly_spread_sample():
+    chunker = DocumentChunker(chunk_chars=500, max_chunks=8)
+    text = manual(chapters=10, paragraphs=40)
+    # Fed in awkward pieces, like a network stream
+    for i in range(0, len(text), 777):
+        chunker.feed(text[i:i + 777])
+    doc = chunker.finish()
+
+    assert doc.total_chunks > 100
+    assert 4 < len(doc.chunks) <= 8
+    indexes = [c.index for c in doc.chunks]
+    steps = {b - a for a, b in zip(indexes, indexes[1:])}
+    assert indexes[0] == 0 and len(steps) == 1
+    assert indexes[-1] >= doc.total_chunks // 2
+    assert doc.title == "Chapter 1"
+    assert len(doc.sections) > 3
+    assert all(len(c.text) <= 500 * 3 // 2 + 200 for c in doc.chunks)
+
+    # No newlines at all still gets chunked
+    blob = chunk_text("word " * 5000, chunk_chars=1000)
+    assert len(blob.chunks) > 10 and all(len(c.text) <= 1500 for c in blob.chunks)
+
+    assert Document.from_dict(doc.to_dict()).to_dict() == doc.to_dict()
+
+
+def test_work_order_covers_every_section_first():
+    doc = chunk_text(manual(chapters=5, paragraphs=10), chunk_chars=800)
+    order = doc.work_order()
+    assert len(order) == len(doc.chunks)
+    assert {c.section for c in order[:5]} == set(doc.sections)
+    assert "[Section: Chapter" in order[0].prompt_text()
+
+
+def test_map_reduce_is_parallel_balanced_and_deduped():
+    doc = chunk_text(manual(chapters=5, paragraphs=30), chunk_chars=600)
+    provider = ChunkProvider(latency=0.05)
+
+    async def run():
+        return [q async for q in stream_document_questions(provider, doc, 10, parallel=4, per_chunk=2)]
+
+    started = time.perf_counter()
+    questions = asyncio.run(run())
+    elapsed = time.perf_counter() - started
+
+    assert len(questions) == 10
+    assert provider.peak == 4
+    # Only the chunks the quiz needed, in a couple of parallel waves
+    assert len(provider.inputs) <= 8
+    assert elapsed < 0.05 * 4
+    per_section = Counter(text.split("]")[0] for text in provider.inputs)
+    assert len(per_section) == 5
+
+    # Same chunk text -> same synthetic questions: those get dropped, plus what the room already saw
+    seen = NearDuplicateIndex()
+    repeat = Document([Chunk(i, "Intro", "Same text.") for i in range(3)])
+    for i in range(2):
+        seen.add_question(provider.make_question("document", repeat.chunks[0].prompt_text(), i))
+
+    async def run_repeat():
+        return [q async for q in stream_document_questions(provider, repeat, 5, seen=seen, parallel=2, per_chunk=3)]
+
+    again = asyncio.run(run_repeat())
+    assert len(again) == 1
+
+
+def test_failing_chunks_raise_only_if_nothing_came_back():
+    doc = chunk_text(manual(chapters=2, paragraphs=5), chunk_chars=500)
+
+    async def run():
+        return [q async for q in stream_document_questions(ChunkProvider(latency=0, fail=True), doc, 5)]
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(run())
@@ -0,0 +1,119 @@
+import pytest
+
+pytest.importorskip("pydantic")
+
+from backend.game_engine import GameLobby, GameState
+from backend.questions import prepare_question
+
+
+def make_lobby(*names):
+    lobby = GameLobby("ABCD")
+    for name in names:
+        lobby.add_player(name, name)
+    lobby.questions = [prepare_question({"question": "q", "options": ["a", "b"], "correct_index": 1, "explanation": ""})]
+    lobby.state = GameState.PLAYING
+    return lobby
+
+
+def test_answered_counters_track_connects_and_disconnects():
+    lobby = make_lobby("ann", "bob", "cat")
+    lobby.submit_answer("ann", 1)
+    lobby.submit_answer("ann", 0)  # changing your answer doesn't count twice
+    assert (lobby.connected_count, lobby.answered_count) == (3, 1)
+
+    lobby.handle_disconnect("bob")
+    lobby.submit_answer("cat", 1)
+    assert lobby.check_all_answered()
+
+    lobby.add_player("bob", "bob")  # bob is back and hasn't answered
+    assert not lobby.check_all_answered()
+
+
+def test_batch_scoring_and_round_reset():
+    lobby = make_lobby("ann", "bob")
+    lobby.submit_answer("ann", 1)
+    lobby.submit_answer("bob", 0)
+    lobby.calculate_scores()
+    assert lobby.players["ann"].score == 10
+    assert lobby.players["bob"].score == 0
+    assert [(e["name"], e["score"]) for e in lobby.leaderboard.top(5)] == [("ann", 10), ("bob", 0)]
+
+    assert lobby.next_question() is None
+    assert lobby.answered_count == 0
+    assert not any(p.has_answered for p in lobby.players.values())
+
+
+def test_player_state_matches_api_model():
+    lobby = make_lobby("ann")
+    player = lobby.players["ann"]
+    assert player.to_model().dict() == player.to_dict()
+
+
+def test_leaderboard_follows_joins_leaves_and_resets():
+    lobby = make_lobby("ann", "bob", "cat")
+    lobby.submit_answer("cat", 1)
+    lobby.calculate_scores()
+    assert lobby.leaderboard.top(1) == [{"rank": 1, "name": "cat", "score": 10}]
+
+    lobby.remove_player("cat")
+    lobby.add_player("dan", "dan")
+    assert [e["name"] for e in lobby.leaderboard.top(5)] == ["ann", "bob", "dan"]
+
+    lobby.reset()
+    assert {e["score"] for e in lobby.leaderboard.top(5)} == {0}
+
+
+def test_question_history_survives_reset():
+    from backend.providers import OfflineProvider
+    fake = OfflineProvider()
+    lobby = make_lobby("ann")
+    lobby.begin_generation(2)
+    lobby.append_question(fake.make_question("topic", "Space", 0))
+    lobby.reset()
+
+    assert not lobby.history.add_question(fake.make_question("topic", "Space", 0))
+    assert lobby.history.add_question(fake.make_question("topic", "Space", 1))
+
+
+def test_snapshot_keeps_history_and_answers_of_earlier_games():
+    import json
+    from backend.providers import OfflineProvider
+    fake = OfflineProvider()
+    lobby = make_lobby("ann", "bob")
+    lobby.begin_generation(1)
+    lobby.append_question(fake.make_question("topic", "Space", 0))
+    lobby.reset()  # first game's question is only in the history now
+    lobby.begin_generation(1)
+    lobby.append_question(fake.make_question("topic", "Space", 1))
+    lobby.state = GameState.PLAYING
+    lobby.start_round()
+    lobby.submit_answer("ann", 0)
+
+    restored = GameLobby.from_snapshot("ABCD", json.loads(json.dumps(lobby.to_snapshot())))
+    restored.recover()
+    for i in range(2):
+        assert not restored.history.add_question(fake.make_question("topic", "Space", i))
+    assert restored.history.add_question(fake.make_question("topic", "Space", 2))
+
+    # Only ann is back and she already answered: the round can be revealed
+    restored.add_player("ann", "ann")
+    assert restored.check_all_answered()
+
+
+def test_round_transitions_only_touch_the_players_who_answered():
+    lobby = make_lobby("ann", "bob", "cat")
+    lobby.roster_delta()  # joins
+    lobby.start_round()
+    lobby.submit_answer("ann", 1)
+    assert [p["id"] for p in lobby.roster_delta()["players"]] == ["ann"]
+
+    lobby.calculate_scores()
+    delta = lobby.roster_delta()
+    assert [(p["id"], p["score"]) for p in delta["players"]] == [("ann", 10)]
+
+    lobby.next_question()
+    assert [(p["id"], p["has_answered"]) for p in lobby.roster_delta()["players"]] == [("ann", False)]
+    assert lobby.roster_delta() is None
+
+    lobby.reset()
+    assert [(p["id"], p["score"]) for p in lobby.roster_delta()["players"]] == [("ann", 0)]
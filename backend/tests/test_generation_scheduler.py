@@ -0,0 +1,108 @@
+import asyncio
+
+from backend.generation_scheduler import REQUESTS_PER_MINUTE, GenerationScheduler, TokenBucket
+
+
+def test_token_bucket_limits_burst():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.try_take() == 0
+    assert bucket.try_take() == 0
+    wait = bucket.try_take()
+    assert 0 < wait <= 1.0
+
+
+def test_cluster_workers_split_the_rate_limit():
+    # Summed over the workers, the cluster stays within GEMINI_RPM
+    shares = [GenerationScheduler.for_worker(4).bucket.rate for _ in range(4)]
+    assert abs(sum(shares) * 60 - REQUESTS_PER_MINUTE) < 1e-9
+    assert GenerationScheduler.for_worker(1).bucket.rate * 60 == REQUESTS_PER_MINUTE
+
+
+def test_identical_requests_share_one_upstream_call():
+    async def scenario():
+        scheduler = GenerationScheduler(rate_per_minute=6000, burst=10, max_concurrency=2)
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.05)
+            return ["q1", "q2"]
+
+        results = await asyncio.gather(*[
+            scheduler.run(("topic", "space"), f"ROOM{i}", call) for i in range(5)
+        ])
+        assert calls == 1
+        assert all(r == ["q1", "q2"] for r in results)
+        assert scheduler.stats.coalesced == 4
+
+    asyncio.run(scenario())
+
+
+def test_streams_are_shared_between_subscribers():
+    async def scenario():
+        scheduler = GenerationScheduler(rate_per_minute=6000, burst=10, max_concurrency=2)
+        opened = 0
+
+        async def upstream():
+            nonlocal opened
+            opened += 1
+            for i in range(3):
+                await asyncio.sleep(0.01)
+                yield i
+
+        async def collect(room):
+            return [x async for x in scheduler.stream("key", room, upstream)]
+
+        a, b = await asyncio.gather(collect("A"), collect("B"))
+        assert opened == 1
+        assert a == b == [0, 1, 2]
+
+    asyncio.run(scenario())
+
+
+def test_waiting_rooms_are_served_round_robin():
+    async def scenario():
+        scheduler = GenerationScheduler(rate_per_minute=6000, burst=100, max_concurrency=1)
+        order = []
+
+        async def job(room):
+            async with scheduler.slot(room):
+                order.append(room)
+                await asyncio.sleep(0.01)
+
+        # Busy room queues three jobs before the quiet room asks once
+        jobs = [job("BUSY"), job("BUSY"), job("BUSY"), job("QUIET")]
+        await asyncio.gather(*jobs)
+        assert order.index("QUIET") <= 1
+        snapshot = scheduler.stats_snapshot()
+        assert snapshot["granted"] == 4 and snapshot["queue_depth"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = GenerationScheduler(rate_per_minute=6000, burst=100, max_concurrency=1)
+        release = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("A"):
+                await release.wait()
+
+        async def waiter():
+            async with scheduler.slot("B"):
+                pass
+
+        h = asyncio.create_task(holder())
+        await asyncio.sleep(0.01)
+        w = asyncio.create_task(waiter())
+        await asyncio.sleep(0.01)
+        assert scheduler.queue_depth == 1
+        w.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queue_depth == 0
+        release.set()
+        await h
+
+    asyncio.run(scenario())
@@ -0,0 +1,37 @@
+import json
+
+from backend.json_stream import JSONArrayStreamParser, is_valid_question
+
+QUESTIONS = [
+    {"question": "Braces } and [brackets] in \"text\"?", "options": ["a", "b"], "correct_index": 0,
+     "explanation": "escaped \\\" quote"},
+    {"question": "Second", "options": ["x", "y", "z"], "correct_index": 2, "explanation": ""},
+]
+
+
+def test_objects_are_emitted_as_soon_as_they_close():
+    text = "```json\n" + json.dumps(QUESTIONS, indent=2) + "\n```"
+    parser = JSONArrayStreamParser()
+    seen = []
+    first_seen_at = None
+    for i in range(0, len(text), 7):
+        seen.extend(parser.feed(text[i:i + 7]))
+        if seen and first_seen_at is None:
+            first_seen_at = i
+    assert seen == QUESTIONS
+    # First question came out well before the end of the stream
+    assert first_seen_at < len(text) // 2 + 20
+
+
+def test_one_char_chunks_and_trailing_text():
+    parser = JSONArrayStreamParser()
+    seen = []
+    for ch in json.dumps(QUESTIONS) + " trailing chatter [{}]":
+        seen.extend(parser.feed(ch))
+    assert seen == QUESTIONS
+
+
+def test_question_validation():
+    assert is_valid_question(QUESTIONS[0])
+    assert not is_valid_question({"question": "no options"})
+    assert not is_valid_question(["not", "a", "dict"])
@@ -0,0 +1,30 @@
+import random
+
+from backend.leaderboard import Leaderboard
+
+
+def test_incremental_updates_match_a_full_sort():
+    board = Leaderboard()
+    rng = random.Random(7)
+    scores = {}
+    for _ in range(2000):
+        player = f"p{rng.randrange(60)}"
+        if rng.random() < 0.05:
+            board.remove(player)
+            scores.pop(player, None)
+        else:
+            scores[player] = scores.get(player, 0) + rng.choice((0, 10))
+            board.set(player, player.upper(), scores[player])
+
+    expected = sorted(scores.items(), key=lambda kv: (-kv[1], kv[0]))[:10]
+    assert [(e["name"], e["score"]) for e in board.top(10)] == [(p.upper(), s) for p, s in expected]
+    assert len(board) == len(scores)
+
+
+def test_ties_share_a_rank():
+    board = Leaderboard()
+    for player, score in (("ann", 30), ("bob", 20), ("cat", 20), ("dan", 10)):
+        board.set(player, player, score)
+    assert [e["rank"] for e in board.top(4)] == [1, 2, 2, 4]
+    assert board.rank("cat") == 2 and board.rank("dan") == 4
+    assert len(board.top(2)) == 2
@@ -0,0 +1,75 @@
+import asyncio
+
+from backend import metrics
+from backend.connection_manager import ConnectionManager
+
+
+class FakeSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text):
+        self.sent.append(text)
+
+    async def close(self, code=1000):
+        pass
+
+
+def test_registry_renders_prometheus_text():
+    registry = metrics.Registry()
+    hits = registry.register(metrics.Counter("t_hits_total", "Hits", ["room"]))
+    latency = registry.register(metrics.Histogram("t_latency_seconds", "Latency", buckets=(0.1, 1)))
+    registry.register(metrics.Gauge("t_rooms", "Rooms", callback=lambda: {(): 3}))
+
+    hits.labels("ABCD").inc()
+    hits.labels("ABCD").inc(2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render()
+    assert "# TYPE t_hits_total counter" in text
+    assert 't_hits_total{room="ABCD"} 3' in text
+    assert 't_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 't_latency_seconds_bucket{le="1"} 2' in text
+    assert 't_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "t_latency_seconds_count 3" in text
+    assert "t_rooms 3" in text
+
+    hits.remove("ABCD")
+    assert 'room="ABCD"' not in registry.render()
+
+
+def test_disabled_metrics_record_nothing(monkeypatch):
+    monkeypatch.setattr(metrics, "ENABLED", False)
+    hits = metrics.Counter("t_off_total", "Off")
+    latency = metrics.Histogram("t_off_seconds", "Off")
+    hits.inc()
+    latency.observe(1.0)
+    with latency.time():
+        pass
+    assert hits.labels().value == 0
+    assert latency.labels().count == 0
+
+
+def test_broadcast_records_fan_out_and_room_rate():
+    async def scenario():
+        manager = ConnectionManager()
+        for _ in range(3):
+            await manager.connect(FakeSocket(), "MTRX")
+        before = metrics.BROADCAST_SECONDS.labels().count
+        sent_before = metrics.BROADCAST_RECIPIENTS.labels().value
+
+        await manager.broadcast({"type": "PING"}, "MTRX")
+        await manager.broadcast({"type": "PING"}, "MTRX")
+
+        assert metrics.BROADCAST_SECONDS.labels().count == before + 2
+        assert metrics.BROADCAST_RECIPIENTS.labels().value == sent_before + 6
+        assert metrics.ROOM_MESSAGES.labels("MTRX").value == 2
+        assert manager.connection_count == 3
+        metrics.ROOM_MESSAGES.remove("MTRX")
+
+    asyncio.run(scenario())
@@ -0,0 +1,148 @@
+import time
+import asyncio
+
+import pytest
+
+from backend.generation_scheduler import BACKGROUND_ROOM
+from backend.json_stream import is_valid_question
+from backend.providers import CircuitBreaker, HedgedProvider, OfflineProvider, QuestionProvider
+from backend.question_bank import QuestionBank, bank_key
+
+
+def test_offline_stand_in_is_deterministic_and_well_formed():
+    async def scenario():
+        a = await OfflineProvider().request_questions("topic", "Space", 5)
+        b = [q async for q in OfflineProvider().stream_questions("topic", "Space", 5)]
+        return a, b
+
+    batch, streamed = asyncio.run(scenario())
+    assert batch == streamed
+    assert len(batch) == 5
+    assert all(is_valid_question(q) for q in batch)
+
+
+class Upstream(QuestionProvider):
+    """Stand-in upstream: optional delay before the first question, can fail up front or mid-stream"""
+
+    def __init__(self, name, delay=0.0, fail=False, fail_after=None):
+        self.name = name
+        self.delay = delay
+        self.fail = fail
+        self.fail_after = fail_after
+        self.calls = 0
+        self.closed = 0
+        self.fake = OfflineProvider()
+
+    async def stream_questions(self, mode, input_text, count=10, room=BACKGROUND_ROOM):
+        self.calls += 1
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError(f"{self.name} is down")
+            for i in range(count):
+                if i == self.fail_after:
+                    raise RuntimeError(f"{self.name} dropped the stream")
+                yield dict(self.fake.make_question(mode, input_text, i), source=self.name)
+        finally:
+            self.closed += 1
+
+    async def request_questions(self, mode, input_text, count=10, room=BACKGROUND_ROOM):
+        return [q async for q in self.stream_questions(mode, input_text, count, room)]
+
+
+def test_circuit_breaker_opens_then_lets_one_trial_through():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=2, reset_after=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 10
+    assert breaker.allow() and not breaker.allow()  # one trial at a time
+    breaker.record_failure()
+    assert breaker.state == "open"
+
+    now[0] = 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_slow_upstream_is_hedged_and_the_loser_cancelled():
+    async def scenario():
+        slow, backup = Upstream("slow", delay=5), Upstream("backup")
+        provider = HedgedProvider([slow, backup], hedge_after=0.05)
+        started = time.perf_counter()
+        got = [q async for q in provider.stream_questions("topic", "Space", 3, room="ROOM")]
+        return time.perf_counter() - started, got, slow
+
+    elapsed, got, slow = asyncio.run(scenario())
+    assert [q["source"] for q in got] == ["backup"] * 3
+    assert elapsed < 1
+    assert slow.closed == 1  # its upstream call was cancelled, not left running
+
+
+def test_failing_upstream_goes_offline_right_away_and_its_breaker_opens():
+    async def scenario():
+        down = Upstream("down", fail=True)
+        provider = HedgedProvider([down], offline=OfflineProvider(), offline_after=30,
+                                  breaker_factory=lambda: CircuitBreaker(failures=2, reset_after=60))
+        for _ in range(3):
+            got = [q async for q in provider.stream_questions("topic", "Space", 2, room="ROOM")]
+            assert len(got) == 2
+        return down, provider
+
+    down, provider = asyncio.run(scenario())
+    assert down.calls == 2  # the third game skipped it
+    assert provider.breakers["down"].state == "open"
+
+
+def test_mid_stream_failure_finishes_the_set_from_the_next_provider():
+    async def scenario():
+        flaky, backup = Upstream("flaky", fail_after=2), Upstream("backup")
+        provider = HedgedProvider([flaky, backup])
+        got = [q async for q in provider.stream_questions("topic", "Space", 5, room="ROOM")]
+        return [q["source"] for q in got], backup
+
+    sources, backup = asyncio.run(scenario())
+    assert sources == ["flaky", "flaky", "backup", "backup", "backup"]
+
+
+def test_background_requests_never_hedge_or_go_offline():
+    async def scenario():
+        down = Upstream("down", fail=True)
+        offline = OfflineProvider()
+        provider = HedgedProvider([down], offline=offline, offline_after=0)
+        with pytest.raises(RuntimeError):
+            await provider.request_questions("topic", "Space", 2)
+        return offline
+
+    assert asyncio.run(scenario()).calls == 0
+
+
+def test_offline_provider_uses_the_bank_then_on_topic_dataset_questions(tmp_path):
+    async def scenario():
+        bank = QuestionBank(OfflineProvider(), db_path=str(tmp_path / "bank.sqlite3"))
+        banked = await bank.get_questions("topic", "Space", 2)
+
+        dataset = [
+            {"question": "Which planet is red?", "options": ["Mars", "Venus"], "correct_index": 0,
+             "explanation": "", "tags": ["space", "planets"]},
+            {"question": "Who painted the Mona Lisa?", "options": ["Leonardo", "Raphael"], "correct_index": 0,
+             "explanation": "", "tags": ["art"]},
+        ]
+        offline = OfflineProvider(bank=bank, dataset=dataset)
+        got = await offline.request_questions("topic", "space", 4)
+
+        # Offline questions are stand-ins: the bank doesn't file them under the topic
+        await bank._store(bank_key("topic", "Space", 2), got, 2)
+        cached = await bank.cached_questions("topic", "Space", 10)
+        await bank.close()
+        return banked, got, cached
+
+    banked, got, cached = asyncio.run(scenario())
+    assert {q["question"] for q in got[:2]} == {q["question"] for q in banked}
+    assert [q["question"] for q in got[2:]] == ["Which planet is red?", "Who painted the Mona Lisa?"]
+    assert got[2]["offline"] and "tags" not in got[2]
+    assert len(cached) == 2
@@ -0,0 +1,159 @@
+import asyncio
+import sqlite3
+import threading
+
+from backend.dedupe import NearDuplicateIndex
+from backend.providers import OfflineProvider
+from backend.question_bank import QuestionBank, bank_key
+
+
+class CountingProvider:
+    """Stand-in for GeminiService: numbered questions, counts upstream calls"""
+
+    def __init__(self):
+        self.calls = 0
+        self.fake = OfflineProvider()  # distinct questions, so dedupe keeps them all
+
+    async def request_questions(self, mode, input_text, count=10, room=None):
+        self.calls += 1
+        start = (self.calls - 1) * count
+        return [self.fake.make_question(mode, input_text, i) for i in range(start, start + count)]
+
+    async def stream_questions(self, mode, input_text, count=10, room=None):
+        for q in await self.request_questions(mode, input_text, count):
+            yield q
+
+    def error_questions(self, input_text, error):
+        return [{"question": "failed", "options": ["Ok"], "correct_index": 0, "explanation": str(error)}]
+
+    def shuffle_answers(self, questions):
+        return [dict(q) for q in questions]
+
+
+def test_topic_key_is_normalized():
+    assert bank_key("topic", "  Sejarah   MAKASSAR ", 10) == bank_key("topic", "sejarah makassar", 10)
+
+
+def test_hit_serves_from_cache_and_tops_up_in_background(tmp_path):
+    async def scenario():
+        provider = CountingProvider()
+        bank = QuestionBank(provider, db_path=str(tmp_path / "bank.sqlite3"), pool_factor=2)
+
+        first = await bank.get_questions("topic", "Space", 5)
+        assert provider.calls == 1 and len(first) == 5
+
+        second = await bank.get_questions("topic", "space ", 5)
+        assert len(second) == 5
+        # Pool (5) is below count * pool_factor, so a refill was scheduled
+        await asyncio.sleep(0)
+        await asyncio.gather(*bank._tasks)
+        assert provider.calls == 2
+
+        third = await bank.get_questions("topic", "Space", 5)
+        # Least-served first: the freshly added questions come out next
+        assert {q["question"] for q in third}.isdisjoint({q["question"] for q in second})
+
+    asyncio.run(scenario())
+
+
+def test_bank_survives_restart(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "bank.sqlite3")
+        provider = CountingProvider()
+        await QuestionBank(provider, db_path=path).get_questions("topic", "Cats", 3)
+
+        reopened = QuestionBank(provider, db_path=path, pool_factor=1)
+        served = await reopened.get_questions("topic", "Cats", 3)
+        assert provider.calls == 1
+        assert len({q["question"] for q in served}) == 3
+
+    asyncio.run(scenario())
+
+
+def test_stream_miss_yields_progressively_and_banks_result(tmp_path):
+    async def scenario():
+        provider = CountingProvider()
+        bank = QuestionBank(provider, db_path=str(tmp_path / "bank.sqlite3"), pool_factor=1)
+
+        streamed = [q async for q in bank.stream_questions("topic", "Rivers", 4)]
+        assert len(streamed) == 4 and provider.calls == 1
+
+        cached = [q async for q in bank.stream_questions("topic", "rivers", 4)]
+        assert provider.calls == 1
+        assert {q["question"] for q in cached} == {q["question"] for q in streamed}
+
+    asyncio.run(scenario())
+
+
+class ScriptedProvider(CountingProvider):
+    """Streams the given batches in order and records how many questions each call asked for"""
+
+    def __init__(self, batches):
+        super().__init__()
+        self.batches = list(batches)
+        self.asked = []
+
+    async def stream_questions(self, mode, input_text, count=10, room=None):
+        self.asked.append(count)
+        for q in self.batches.pop(0):
+            yield q
+
+
+def test_stream_drops_near_duplicates_and_refills_only_the_missing(tmp_path):
+    async def scenario():
+        fake = OfflineProvider()
+        a, b, c, d, e = (fake.make_question("topic", "Space", i) for i in range(5))
+        reworded_a = dict(a, question=a["question"].replace("which", "what"))
+        history = NearDuplicateIndex()
+        history.add_question(b)  # played in the room's previous game
+
+        provider = ScriptedProvider([[a, reworded_a, b, c], [d, e]])
+        bank = QuestionBank(provider, db_path=str(tmp_path / "bank.sqlite3"), pool_factor=1)
+        streamed = [q async for q in bank.stream_questions("topic", "Space", 4, seen=history)]
+
+        assert [q["question"] for q in streamed] == [x["question"] for x in (a, c, d, e)]
+        assert provider.asked == [4, 2]
+
+    asyncio.run(scenario())
+
+
+def test_stream_repeats_history_rather_than_running_short(tmp_path):
+    async def scenario():
+        provider = OfflineProvider()  # deterministic: every call returns the same questions
+        bank = QuestionBank(provider, db_path=str(tmp_path / "bank.sqlite3"), pool_factor=1)
+        history = NearDuplicateIndex()
+        for q in [q async for q in bank.stream_questions("topic", "Cats", 3, seen=history)]:
+            history.add_question(q)
+
+        again = [q async for q in bank.stream_questions("topic", "Cats", 3, seen=history)]
+        assert len(again) == 3
+        # Bank pool is all history, so: first game + one try + DEDUPE_MAX_REFILLS (2)
+        assert provider.calls == 1 + 1 + 2
+
+    asyncio.run(scenario())
+
+
+def test_sqlite_runs_off_the_loop_and_served_counts_are_batched(tmp_path):
+    async def scenario():
+        path = str(tmp_path / "bank.sqlite3")
+        bank = QuestionBank(CountingProvider(), db_path=path, pool_factor=1)
+        writes = []
+        write_served = bank._write_served
+
+        def recording(pending):
+            writes.append(threading.current_thread())
+            write_served(pending)
+
+        bank._write_served = recording
+        for _ in range(4):
+            await bank.get_questions("topic", "Cats", 3)
+        # Served in memory right away, on disk in one batch later (on close at the latest)
+        assert sum(bank._served_pending.values()) == 12 and not writes
+        await bank.close()
+        assert len(writes) == 1 and writes[0] is not threading.main_thread()
+
+        db = sqlite3.connect(path)
+        assert db.execute("SELECT SUM(served) FROM questions").fetchone()[0] == 12
+        db.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("pydantic")
+
+from backend.game_engine import GameLobby
+from backend.questions import PreparedQuestion, QuestionError, prepare_question
+
+
+def raw(**overrides):
+    q = {"question": " Capital of France? ", "options": ["Paris", "Lyon", 1789], "correct_index": "0",
+         "explanation": "It is."}
+    q.update(overrides)
+    return q
+
+
+def test_prepare_normalizes_and_prebuilds_payloads():
+    q = prepare_question(raw())
+    assert q.options == ("Paris", "Lyon", "1789") and q.correct_index == 0
+    assert q.public == {"question": "Capital of France?", "options": ["Paris", "Lyon", "1789"]}
+    assert "correct_index" not in q.public and "explanation" not in q.public
+    assert q.reveal == {"correct_index": 0, "explanation": "It is."}
+    assert q.full == {**q.public, **q.reveal}
+    assert prepare_question(q) is q
+
+    with pytest.raises(AttributeError):
+        q.correct_index = 2
+    data = q.to_dict()
+    data["options"].append("Nice")
+    assert q.public["options"] == ["Paris", "Lyon", "1789"]
+
+
+@pytest.mark.parametrize("bad", [
+    {"correct_index": None},
+    {"correct_index": 3},
+    {"correct_index": True},
+    {"options": ["only one"]},
+    {"options": ["a", "a"]},
+    {"options": ["a", {"b": 1}]},
+    {"question": ""},
+])
+def test_malformed_questions_are_rejected_at_ingest(bad):
+    with pytest.raises(QuestionError):
+        prepare_question(raw(**bad))
+
+    lobby = GameLobby("ABCD")
+    with pytest.raises(QuestionError):
+        lobby.append_question(raw(**bad))
+    assert lobby.questions == [] and len(lobby.history) == 0
+
+
+def test_lobby_stores_prepared_questions_and_snapshots_plain_dicts():
+    lobby = GameLobby("ABCD")
+    lobby.append_question(raw())
+    assert isinstance(lobby.questions[0], PreparedQuestion)
+    snapshot = lobby.to_snapshot()
+    assert snapshot["questions"] == [lobby.questions[0].to_dict()]
+    again = GameLobby.from_snapshot("ABCD", snapshot)
+    assert again.questions[0].full == lobby.questions[0].full
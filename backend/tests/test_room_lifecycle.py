@@ -0,0 +1,74 @@
+import asyncio
+import random
+
+import pytest
+
+from backend.room_lifecycle import (
+    RoomCodeAllocator, RoomLimitError, RoomReaper, code_to_index, index_to_code
+)
+
+
+def test_code_round_trip():
+    for index in (0, 1, 25, 26, 456975):
+        assert code_to_index(index_to_code(index)) == index
+    assert index_to_code(0) == "AAAA"
+
+
+def test_allocator_never_repeats_and_recycles():
+    allocator = RoomCodeAllocator(space=26 * 26, rng=random.Random(7))
+    codes = [allocator.allocate() for _ in range(26 * 26)]
+    assert len(set(codes)) == len(codes)
+
+    with pytest.raises(RoomLimitError):
+        allocator.allocate()
+
+    allocator.release(codes[3])
+    assert allocator.allocate() == codes[3]
+
+
+class FakeRoom:
+    def __init__(self, last_activity, connected, state="WAITING"):
+        self.last_activity = last_activity
+        self.connected = connected
+        self.state = state
+
+    def has_connected_players(self):
+        return self.connected
+
+
+class FakeManager:
+    def __init__(self, rooms):
+        self.active_games = rooms
+
+
+def test_reaper_evicts_only_expired_rooms():
+    rooms = {
+        "LIVE": FakeRoom(last_activity=990, connected=True),
+        "EMPT": FakeRoom(last_activity=900, connected=False),
+        "DONE": FakeRoom(last_activity=700, connected=True, state="FINISHED"),
+        "IDLE": FakeRoom(last_activity=0, connected=True),
+    }
+    manager = FakeManager(rooms)
+    evicted = []
+
+    async def on_evict(code):
+        evicted.append(code)
+        manager.active_games.pop(code)
+
+    reaper = RoomReaper(manager, on_evict, empty_ttl=60, finished_ttl=200, idle_ttl=900)
+    asyncio.run(reaper.sweep(now=1000))
+    assert sorted(evicted) == ["DONE", "EMPT", "IDLE"]
+    assert list(manager.active_games) == ["LIVE"]
+
+
+def test_reserved_codes_are_skipped_by_the_fresh_walk():
+    allocator = RoomCodeAllocator(space=26, rng=random.Random(1))
+    preview = RoomCodeAllocator(space=26, rng=random.Random(1))
+    restored = [preview.allocate() for _ in range(3)]
+    for code in restored:
+        allocator.reserve(code)
+
+    fresh = [allocator.allocate() for _ in range(23)]
+    assert not set(fresh) & set(restored)
+    with pytest.raises(RoomLimitError):
+        allocator.allocate()
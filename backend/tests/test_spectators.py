@@ -0,0 +1,123 @@
+import json
+import asyncio
+import logging
+
+from backend.cluster import ClusterNode
+from backend.cluster_bus import LocalHub
+from backend.spectators import SpectatorHub, SpectatorLimitError
+
+
+class ViewerSocket:
+    def __init__(self, delay: float = 0):
+        self.delay = delay
+        self.frames = []
+        self.closed_with = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, frame):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.frames.append(frame)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def test_one_shared_frame_per_tick_and_slow_viewers_skip():
+    async def scenario():
+        version = {"n": 0}
+        hub = SpectatorHub(lambda room: {"room": room, "v": version["n"]}, tick=0.01, batch=100,
+                           max_spectators=1001)
+        sockets = [ViewerSocket() for _ in range(1000)]
+        for ws in sockets:
+            await hub.attach(ws, "ABCD")
+        slow = ViewerSocket(delay=0.2)
+        await hub.attach(slow, "ABCD")
+        try:
+            await hub.attach(ViewerSocket(), "ABCD")
+            assert False, "limit not enforced"
+        except SpectatorLimitError:
+            pass
+
+        # Nobody watches WXYZ: marking it costs nothing and renders nothing
+        hub.mark("WXYZ")
+        for n in range(1, 51):
+            version["n"] = n
+            hub.mark("ABCD")
+        await asyncio.sleep(0.05)
+
+        # Burst of changes -> one render, encoded once, the very same string for everyone
+        assert all(len(ws.frames) == 1 for ws in sockets)
+        assert all(ws.frames[0] is sockets[0].frames[0] for ws in sockets)
+        assert json.loads(sockets[0].frames[0]) == {"room": "ABCD", "v": 50}
+
+        for n in (51, 52, 53):
+            version["n"] = n
+            hub.mark("ABCD")
+            await asyncio.sleep(0.03)
+        await asyncio.sleep(0.4)
+        # The slow viewer got the first frame and then only the newest one
+        assert [json.loads(f)["v"] for f in slow.frames] == [50, 53]
+
+        await hub.close_room("ABCD")
+        assert slow.closed_with == 4001 and hub.count == 0 and not hub.rooms
+
+    asyncio.run(scenario())
+
+
+def test_viewers_on_other_workers_get_the_owners_frames():
+    async def scenario():
+        bus = LocalHub(2)
+        owner_node, edge_node = ClusterNode(0, 2, bus.bus(0)), ClusterNode(1, 2, bus.bus(1))
+        renders = []
+
+        def render(room):
+            renders.append(room)
+            return {"room": room, "n": len(renders)}
+
+        owner = SpectatorHub(render, node=owner_node, tick=0.01)
+        edge = SpectatorHub(lambda room: None, node=edge_node, tick=0.01)
+        await owner_node.start(None)
+        await edge_node.start(None)
+        room = next(c for c in ("AAAA", "AAAB", "AAAC") if owner_node.owner_of(c) == 0)
+
+        viewers = [ViewerSocket() for _ in range(20)]
+        for ws in viewers:
+            await edge.attach(ws, room)
+        await asyncio.sleep(0.05)
+        # One "watch" from the edge worker, one render on the owner, 20 local deliveries
+        assert renders == [room]
+        assert all(json.loads(f) == {"room": room, "n": 1} for ws in viewers for f in ws.frames)
+
+        owner.mark(room)
+        await asyncio.sleep(0.05)
+        assert all(len(ws.frames) == 2 for ws in viewers)
+
+        await owner.close_room(room)
+        await asyncio.sleep(0.02)
+        assert all(ws.closed_with == 4001 for ws in viewers)
+        assert edge.count == 0 and not owner._watchers
+
+    asyncio.run(scenario())
+
+
+class GoneSocket(ViewerSocket):
+    async def send_text(self, frame):
+        raise ConnectionError("viewer left")
+
+
+def test_dropped_viewers_are_logged_at_debug_not_printed(caplog, capsys):
+    async def scenario():
+        hub = SpectatorHub(lambda room: {"room": room}, tick=0.01)
+        for _ in range(20):
+            await hub.attach(GoneSocket(), "ABCD")
+        hub.mark("ABCD")
+        await asyncio.sleep(0.05)
+        assert hub.count == 0
+
+    with caplog.at_level(logging.DEBUG, logger="backend.spectators"):
+        asyncio.run(scenario())
+    assert "Spectator writer" not in capsys.readouterr().out
+    assert [r.levelno for r in caplog.records if r.name == "backend.spectators"] == [logging.DEBUG] * 20
@@ -0,0 +1,85 @@
+import random
+import asyncio
+
+from backend.timer_wheel import TimerWheel
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_timers_fire_on_their_tick_across_all_levels():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=1.0, slots=8, levels=3, clock=clock)
+    rng = random.Random(5)
+    fired = []
+    # Up to 8**3 ticks covers every level, past it exercises the parked top-level path
+    delays = [rng.randrange(1, 700) for _ in range(500)]
+    for i, delay in enumerate(delays):
+        wheel.call_later(delay, lambda i=i: fired.append((i, wheel._tick)))
+    assert len(wheel) == 500
+
+    clock.now = 800
+    assert wheel.advance() == 500
+    assert sorted(fired) == [(i, d) for i, d in enumerate(delays)]
+    assert len(wheel) == 0
+
+
+def test_cancel_is_immediate_even_from_another_callback():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=1.0, slots=8, levels=2, clock=clock)
+    fired = []
+    late = wheel.call_later(5, fired.append, "late")
+    late.cancel()
+    late.cancel()
+
+    # Two timers in the same bucket that cancel each other: whichever runs first wins
+    handles = {}
+
+    def first_wins(name, other):
+        fired.append(name)
+        handles[other].cancel()
+
+    handles["a"] = wheel.call_later(3, first_wins, "a", "b")
+    handles["b"] = wheel.call_later(3, first_wins, "b", "a")
+    assert len(wheel) == 2
+
+    clock.now = 10
+    assert wheel.advance() == 1
+    assert fired in (["a"], ["b"])
+    assert len(wheel) == 0
+
+
+def test_never_fires_early_between_ticks():
+    clock = FakeClock()
+    wheel = TimerWheel(resolution=1.0, slots=8, levels=2, clock=clock)
+    fired = []
+    clock.now = 0.9
+    wheel.call_later(1.0, fired.append, "x")  # due at 1.9 -> tick 2
+    clock.now = 1.5
+    wheel.advance()
+    assert fired == []
+    clock.now = 2.0
+    wheel.advance()
+    assert fired == ["x"]
+
+
+def test_driver_task_runs_only_while_timers_exist():
+    async def scenario():
+        wheel = TimerWheel(resolution=0.01)
+        done = asyncio.Event()
+        wheel.call_later(0.03, done.set)
+        await asyncio.wait_for(done.wait(), 1)
+        await asyncio.sleep(0.02)
+        assert wheel._task.done()
+
+        handle = wheel.call_later(0.02, done.clear)
+        handle.cancel()
+        await asyncio.sleep(0.05)
+        assert done.is_set() and wheel._task.done()
+
+    asyncio.run(scenario())
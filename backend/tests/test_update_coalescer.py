@@ -0,0 +1,41 @@
+import asyncio
+
+from backend.update_coalescer import UpdateCoalescer
+
+
+def test_burst_of_requests_flushes_once_per_tick():
+    async def scenario():
+        flushes = []
+
+        async def flush(room):
+            flushes.append(room)
+
+        coalescer = UpdateCoalescer(flush, tick=0.02)
+        for _ in range(200):
+            coalescer.request("ABCD")
+        coalescer.request("WXYZ")
+        await asyncio.sleep(0.05)
+        assert sorted(flushes) == ["ABCD", "WXYZ"]
+
+        # A new change after the flush gets its own tick
+        coalescer.request("ABCD")
+        await asyncio.sleep(0.05)
+        assert flushes.count("ABCD") == 2
+
+    asyncio.run(scenario())
+
+
+def test_flush_now_skips_the_wait_and_replaces_the_pending_tick():
+    async def scenario():
+        flushes = []
+
+        async def flush(room):
+            flushes.append(room)
+
+        coalescer = UpdateCoalescer(flush, tick=10)
+        coalescer.request("ABCD")
+        await coalescer.flush_now("ABCD")
+        assert flushes == ["ABCD"]
+        assert coalescer.pending_rooms == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+from typing import Any, Callable, List, Optional, Set
+
+# Granularity of every deadline in the process (default 100 ms)
+TIMER_RESOLUTION = float(os.getenv("TIMER_RESOLUTION_MS", "100")) / 1000
+
+
+class TimerHandle:
+    __slots__ = ("wheel", "expires", "callback", "args", "bucket", "cancelled")
+
+    def __init__(self, wheel: "TimerWheel", expires: int, callback: Callable[..., Any], args: tuple):
+        self.wheel = wheel
+        self.expires = expires  # in ticks
+        self.callback = callback
+        self.args = args
+        self.bucket: Optional[Set["TimerHandle"]] = None
+        self.cancelled = False
+
+    def cancel(self):
+        """O(1); safe to call twice or after the timer fired"""
+        self.cancelled = True
+        if self.bucket is not None:
+            self.bucket.discard(self)
+            self.bucket = None
+            self.wheel._count -= 1
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel (Varghese & Lauck): `levels` wheels of `slots` buckets,
+    level L bucket = slots**L ticks. Scheduling and cancelling are O(1); each tick
+    only touches one bucket (plus a cascade every `slots` ticks), however many
+    rooms have a deadline. One asyncio task drives it, and only while timers exist.
+    Callbacks are plain functions run on the event loop; spawn a task for async work.
+    """
+
+    def __init__(self, resolution: float = TIMER_RESOLUTION, slots: int = 64, levels: int = 4,
+                 clock: Callable[[], float] = time.monotonic):
+        self.resolution = resolution
+        self.slots = slots
+        self.levels = levels
+        self.clock = clock
+        self._origin = clock()
+        self._tick = 0
+        self._wheels: List[List[Set[TimerHandle]]] = [[set() for _ in range(slots)] for _ in range(levels)]
+        self._count = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _now_tick(self) -> int:
+        return int((self.clock() - self._origin) / self.resolution)
+
+    def call_later(self, delay: float, callback: Callable[..., Any], *args) -> TimerHandle:
+        elapsed = self.clock() - self._origin
+        if self._count == 0:
+            self._tick = max(self._tick, int(elapsed / self.resolution))  # idle wheel: skip the empty ticks
+        # Round up to the next tick boundary: never fire early
+        expires = max(int(-(-(elapsed + delay) // self.resolution)), self._tick + 1)
+        handle = TimerHandle(self, expires, callback, args)
+        self._insert(handle)
+        self._count += 1
+        self._ensure_running()
+        return handle
+
+    def _insert(self, handle: TimerHandle):
+        delta = max(handle.expires - self._tick, 0)
+        span = self.slots
+        for level in range(self.levels):
+            if delta < span or level == self.levels - 1:
+                # Past the top level's range: park it in the top level, it gets re-cascaded
+                expires = min(handle.expires, self._tick + span - 1)
+                index = (expires // (span // self.slots)) % self.slots
+                bucket = self._wheels[level][index]
+                bucket.add(handle)
+                handle.bucket = bucket
+                return
+            span *= self.slots
+
+    def advance(self, now_tick: Optional[int] = None) -> int:
+        """Runs every tick up to now; returns how many timers fired"""
+        target = self._now_tick() if now_tick is None else now_tick
+        fired = 0
+        while self._tick < target:
+            self._tick += 1
+            # Cascade: on level boundaries pull the next bucket of each higher level down
+            span = 1
+            for level in range(1, self.levels):
+                span *= self.slots
+                if self._tick % span:
+                    break
+                index = (self._tick // span) % self.slots
+                bucket = self._wheels[level][index]
+                self._wheels[level][index] = set()
+                for handle in bucket:
+                    self._insert(handle)
+            bucket = self._wheels[0][self._tick % self.slots]
+            self._wheels[0][self._tick % self.slots] = set()
+            for handle in list(bucket):
+                if handle.bucket is not bucket:
+                    continue  # cancelled by an earlier callback in this batch
+                if handle.expires > self._tick:
+                    self._insert(handle)  # parked with a clamped slot; not due yet
+                    continue
+                handle.bucket = None
+                self._count -= 1
+                fired += 1
+                try:
+                    handle.callback(*handle.args)
+                except Exception as e:
+                    print(f"ERROR in timer callback {handle.callback.__name__}: {e!r}")
+        return fired
+
+    # --- Driver ---
+    def _ensure_running(self):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return  # no loop (tests drive advance() by hand)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._count:
+            next_tick = self._tick + 1
+            delay = self._origin + next_tick * self.resolution - self.clock()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.advance()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
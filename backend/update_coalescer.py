@@ -0,0 +1,54 @@
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict
+
+# How often a room's roster/answer-progress changes are flushed (default 100 ms)
+PLAYER_UPDATE_TICK = float(os.getenv("PLAYER_UPDATE_TICK_MS", "100")) / 1000
+
+
+class UpdateCoalescer:
+    """
+    Batches a room's small updates into at most one flush per tick.
+    request() is cheap and can be called on every answer; the flush callback
+    runs once, `tick` seconds after the first request since the last flush.
+    flush_now() is for state transitions that must not wait for the tick.
+    """
+
+    def __init__(self, flush: Callable[[str], Awaitable[None]], tick: float = PLAYER_UPDATE_TICK):
+        self.flush = flush
+        self.tick = tick
+        self._pending: Dict[str, asyncio.Task] = {}
+
+    def request(self, room_code: str):
+        if room_code in self._pending:
+            return
+        if self.tick <= 0:
+            # Coalescing disabled: still flush off the caller's stack
+            self._pending[room_code] = asyncio.create_task(self._flush(room_code))
+        else:
+            self._pending[room_code] = asyncio.create_task(self._delayed_flush(room_code))
+
+    async def flush_now(self, room_code: str):
+        self.cancel(room_code)
+        await self.flush(room_code)
+
+    def cancel(self, room_code: str):
+        task = self._pending.pop(room_code, None)
+        if task is not None and task is not asyncio.current_task():
+            task.cancel()
+
+    @property
+    def pending_rooms(self) -> int:
+        return len(self._pending)
+
+    async def _delayed_flush(self, room_code: str):
+        await asyncio.sleep(self.tick)
+        await self._flush(room_code)
+
+    async def _flush(self, room_code: str):
+        # Drop our slot first so changes made during the flush schedule a new tick
+        self._pending.pop(room_code, None)
+        try:
+            await self.flush(room_code)
+        except Exception as e:
+            print(f"ERROR flushing updates for {room_code}: {e}")
@@ -1,8 +1,12 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { Trophy, Users, AlertCircle, CheckCircle, XCircle, ArrowRight, WifiOff, Crown, RefreshCw, Copy } from 'lucide-react';
+import { SUBPROTOCOLS, decodeFrame } from './wireCodec';
 
 const API_URL = "https://lady-unexcogitative-supremely.ngrok-free.dev";
 const WS_URL = API_URL.replace(/^http/, 'ws') + "/ws";
+// Close codes that mean "don't come back": room not found, room closed, kicked as too slow
+const FINAL_CLOSE_CODES = [4000, 4001, 1008];
+const MAX_RECONNECT_ATTEMPTS = 6;
 
 export default function TriviaGame({ onBackToMenu }) {
   useEffect(() => {
@@ -18,10 +22,16 @@ export default function TriviaGame({ onBackToMenu }) {
   const [gameState, setGameState] = useState('WAITING'); 
   
   const [copied, setCopied] = useState(false);
+  const [sourceMode, setSourceMode] = useState('topic'); // 'topic' or 'document'
+  const [uploading, setUploading] = useState(false);
 
   const [currentQuestion, setCurrentQuestion] = useState(null);
   const [qIndex, setQIndex] = useState(0);
   const [totalQ, setTotalQ] = useState(0);
+  const [generationProgress, setGenerationProgress] = useState(null);
+  const [answerProgress, setAnswerProgress] = useState(null);
+  const [timeLeft, setTimeLeft] = useState(null);
+  const deadlineRef = useRef(null);
   
   const [hasSubmitted, setHasSubmitted] = useState(false);
   const [revealResult, setRevealResult] = useState(null); 
@@ -30,7 +40,30 @@ export default function TriviaGame({ onBackToMenu }) {
   const [submittedAnswer, setSubmittedAnswer] = useState(null);
   const submittedAnswerRef = useRef(null);
 
+  // Round countdown: the server sends time_left (relative), so our clock's offset doesn't matter
+  useEffect(() => {
+    if (timeLeft === null) return;
+    const timer = setInterval(() => {
+      if (deadlineRef.current === null) return;
+      setTimeLeft(Math.max(0, Math.ceil((deadlineRef.current - Date.now()) / 1000)));
+    }, 250);
+    return () => clearInterval(timer);
+  }, [timeLeft === null]);
+
+  const startCountdown = (secondsLeft) => {
+    if (secondsLeft === undefined || secondsLeft === null) {
+      deadlineRef.current = null;
+      setTimeLeft(null);
+      return;
+    }
+    deadlineRef.current = Date.now() + secondsLeft * 1000;
+    setTimeLeft(Math.ceil(secondsLeft));
+  };
+
   const socketRef = useRef(null);
+  const rosterVersionRef = useRef(null);
+  const resyncPendingRef = useRef(false);
+  const reconnectRef = useRef({ attempts: 0, timer: null, leaving: false });
 
   const createRoom = async () => {
     if (!playerName) return setError("Please enter your name");
@@ -58,37 +91,75 @@ export default function TriviaGame({ onBackToMenu }) {
   };
 
   const connectToGame = (code, name) => {
-    const ws = new WebSocket(`${WS_URL}/${code}/${name}`);
+    // Compact binary frames if the server supports them, JSON otherwise
+    const ws = new WebSocket(`${WS_URL}/${code}/${name}`, SUBPROTOCOLS);
+    ws.binaryType = 'arraybuffer';
     
     ws.onopen = () => {
       console.log("Connected to game server");
+      reconnectRef.current.attempts = 0;
       setView('lobby');
       setError('');
     };
 
     ws.onmessage = (event) => {
-      const data = JSON.parse(event.data);
+      const data = decodeFrame(event.data);
       handleServerMessage(data);
     };
 
-    ws.onclose = () => {
+    ws.onclose = (event) => {
+      if (socketRef.current !== ws) return;
+      // Server restart or network blip: rejoin under the same name and the server restores our seat
+      const reconnect = reconnectRef.current;
+      if (!reconnect.leaving && !FINAL_CLOSE_CODES.includes(event.code) && reconnect.attempts < MAX_RECONNECT_ATTEMPTS) {
+        reconnect.attempts += 1;
+        setError("Connection lost, reconnecting...");
+        reconnect.timer = setTimeout(() => connectToGame(code, name), Math.min(500 * 2 ** reconnect.attempts, 8000));
+        return;
+      }
       setError("Disconnected from server");
       setView('login');
     };
 
+    reconnectRef.current.leaving = false;
     socketRef.current = ws;
   };
 
   const handleServerMessage = (data) => {
     switch (data.type) {
       case 'PLAYER_UPDATE':
+        rosterVersionRef.current = data.version;
+        resyncPendingRef.current = false;
         setPlayers(data.players);
         updateMyStatus(data.players);
         break;
 
+      case 'PLAYER_DELTA':
+        // Deltas only apply on top of the version they were built from
+        if (rosterVersionRef.current === null || data.base !== rosterVersionRef.current) {
+          requestResync();
+          break;
+        }
+        rosterVersionRef.current = data.version;
+        setAnswerProgress({ answered: data.answered, connected: data.connected });
+        setPlayers(prev => {
+          const changed = new Map(data.players.map(p => [p.id, p]));
+          const merged = prev
+            .filter(p => !data.removed.includes(p.id))
+            .map(p => changed.get(p.id) || p);
+          data.players.forEach(p => {
+            if (!prev.some(old => old.id === p.id)) merged.push(p);
+          });
+          updateMyStatus(merged);
+          return merged;
+        });
+        break;
+
       case 'STATUS_UPDATE':
         setGameState(data.state);
+        if (data.state === 'GENERATING') setGenerationProgress(null);
         if (data.state === 'WAITING') {
+           startCountdown(null);
            setView('lobby');
            setRevealResult(null);
            setHasSubmitted(false);
@@ -103,10 +174,17 @@ export default function TriviaGame({ onBackToMenu }) {
         setTotalQ(data.total);
         
         setHasSubmitted(false);
+        setAnswerProgress(null);
         setRevealResult(null);
         setSelectedOption(null);
         setSubmittedAnswer(null);
         submittedAnswerRef.current = null;
+        startCountdown(data.time_left);
+        break;
+
+      case 'GENERATION_PROGRESS':
+        setGenerationProgress({ ready: data.ready, total: data.total });
+        setTotalQ(data.total);
         break;
 
       case 'ANSWER_ACK':
@@ -115,8 +193,13 @@ export default function TriviaGame({ onBackToMenu }) {
 
       case 'ROUND_REVEAL':
         setGameState('REVEAL');
-        setPlayers(data.players);
-        updateMyStatus(data.players);
+        startCountdown(null);
+        // Scores arrive as a PLAYER_DELTA just before; only a reconnect catch-up carries the roster
+        if (data.players) {
+          rosterVersionRef.current = data.version;
+          setPlayers(data.players);
+          updateMyStatus(data.players);
+        }
         
         setCurrentQuestion(prev => {
             if (!prev) return prev;
@@ -127,13 +210,16 @@ export default function TriviaGame({ onBackToMenu }) {
             };
         });
         
-        setRevealResult({ correct: submittedAnswerRef.current === data.correct_index });
+        setRevealResult({
+          correct: submittedAnswerRef.current === data.correct_index,
+          timedOut: data.timed_out && submittedAnswerRef.current === null
+        });
         break;
         
       case 'GAME_OVER':
         setGameState('FINISHED');
+        startCountdown(null);
         setView('result');
-        setPlayers(data.players);
         break;
         
       default:
@@ -149,14 +235,51 @@ export default function TriviaGame({ onBackToMenu }) {
     }
   };
 
-  const startGame = (topic) => {
+  const requestResync = () => {
+    if (!socketRef.current || resyncPendingRef.current) return;
+    resyncPendingRef.current = true;
+    socketRef.current.send(JSON.stringify({
+      action: "RESYNC",
+      payload: {}
+    }));
+  };
+
+  const startGame = (topic, timeLimit) => {
     if (!socketRef.current) return;
     socketRef.current.send(JSON.stringify({
       action: "START_GAME",
-      payload: { topic: topic, mode: "topic" }
+      payload: { topic: topic, mode: "topic", time_limit: Number(timeLimit) || 0 }
     }));
   };
 
+  // Document mode: upload the text (pasted or a .txt/.md file) first, then start like a topic game
+  const startDocumentGame = async (file, text, timeLimit) => {
+    if (!socketRef.current || uploading) return;
+    const body = file || text;
+    if (!body || (typeof body === 'string' && !body.trim())) return setError("Paste some text or pick a file");
+    setUploading(true);
+    try {
+      const res = await fetch(
+        `${API_URL}/rooms/${roomCode}/document?player_id=${encodeURIComponent(playerName)}`,
+        { method: 'POST', headers: { 'Content-Type': 'text/plain; charset=utf-8' }, body }
+      );
+      if (!res.ok) {
+        const data = await res.json().catch(() => ({}));
+        return setError(data.detail || "Upload failed");
+      }
+      const doc = await res.json();
+      setError('');
+      socketRef.current.send(JSON.stringify({
+        action: "START_GAME",
+        payload: { topic: doc.title || (file && file.name) || "Document", mode: "document", time_limit: Number(timeLimit) || 0 }
+      }));
+    } catch (err) {
+      setError("Could not upload the document");
+    } finally {
+      setUploading(false);
+    }
+  };
+
   const submitAnswer = (index) => {
     if (hasSubmitted) return; 
     setSelectedOption(index);
@@ -195,6 +318,8 @@ export default function TriviaGame({ onBackToMenu }) {
   };
 
   const handleBackToMenu = () => {
+    reconnectRef.current.leaving = true;
+    clearTimeout(reconnectRef.current.timer);
     if (socketRef.current) {
       socketRef.current.close();
     }
@@ -299,14 +424,43 @@ export default function TriviaGame({ onBackToMenu }) {
              <div style={styles.loading}>
                <div style={styles.spinner}></div>
                <p>Consulting the Oracle...</p>
+               {generationProgress && (
+                 <p style={{color: '#666', fontSize: '0.9rem'}}>{generationProgress.ready} / {generationProgress.total} questions ready</p>
+               )}
              </div>
           ) : isHost ? (
             <div>
-              <p style={styles.label}>Choose a Topic:</p>
-              <form onSubmit={(e) => { e.preventDefault(); startGame(e.target.topic.value); }}>
-                <input name="topic" style={styles.input} placeholder="e.g. History of Makassar" />
-                <button type="submit" style={styles.actionBtn}>Start Game</button>
+              <div style={{display: 'flex', gap: 8, marginBottom: 10}}>
+                <button type="button" style={sourceMode === 'topic' ? styles.actionBtn : styles.secondaryBtn} onClick={() => setSourceMode('topic')}>Topic</button>
+                <button type="button" style={sourceMode === 'document' ? styles.actionBtn : styles.secondaryBtn} onClick={() => setSourceMode('document')}>Document</button>
+              </div>
+              <p style={styles.label}>{sourceMode === 'topic' ? 'Choose a Topic:' : 'Paste text or upload a .txt / .md file:'}</p>
+              <form onSubmit={(e) => {
+                e.preventDefault();
+                const form = e.target;
+                if (sourceMode === 'document') {
+                  startDocumentGame(form.docFile.files[0], form.docText.value, form.timeLimit.value);
+                } else {
+                  startGame(form.topic.value, form.timeLimit.value);
+                }
+              }}>
+                {sourceMode === 'topic' ? (
+                  <input name="topic" style={styles.input} placeholder="e.g. History of Makassar" />
+                ) : (
+                  <>
+                    <textarea name="docText" style={{...styles.input, minHeight: 120}} placeholder="Lecture notes, a manual, a chapter..." />
+                    <input name="docFile" type="file" accept=".txt,.md,text/plain,text/markdown" style={styles.input} />
+                  </>
+                )}
+                <select name="timeLimit" style={styles.input} defaultValue="0">
+                  <option value="0">No time limit</option>
+                  <option value="15">15 seconds per question</option>
+                  <option value="30">30 seconds per question</option>
+                  <option value="60">60 seconds per question</option>
+                </select>
+                <button type="submit" style={styles.actionBtn} disabled={uploading}>{uploading ? 'Uploading...' : 'Start Game'}</button>
               </form>
+              {error && <p style={styles.error}><AlertCircle size={16}/> {error}</p>}
             </div>
           ) : (
             <p style={styles.waitingText}>Waiting for host to start...</p>
@@ -327,6 +481,9 @@ export default function TriviaGame({ onBackToMenu }) {
           
           <div style={styles.gameHeader}>
             <span>Q{qIndex}/{totalQ}</span>
+            {gameState === 'PLAYING' && timeLeft !== null && (
+              <span style={{fontWeight: 'bold', color: timeLeft <= 5 ? '#dc2626' : '#667eea'}}>⏱ {timeLeft}s</span>
+            )}
             <span style={styles.scoreBadge}>Score: {myScore}</span>
           </div>
           
@@ -370,7 +527,10 @@ export default function TriviaGame({ onBackToMenu }) {
 
           <div style={{marginTop: 20, textAlign: 'center', minHeight: 60}}>
              {gameState === 'PLAYING' && hasSubmitted && (
-                 <p style={styles.waitingPulse}>Waiting for other players...</p>
+                 <p style={styles.waitingPulse}>
+                  Waiting for other players...
+                  {answerProgress && ` (${answerProgress.answered}/${answerProgress.connected} answered)`}
+                </p>
              )}
 
              {gameState === 'REVEAL' && revealResult && (
@@ -378,7 +538,7 @@ export default function TriviaGame({ onBackToMenu }) {
                    <div className={getFeedbackColor()} style={styles.feedback}>
                      {revealResult.correct ? <CheckCircle /> : <XCircle />}
                      <span style={{marginLeft: 10}}>
-                       {revealResult.correct ? "Correct!" : "Wrong!"}
+                       {revealResult.correct ? "Correct!" : revealResult.timedOut ? "Time's up!" : "Wrong!"}
                      </span>
                    </div>
                    
@@ -0,0 +1,117 @@
+// Server -> client wire format. Mirrors backend/codec.py: keep the tables in sync (append only).
+// JSON frames arrive as text; with the msgpack subprotocol they're binary and compact.
+
+export const MSGPACK_SUBPROTOCOL = 'quiz.msgpack.v1';
+export const JSON_SUBPROTOCOL = 'quiz.json.v1';
+// Offered in order of preference; the server picks msgpack only if it has it
+export const SUBPROTOCOLS = [MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL];
+
+const MESSAGE_TYPES = [
+  null, 'PLAYER_UPDATE', 'PLAYER_DELTA', 'NEW_QUESTION', 'ANSWER_ACK', 'ROUND_REVEAL',
+  'STATUS_UPDATE', 'GENERATION_PROGRESS', 'GAME_OVER', 'SPECTATOR_VIEW',
+];
+const KEYS = {
+  type: 't', version: 'v', base: 'b', players: 'p', removed: 'x',
+  answered: 'a', connected: 'c', question: 'q', options: 'o',
+  correct_index: 'k', explanation: 'e', index: 'i', total: 'n',
+  time_limit: 'tl', time_left: 'tr', timed_out: 'to', correct: 'ok',
+  state: 's', ready: 'y', room: 'rm', leaderboard: 'lb',
+};
+const ROWS = {
+  players: ['id', 'name', 'score', 'is_host', 'is_connected', 'has_answered', 'current_answer'],
+  leaderboard: ['rank', 'name', 'score'],
+};
+const LONG_KEYS = Object.fromEntries(Object.entries(KEYS).map(([key, short]) => [short, key]));
+
+const utf8 = new TextDecoder();
+
+// Minimal MessagePack decoder: everything the server sends (no ext types)
+function unpack(buffer) {
+  const bytes = new Uint8Array(buffer);
+  const view = new DataView(bytes.buffer, bytes.byteOffset, bytes.byteLength);
+  let pos = 0;
+
+  const str = (len) => {
+    const s = utf8.decode(bytes.subarray(pos, pos + len));
+    pos += len;
+    return s;
+  };
+  const array = (len) => {
+    const out = new Array(len);
+    for (let i = 0; i < len; i++) out[i] = read();
+    return out;
+  };
+  const map = (len) => {
+    const out = {};
+    for (let i = 0; i < len; i++) {
+      const key = read();
+      out[key] = read();
+    }
+    return out;
+  };
+  const u8 = () => view.getUint8(pos++);
+  const u16 = () => { const v = view.getUint16(pos); pos += 2; return v; };
+  const u32 = () => { const v = view.getUint32(pos); pos += 4; return v; };
+
+  function read() {
+    const b = u8();
+    if (b <= 0x7f) return b;
+    if (b >= 0xe0) return b - 0x100;
+    if ((b & 0xf0) === 0x80) return map(b & 0x0f);
+    if ((b & 0xf0) === 0x90) return array(b & 0x0f);
+    if ((b & 0xe0) === 0xa0) return str(b & 0x1f);
+    let v;
+    switch (b) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: v = u8(); pos += v; return bytes.slice(pos - v, pos);
+      case 0xc5: v = u16(); pos += v; return bytes.slice(pos - v, pos);
+      case 0xc6: v = u32(); pos += v; return bytes.slice(pos - v, pos);
+      case 0xca: v = view.getFloat32(pos); pos += 4; return v;
+      case 0xcb: v = view.getFloat64(pos); pos += 8; return v;
+      case 0xcc: return u8();
+      case 0xcd: return u16();
+      case 0xce: return u32();
+      case 0xcf: v = Number(view.getBigUint64(pos)); pos += 8; return v;
+      case 0xd0: v = view.getInt8(pos); pos += 1; return v;
+      case 0xd1: v = view.getInt16(pos); pos += 2; return v;
+      case 0xd2: v = view.getInt32(pos); pos += 4; return v;
+      case 0xd3: v = Number(view.getBigInt64(pos)); pos += 8; return v;
+      case 0xd9: return str(u8());
+      case 0xda: return str(u16());
+      case 0xdb: return str(u32());
+      case 0xdc: return array(u16());
+      case 0xdd: return array(u32());
+      case 0xde: return map(u16());
+      case 0xdf: return map(u32());
+      default: throw new Error(`Unsupported msgpack byte 0x${b.toString(16)}`);
+    }
+  }
+
+  return read();
+}
+
+// Compact shape -> the verbose messages the rest of the UI uses
+function expand(message) {
+  const out = {};
+  for (const [short, value] of Object.entries(message)) {
+    const key = LONG_KEYS[short] ?? short;
+    if (key === 'type' && typeof value === 'number') {
+      out.type = MESSAGE_TYPES[value];
+    } else if (ROWS[key] && Array.isArray(value)) {
+      const fields = ROWS[key];
+      out[key] = value.map((row) => Object.fromEntries(fields.map((field, i) => [field, row[i]])));
+    } else if (value && typeof value === 'object' && !Array.isArray(value)) {
+      out[key] = Object.fromEntries(Object.entries(value).map(([k, v]) => [LONG_KEYS[k] ?? k, v]));
+    } else {
+      out[key] = value;
+    }
+  }
+  return out;
+}
+
+export function decodeFrame(data) {
+  if (typeof data === 'string') return JSON.parse(data);
+  return expand(unpack(data));
+}